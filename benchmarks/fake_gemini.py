@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import asyncio
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Iterator, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geminal'))
+os.environ.setdefault('GOOGLE_API_KEY', 'benchmark')
+
+from google.generativeai import GenerativeModel, protos  # noqa: E402
+from google.generativeai.types import content_types, generation_types  # noqa: E402
+
+MARKDOWN_SAMPLE: str = """## Section
+
+Here is an explanation with **bold** text, `inline code` and a [link](https://example.com). It goes on for a
+while, the way answers usually do, before showing some code:
+
+```python
+def fibonacci(n: int) -> int:
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+```
+
+- first point of the list
+- second point, which is a bit longer than the first one
+- third point
+
+"""
+
+
+def make_markdown(size: int) -> str:
+    """
+    Build a Markdown response of about `size` bytes, made of paragraphs, lists and code blocks.
+    """
+    text: str = MARKDOWN_SAMPLE * (size // len(MARKDOWN_SAMPLE) + 1)
+    return text[:size]
+
+
+def make_response(
+        text: str,
+        prompt_token_count: int,
+        done: bool,
+        candidates_token_count: int | None = None
+) -> protos.GenerateContentResponse:
+    if candidates_token_count is None:
+        candidates_token_count = len(text) // 4 + 1
+
+    finish_reason: int = protos.Candidate.FinishReason.STOP if done else protos.Candidate.FinishReason.FINISH_REASON_UNSPECIFIED
+    return protos.GenerateContentResponse(
+        candidates=[protos.Candidate(
+            content=protos.Content(role='model', parts=[protos.Part(text=text)]),
+            finish_reason=finish_reason
+        )],
+        usage_metadata=protos.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=prompt_token_count,
+            candidates_token_count=candidates_token_count,
+            total_token_count=prompt_token_count + candidates_token_count
+        )
+    )
+
+
+class FakeGenerativeModel(GenerativeModel):
+    """
+    A stand-in for `GenerativeModel` that answers locally, with a configurable latency, response size and chunking.
+
+    `ChatSession`s started from it are the real ones, so the whole client-side path is exercised.
+    """
+
+    def __init__(
+            self,
+            model_name: str = 'gemini-pro',
+            response_size: int = 1024,
+            chunk_size: int = 256,
+            latency: float = 0.0,
+            chunk_latency: float = 0.0
+    ) -> None:
+        super().__init__(model_name=model_name)
+        self.response_size: int = response_size
+        self.chunk_size: int = chunk_size
+        self.latency: float = latency
+        self.chunk_latency: float = chunk_latency
+        self.request_count: int = 0
+
+    def __chunks(self, contents: Any) -> List[protos.GenerateContentResponse]:
+        self.request_count += 1
+        prompt_token_count: int = sum(
+            len(part.text) // 4 + 1 for content in content_types.to_contents(contents) for part in content.parts
+        )
+        text: str = make_markdown(size=self.response_size)
+
+        offsets: List[int] = list(range(0, len(text), self.chunk_size)) or [0]
+        return [
+            make_response(
+                text=text[offset:offset + self.chunk_size],
+                prompt_token_count=prompt_token_count,
+                done=index == len(offsets) - 1,
+                # like the API, every chunk reports the number of tokens generated so far.
+                candidates_token_count=(offset + self.chunk_size) // 4 + 1
+            )
+            for index, offset in enumerate(offsets)
+        ]
+
+    def generate_content(self, contents: Any, *, stream: bool = False, **kwargs) -> Any:
+        chunks: List[protos.GenerateContentResponse] = self.__chunks(contents=contents)
+        time.sleep(self.latency)
+
+        if not stream:
+            time.sleep(self.chunk_latency * (len(chunks) - 1))
+            text: str = ''.join(chunk.candidates[0].content.parts[0].text for chunk in chunks)
+            return generation_types.GenerateContentResponse.from_response(
+                make_response(text=text, prompt_token_count=chunks[0].usage_metadata.prompt_token_count, done=True)
+            )
+
+        def iterate() -> Iterator[protos.GenerateContentResponse]:
+            for index, chunk in enumerate(chunks):
+                if index != 0:
+                    time.sleep(self.chunk_latency)
+                yield chunk
+
+        return generation_types.GenerateContentResponse.from_iterator(iterate())
+
+    async def generate_content_async(self, contents: Any, *, stream: bool = False, **kwargs) -> Any:
+        chunks: List[protos.GenerateContentResponse] = self.__chunks(contents=contents)
+        await asyncio.sleep(self.latency)
+
+        if not stream:
+            await asyncio.sleep(self.chunk_latency * (len(chunks) - 1))
+            text: str = ''.join(chunk.candidates[0].content.parts[0].text for chunk in chunks)
+            return generation_types.AsyncGenerateContentResponse.from_response(
+                make_response(text=text, prompt_token_count=chunks[0].usage_metadata.prompt_token_count, done=True)
+            )
+
+        async def iterate() -> AsyncIterator[protos.GenerateContentResponse]:
+            for index, chunk in enumerate(chunks):
+                if index != 0:
+                    await asyncio.sleep(self.chunk_latency)
+                yield chunk
+
+        return await generation_types.AsyncGenerateContentResponse.from_aiterator(iterate())
+
+    def count_tokens(self, contents: Any = None, **kwargs) -> protos.CountTokensResponse:
+        total_tokens: int = sum(
+            len(part.text) // 4 + 1 for content in content_types.to_contents(contents) for part in content.parts
+        )
+        return protos.CountTokensResponse(total_tokens=total_tokens)
+
+
+def install(model: FakeGenerativeModel, history: List[Any] | None = None) -> None:
+    """
+    Make Geminal use the fake model, with a fresh chat session.
+    """
+    import components.context as context
+    import components.gemini as gemini
+
+    gemini.model = model
+    gemini.chat = model.start_chat()
+    gemini.set_chat_history(turns=history or [])
+    context.context_window = None
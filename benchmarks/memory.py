@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from typing import Dict, List
+
+# a small limit, so that the older turns are spilled early in the run.
+os.environ.setdefault('HISTORY_MEMORY_LIMIT', str(256 * 1024))
+os.environ['HOME'] = tempfile.mkdtemp(prefix='geminal-benchmark-')
+os.environ['METRICS'] = 'false'
+
+from fake_gemini import FakeGenerativeModel, install  # noqa: E402
+
+from run import quiet_console  # noqa: E402
+
+
+def get_resident_size() -> int:
+    """
+    Get the resident memory of the process, which also counts what tracemalloc does not see, e.g. the protobuf
+    messages that are allocated in C. It is 0 where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'r', encoding='utf-8') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError,):
+        return 0
+
+
+def measure_memory(turn_count: int, response_size: int, sample_count: int) -> List[Dict[str, int]]:
+    """
+    Answer `turn_count` prompts and sample the memory that is allocated by Python along the way, with tracemalloc.
+    """
+    import Geminal
+
+    install(model=FakeGenerativeModel(response_size=response_size, chunk_size=1024))
+
+    samples: List[Dict[str, int]] = []
+    sample_interval: int = max(turn_count // sample_count, 1)
+
+    tracemalloc.start()
+    # rich keeps bounded LRU caches of what it rendered, up to 16k entries, they fill over thousands of turns.
+    snapshot_filters: List[tracemalloc.Filter] = [tracemalloc.Filter(inclusive=False, filename_pattern='*/rich/*')]
+    for turn in range(1, turn_count + 1):
+        Geminal.send_prompt(user_prompt=f'Question number {turn} about some code?')
+
+        if turn % sample_interval == 0:
+            gc.collect()
+            snapshot: tracemalloc.Snapshot = tracemalloc.take_snapshot().filter_traces(filters=snapshot_filters)
+            samples.append({
+                'turn': turn,
+                'current': sum(statistic.size for statistic in snapshot.statistics(key_type='filename')),
+                'peak': tracemalloc.get_traced_memory()[1],
+                'resident': get_resident_size()
+            })
+
+    tracemalloc.stop()
+    return samples
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Check that the memory of a long session stays flat, with tracemalloc.'
+    )
+    parser.add_argument('--turns', type=int, default=1000, help='number of prompts that are answered')
+    parser.add_argument('--response-size', type=int, default=2 * 1024, help='size of the responses, in bytes')
+    parser.add_argument('--samples', type=int, default=10, help='number of memory samples')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed growth after the first quarter')
+    parser.add_argument('--output', help='write the samples as JSON to this file')
+    args: argparse.Namespace = parser.parse_args()
+
+    quiet_console()
+    # some components print to stdout directly, the results are printed to the original stdout.
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+
+    samples: List[Dict[str, int]] = measure_memory(
+        turn_count=args.turns,
+        response_size=args.response_size,
+        sample_count=args.samples
+    )
+    for sample in samples:
+        print(
+            f"turn {sample['turn']:>6}  current {sample['current'] / 1024:10.1f} KB  "
+            f"peak {sample['peak'] / 1024:10.1f} KB  resident {sample['resident'] / 1024:10.1f} KB",
+            file=sys.__stdout__
+        )
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(obj=samples, fp=file, indent=2)
+
+    # the history fills the memory limit during the first quarter of the run, the memory must be flat after that.
+    reference: Dict[str, int] = samples[max(len(samples) // 4 - 1, 0)]
+    growth: float = samples[-1]['current'] / max(reference['current'], 1) - 1
+    print(f"growth after turn {reference['turn']}: {growth:.1%}", file=sys.__stdout__)
+    if growth > args.threshold:
+        print(f"REGRESSION: the memory grew by {growth:.1%} after turn {reference['turn']}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from fake_gemini import FakeGenerativeModel, install, make_markdown
+
+import startup
+
+RESPONSE_SIZES: Dict[str, int] = {'1KB': 1024, '100KB': 100 * 1024, '1MB': 1024 * 1024}
+TURN_COUNTS: List[int] = [10, 100, 1000]
+
+
+def quiet_console() -> None:
+    """
+    Render to /dev/null, but as if it was a terminal, so that the live display is exercised.
+    """
+    from components.console import console
+
+    console.file = open(os.devnull, 'w', encoding='utf-8')
+    console._force_terminal = True  # there is no public setter, Console only takes it in its constructor.
+    console.width = 120
+    console.height = 40
+
+
+def make_history(turn_count: int, response_size: int) -> List[Dict[str, Any]]:
+    history: List[Dict[str, Any]] = []
+    for index in range(turn_count // 2):
+        history.append({'role': 'user', 'parts': [{'text': f'Question number {index} about some code?'}]})
+        history.append({'role': 'model', 'parts': [{'text': make_markdown(size=response_size)}]})
+
+    return history
+
+
+def measure(function: Callable[[], Any], repeat: int, setup: Callable[[], Any] | None = None) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start_time: float = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start_time) * 1000)
+
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples), 'repeat': repeat}
+
+
+def bench_send_prompt(repeat: int, latency: float, chunk_size: int) -> Dict[str, Dict]:
+    import Geminal
+    from components.config import conf
+
+    results: Dict[str, Dict] = {}
+    for stream in (True, False,):
+        for size_name, size in RESPONSE_SIZES.items():
+            conf['settings']['stream_response'] = stream
+            model: FakeGenerativeModel = FakeGenerativeModel(
+                response_size=size, chunk_size=chunk_size, latency=latency
+            )
+
+            results[f"send_prompt[{'stream' if stream else 'plain'},{size_name}]"] = measure(
+                function=lambda: Geminal.send_prompt(user_prompt='Explain this code.'),
+                setup=lambda: install(model=model),
+                repeat=repeat if size < RESPONSE_SIZES['1MB'] else 1
+            )
+
+    return results
+
+
+def bench_plain_prompt(repeat: int, latency: float, chunk_size: int) -> Dict[str, Dict]:
+    import Geminal
+
+    results: Dict[str, Dict] = {}
+    for output_mode in ('raw', 'json',):
+        for size_name, size in RESPONSE_SIZES.items():
+            model: FakeGenerativeModel = FakeGenerativeModel(
+                response_size=size, chunk_size=chunk_size, latency=latency
+            )
+
+            results[f"plain_prompt[{output_mode},{size_name}]"] = measure(
+                function=lambda: Geminal.send_plain_prompt(
+                    user_prompt='Explain this code.', output_mode=output_mode, paths=[]
+                ),
+                setup=lambda: install(model=model),
+                repeat=repeat
+            )
+
+    return results
+
+
+def bench_loading(repeat: int) -> Dict[str, Dict]:
+    from components.loading import Loading
+
+    def start_stop() -> None:
+        Loading.start(message='Benchmark is thinking...')
+        Loading.stop()
+
+    return {'loading[start_stop]': measure(function=start_stop, repeat=repeat)}
+
+
+def bench_conversations(repeat: int, directory: str) -> Dict[str, Dict]:
+    from google.generativeai.types import content_types
+
+    import components.action as action
+    from components.conversation import Conversation
+
+    results: Dict[str, Dict] = {}
+    for turn_count in TURN_COUNTS:
+        history: List[Any] = content_types.to_contents(make_history(turn_count=turn_count, response_size=2048))
+        path: str = os.path.join(directory, f'conversation_{turn_count}.jsonl')
+
+        def setup() -> None:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        def save() -> None:
+            Conversation.create(path=path, model_name='gemini-pro').sync(history=history)
+
+        results[f'save_conversation[{turn_count} turns]'] = measure(function=save, setup=setup, repeat=repeat)
+
+        def setup_load() -> None:
+            install(model=FakeGenerativeModel())
+            action.is_loaded = False
+            action.save_dir = directory
+
+            async def select_conversation(menu_title: str) -> str:
+                return os.path.basename(path)
+
+            action.select_conversation = select_conversation
+
+        results[f'load_conversation[{turn_count} turns]'] = measure(
+            function=lambda: asyncio.run(action.Action(prompt_count=0)._Action__load_conversation()),
+            setup=setup_load,
+            repeat=repeat
+        )
+
+    return results
+
+
+def bench_code_blocks(repeat: int, chunk_size: int) -> Dict[str, Dict]:
+    from components.code_blocks import CodeBlockIndex, highlight_code
+
+    def feed(text: str) -> None:
+        code_block_index: CodeBlockIndex = CodeBlockIndex()
+        for offset in range(0, len(text), chunk_size):
+            code_block_index.feed(chunk=text[offset:offset + chunk_size])
+
+    def preview(code_block_index: CodeBlockIndex) -> None:
+        # scrolling through the preview menu highlights every block, over and over.
+        for _ in range(3):
+            for code_block in code_block_index.blocks:
+                highlight_code(code=code_block.code, language=code_block.language)
+
+    results: Dict[str, Dict] = {}
+    for size_name, size in RESPONSE_SIZES.items():
+        text: str = make_markdown(size=size)
+        results[f'code_blocks[index:{size_name}]'] = measure(
+            function=lambda: CodeBlockIndex.from_text(text=text),
+            repeat=repeat
+        )
+        results[f'code_blocks[stream:{size_name}]'] = measure(function=lambda: feed(text=text), repeat=repeat)
+        results[f'code_blocks[preview:{size_name}]'] = measure(
+            function=lambda: preview(code_block_index=CodeBlockIndex.from_text(text=text)),
+            repeat=repeat
+        )
+
+    return results
+
+
+def make_repo(directory: str, file_count: int) -> None:
+    words: List[str] = [f'{prefix}{suffix}' for prefix in ('load', 'save', 'parse', 'render', 'send', 'cache')
+                        for suffix in ('Config', 'Prompt', 'History', 'Token', 'Stream', 'Index', 'Menu', 'Key')]
+    for index in range(file_count):
+        lines: List[str] = [
+            f'def {words[(index + line) % len(words)]}_{line}(value): return value + {index}'
+            for line in range(80)
+        ]
+        with open(os.path.join(directory, f'module_{index}.py'), 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines))
+
+
+def bench_repo_index(repeat: int, directory: str) -> Dict[str, Dict]:
+    from components.repo_index import RepoIndex
+
+    root: str = os.path.join(directory, 'repo')
+    os.makedirs(root, exist_ok=True)
+    make_repo(directory=root, file_count=1000)
+    index_path: str = os.path.join(directory, 'repo_index.npz')
+
+    results: Dict[str, Dict] = {
+        'repo_index[build:1000 files]': measure(
+            function=lambda: RepoIndex(root=root, path=index_path).refresh(), repeat=max(1, repeat // 5)
+        )
+    }
+
+    repo_index: RepoIndex = RepoIndex(root=root, path=index_path)
+    repo_index.refresh()
+    repo_index.save()
+    results['repo_index[refresh:unchanged]'] = measure(function=repo_index.refresh, repeat=repeat)
+    results['repo_index[load]'] = measure(function=RepoIndex(root=root, path=index_path).load, repeat=repeat)
+    results['repo_index[search]'] = measure(
+        function=lambda: repo_index.search(query='where is the prompt history cached', count=5), repeat=repeat
+    )
+
+    return results
+
+
+def bench_startup(repeat: int) -> Dict[str, Dict]:
+    results: Dict[str, Dict] = {}
+    for mode in startup.MODES:
+        result: Dict = startup.run_mode(name=mode, repeat=repeat)
+        results[f'startup[{mode}]'] = {
+            'median_ms': result['wall_time_ms'], 'min_ms': result['wall_time_ms'], 'repeat': repeat
+        }
+
+    return results
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Benchmark the hot paths of Geminal against an in-process fake Gemini backend.'
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs per benchmark, the median is reported')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of the fake backend, in seconds')
+    parser.add_argument('--chunk-size', type=int, default=512, help='size of the streamed chunks, in bytes')
+    parser.add_argument('--filter', default='', help='only run the benchmarks whose name contains this text')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare the results with a JSON file written by --output')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown over the baseline')
+    args: argparse.Namespace = parser.parse_args()
+
+    os.environ['HOME'] = tempfile.mkdtemp(prefix='geminal-benchmark-')
+    quiet_console()
+    # some components print to stdout directly, the results are printed to the original stdout.
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+
+    suites: Dict[str, Callable[[], Dict[str, Dict]]] = {
+        'send_prompt': lambda: bench_send_prompt(repeat=args.repeat, latency=args.latency, chunk_size=args.chunk_size),
+        'plain_prompt': lambda: bench_plain_prompt(
+            repeat=args.repeat, latency=args.latency, chunk_size=args.chunk_size
+        ),
+        'loading': lambda: bench_loading(repeat=args.repeat),
+        'conversation': lambda: bench_conversations(repeat=args.repeat, directory=os.environ['HOME']),
+        'code_blocks': lambda: bench_code_blocks(repeat=args.repeat, chunk_size=args.chunk_size),
+        'repo_index': lambda: bench_repo_index(repeat=args.repeat, directory=os.environ['HOME']),
+        'startup': lambda: bench_startup(repeat=args.repeat)
+    }
+
+    results: Dict[str, Dict] = {}
+    for suite_name, suite in suites.items():
+        if args.filter == '' or args.filter in suite_name:
+            results.update(suite())
+
+    failures: List[str] = []
+    baseline: Dict[str, Dict] = {}
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(fp=file)
+
+    for name, result in results.items():
+        line: str = f"{name:<40} {result['median_ms']:10.2f} ms"
+        if name in baseline:
+            ratio: float = result['median_ms'] / max(baseline[name]['median_ms'], 1e-6)
+            line += f"  ({ratio:.2f}x baseline)"
+            if ratio > 1 + args.threshold:
+                failures.append(f"{name}: {result['median_ms']:.2f} ms, {ratio:.2f}x the baseline")
+        print(line, file=sys.__stdout__)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(obj=results, fp=file, indent=2)
+
+    for failure in failures:
+        print(f'REGRESSION: {failure}', file=sys.stderr)
+
+    return 1 if len(failures) != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+SOURCE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geminal')
+
+# modules that must never be imported by a mode, because they are only needed to talk to Gemini or to the user.
+HEAVY_MODULES: List[str] = ['google.generativeai', 'prompt_toolkit', 'simple_term_menu']
+
+MODES: Dict[str, Dict] = {
+    'version': {
+        'code': "import sys; sys.argv = ['geminal', '-v']; import Geminal; Geminal.run()",
+        'forbidden': HEAVY_MODULES
+    },
+    'help': {
+        'code': "import sys; sys.argv = ['geminal', '-h']; import Geminal; Geminal.run()",
+        'forbidden': HEAVY_MODULES
+    },
+    'prompt': {
+        # everything that is loaded before the first prompt is sent, without touching the network.
+        'code': (
+            "import Geminal; from components.action import Action; "
+            "from components.gemini import get_chat; get_chat(); Geminal.get_key_bindings()"
+        ),
+        'forbidden': []
+    }
+}
+
+
+def measure(code: str) -> Dict:
+    """
+    Run the code in a fresh interpreter with `-X importtime` and return the wall time and the imported modules.
+    """
+    env: Dict[str, str] = dict(os.environ)
+    env.setdefault('GOOGLE_API_KEY', 'benchmark')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+    start_time: float = time.perf_counter()
+    completed: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=SOURCE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True
+    )
+    wall_time: float = time.perf_counter() - start_time
+
+    modules: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # only top-level imports are kept, their cumulative time includes the nested imports.
+        if not name.startswith('  '):
+            modules[name.strip()] = int(cumulative)
+
+    return {
+        'wall_time_ms': wall_time * 1000,
+        'import_time_ms': sum(modules.values()) / 1000,
+        'modules': modules
+    }
+
+
+def run_mode(name: str, repeat: int) -> Dict:
+    samples: List[Dict] = [measure(code=MODES[name]['code']) for _ in range(repeat)]
+    imported: List[str] = list(samples[-1]['modules'])
+
+    return {
+        'mode': name,
+        'wall_time_ms': statistics.median(sample['wall_time_ms'] for sample in samples),
+        'import_time_ms': statistics.median(sample['import_time_ms'] for sample in samples),
+        'slowest_imports': sorted(
+            samples[-1]['modules'].items(), key=lambda item: item[1], reverse=True
+        )[:5],
+        'forbidden_imports': [
+            module for module in MODES[name]['forbidden']
+            if any(imported_module == module or imported_module.startswith(f'{module}.')
+                   for imported_module in imported)
+        ]
+    }
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Measure the start-up cost of Geminal per mode with `python -X importtime`.'
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs per mode, the median is reported')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare the results with a JSON file written by --output')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown over the baseline')
+    args: argparse.Namespace = parser.parse_args()
+
+    results: List[Dict] = [run_mode(name=name, repeat=args.repeat) for name in MODES]
+
+    failures: List[str] = []
+    for result in results:
+        print(
+            f"{result['mode']:<8} wall {result['wall_time_ms']:8.1f} ms  "
+            f"import {result['import_time_ms']:8.1f} ms"
+        )
+        if len(result['forbidden_imports']) != 0:
+            failures.append(f"{result['mode']}: imports {', '.join(result['forbidden_imports'])}")
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline: Dict[str, Dict] = {result['mode']: result for result in json.load(fp=file)}
+
+        for result in results:
+            if result['mode'] not in baseline:
+                continue
+
+            limit: float = baseline[result['mode']]['import_time_ms'] * (1 + args.threshold)
+            if result['import_time_ms'] > limit:
+                failures.append(
+                    f"{result['mode']}: import time {result['import_time_ms']:.1f} ms exceeds {limit:.1f} ms"
+                )
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(obj=results, fp=file, indent=2)
+
+    for failure in failures:
+        print(f'REGRESSION: {failure}', file=sys.stderr)
+
+    return 1 if len(failures) != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
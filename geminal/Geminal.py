@@ -30,96 +30,330 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
 """
+import json
 import os
 import sys
 import time
+from threading import Event
+from typing import Dict, List, Tuple, TYPE_CHECKING
 
-from google.generativeai.types import GenerateContentResponse
-
-from components.action import Action
+from components.arguments import Arguments
+from components.commands import command_keys, is_command
 from components.version import print_version
 from components.config import conf
-from components.console import log, log_error, new_line
-from components.gemini import chat, display_name, print_welcome
+from components.console import console, log, log_error, log_info, new_line
+from components.context import format_token_count, get_context_window
+from components.gemini import (
+    append_chat_turn, display_name, get_chat_history, get_chat_turns, model_name, print_welcome, supported_models
+)
 from components.loading import Loading
+from components.metrics import RequestMetrics, print_stats, record_metrics
+from components.scheduler import RequestCancelled, iterate_cancellable, run_cancellable
 from components.usage import print_usage
-from components.utils import quit_program
+from components.utils import format_size, has_piped_input, quit_program
+from components.warmup import get_connection_warmer
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from components.context import ContextWindow
+    from components.fanout import Answer
+    from components.ingest import MapReduce
+    from google.generativeai.types import GenerateContentResponse
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.application import Application
+    from prompt_toolkit.key_binding import KeyBindings
+    from rich.panel import Panel
+
+# prompt_toolkit, simple_term_menu and the Google SDK are imported on first use only,
+# so `geminal -v` and `geminal -h` start without loading them.
+kb: 'KeyBindings | None' = None
+# the text that was typed when an action was run with its key binding, it is put back in the next prompt.
+pending_prompt_text: str = ''
+
 
-from rich.panel import Panel
-from rich.markdown import Markdown
+def get_key_bindings() -> 'KeyBindings':
+    global kb
 
-from prompt_toolkit import prompt
-from prompt_toolkit.formatted_text import HTML
-from prompt_toolkit.key_binding import KeyBindings
+    if kb is None:
+        from prompt_toolkit.key_binding import KeyBindings
 
+        kb = KeyBindings()
 
-kb: KeyBindings = KeyBindings()
+        @kb.add('c-i')
+        @kb.add('escape', 'enter')
+        def _(event):
+            event.current_buffer.insert_text('\n')
 
+        @kb.add('enter')
+        def _(event):
+            event.current_buffer.validate_and_handle()
 
-@kb.add('c-i')
-@kb.add('escape', 'enter')
-def _(event):
-    event.current_buffer.insert_text('\n')
+        def bind_command(command: str, key: str) -> None:
+            @kb.add('c-x', key)
+            def _(event):
+                global pending_prompt_text
 
+                # the prompt is left with the slash command of the action, which is then run by `get_prompt`.
+                pending_prompt_text = event.current_buffer.text
+                event.current_buffer.text = command
+                event.app.exit(result=command)
 
-@kb.add('enter')
-def _(event):
-    event.current_buffer.validate_and_handle()
+        for command, key in command_keys.items():
+            bind_command(command=command, key=key)
+
+    return kb
 
 
 prompt_count: int = 0
+use_cache: bool = conf['settings']['response_cache']
+# models that answer every prompt at the same time, with `--fan-out`.
+fan_out_models: List[str] = []
+first_wins: bool = False
+
+prompt_session: 'PromptSession | None' = None
+# prompts typed while an answer is still arriving, they are sent in order.
+prompt_queue: List[str] = []
+# set to cancel the prompt that is being answered by the interactive loop.
+answer_cancel_event: Event | None = None
+# the event loop of the interactive loop, and the lock of the terminal, held while a prompt is typed or a menu is shown.
+interactive_loop: 'asyncio.AbstractEventLoop | None' = None
+terminal_lock: 'asyncio.Lock | None' = None
+
+
+class PromptLeft(Exception):
+    """
+    The prompt was left to show a menu, the text that was typed is put back in the next prompt.
+    """
+
+
+def leave_prompt() -> None:
+    global pending_prompt_text
+
+    app: 'Application' = get_prompt_session().app
+    if app.is_running and not app.is_done:
+        pending_prompt_text = app.current_buffer.text
+        app.exit(exception=PromptLeft())
+
+
+def get_prompt_session() -> 'PromptSession':
+    global prompt_session
+
+    if prompt_session is None:
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.formatted_text import HTML
+
+        prompt_session = PromptSession(
+            message=HTML(f'<b><ansibrightblue>$</ansibrightblue></b> '),
+            placeholder=HTML('<i><ansigray>Enter a prompt here</ansigray></i>'),
+            key_bindings=get_key_bindings(),
+            multiline=True,
+            bottom_toolbar=get_toolbar,
+            # redraw the toolbar while an answer is arriving.
+            refresh_interval=Loading.sleep_time
+        )
+
+    return prompt_session
+
+
+def get_toolbar() -> str:
+    status: str | None = Loading.get_status()
+    toolbar: str = f' {status}' if status is not None else \
+        f' {display_name} | Prompt Count: {prompt_count} | /help for actions'
+    if len(prompt_queue) != 0:
+        toolbar += f" | Queued: {len(prompt_queue)}"
+
+    return toolbar
 
 
-def get_prompt() -> str | None:
-    placeholder: HTML = HTML('<i><ansigray>Enter a prompt here</ansigray></i>')
-    prefix_prompt: HTML = HTML(f'<b><ansibrightblue>$</ansibrightblue></b> ')
+async def get_prompt() -> str | None:
+    """
+    Read the next prompt. Slash commands run their action here and return None.
+    """
+    global pending_prompt_text
 
     user_prompt: str = ''
+    default_text: str = pending_prompt_text
+    pending_prompt_text = ''
     try:
-        user_prompt = f"""{
-        prompt(
-            message=prefix_prompt,
-            placeholder=placeholder,
-            key_bindings=kb,
-            multiline=True
-        ).strip()
-        }"""
+        user_prompt = f"""{(await get_prompt_session().prompt_async(default=default_text)).strip()}"""
     except KeyboardInterrupt:
-        quit_program()
+        # Ctrl-C cancels the answer that is arriving, and only quits when there is none.
+        if answer_cancel_event is None or answer_cancel_event.is_set():
+            quit_program()
+        answer_cancel_event.set()
+        return
+    except PromptLeft:
+        return
     except Exception as e:
         log_error(message=f"An error occurred while getting the prompt: {repr(e)}")
         return
 
+    if is_command(user_prompt=user_prompt):
+        await run_command(command=user_prompt)
+        return
+
     return user_prompt
 
 
-def send_prompt(user_prompt: str) -> None:
+async def run_command(command: str) -> None:
+    """
+    Run the action of a slash command. The actions and their menus are only loaded when one of them is run.
+
+    The actions that show a menu or change the conversation wait until nothing is being answered.
+    """
+    global prompt_count
+
+    from components.action import Action, print_commands
+
+    if command == '/help':
+        print_commands()
+        return
+
+    # check if this program is running in the docker container.
+    if command != '/quit' and os.path.exists('/.dockerenv'):
+        log_error(message='The actions are not available in a container.')
+        return
+
+    if command not in ('/copy', '/quit',) and (answer_cancel_event is not None or len(prompt_queue) != 0):
+        log_error(message='Wait for the answers to arrive before running this action.')
+        return
+
+    action: Action = Action(prompt_count=prompt_count)
+    await action.run_command(command=command)
+    # loading a saved conversation sets the number of prompts that were already sent.
+    prompt_count = action.prompt_count
+
+
+def send_prompt(user_prompt: str, cancel_event: Event | None = None) -> None:
+    """
+    Send the prompt and render the answer.
+
+    The request is cancelled with Ctrl-C, or by setting `cancel_event` when the prompt is answered in another thread.
+    A cancelled request leaves the chat history as it was before the prompt.
+    """
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+
     global prompt_count
 
     new_line()
     if user_prompt.strip() == '':
         log_error(message='The user prompt is empty!')
 
+    user_prompt = add_repo_context(user_prompt=user_prompt)
+    if user_prompt is None:
+        return
+
+    if len(fan_out_models) != 0:
+        send_fan_out_prompt(user_prompt=user_prompt, cancel_event=cancel_event)
+        return
+
     title: str = f'[bold bright_blue]{display_name}'
+    request_metrics: RequestMetrics = RequestMetrics(
+        model_name=model_name,
+        stream=conf['settings']['stream_response']
+    )
+    request_metrics.bytes_in = len(user_prompt.encode('utf-8'))
+    build_start: float = time.perf_counter()
+
+    cache_key: str | None = None
+    if use_cache:
+        from components.cache import ResponseCache, get_response_cache
+
+        cache_key = ResponseCache.make_key(
+            model_name=model_name,
+            chat_history=get_chat_turns(),
+            user_prompt=user_prompt
+        )
+        cached_response: str | None = None
+        try:
+            cached_response = get_response_cache().get(key=cache_key)
+        except Exception as e:
+            log_error(message=f"Unable to read the response cache: {repr(e)}")
+
+        if cached_response is not None:
+            append_chat_turn(user_prompt=user_prompt, response=cached_response)
+            prompt_count += 1
+            request_metrics.cache = 'hit'
+            request_metrics.build = time.perf_counter() - build_start
+            request_metrics.bytes_out = len(cached_response.encode('utf-8'))
+
+            render_start: float = time.perf_counter()
+            log(anything=Panel(
+                Markdown(
+                    markup=cached_response,
+                    code_theme='monokai'
+                ),
+                border_style='bright_blue',
+                title=title,
+                title_align='left',
+                subtitle=(
+                    f"[bold bright_red]Prompt Count: {prompt_count}[/]"
+                    f"[bright_blue] | [/][bold bright_green]Cache: HIT[/]"
+                ),
+                subtitle_align='right'
+            ))
+            request_metrics.render = time.perf_counter() - render_start
+            request_metrics.total = time.perf_counter() - build_start
+            save_metrics(request_metrics=request_metrics)
+            return
+
+        request_metrics.cache = 'miss'
+
+    request_metrics.build = time.perf_counter() - build_start
+    request_metrics.connection = 'warm' if get_connection_warmer().is_warm() else 'cold'
+
+    if conf['settings']['stream_response']:
+        stream_prompt(
+            user_prompt=user_prompt,
+            title=title,
+            cache_key=cache_key,
+            request_metrics=request_metrics,
+            cancel_event=cancel_event
+        )
+        return
+
     Loading.start(message=f"{title} is thinking...")
 
-    response: GenerateContentResponse | None = None
+    context_window: 'ContextWindow' = get_context_window()
+    response: 'GenerateContentResponse | None' = None
     start_time: float = time.time()
+    request_start: float = time.perf_counter()
     try:
-        response = chat.send_message(user_prompt)
+        response = context_window.send_message(user_prompt=user_prompt, cancel_event=cancel_event)
         prompt_count += 1
-    except KeyboardInterrupt:
-        quit_program()
+        get_connection_warmer().mark_used()
+    except (KeyboardInterrupt, RequestCancelled,):
+        Loading.stop()
+        log_cancelled(request_metrics=request_metrics)
+        return
     except Exception as e:
         Loading.stop()
         log_error(message=f"Google API request failed to connect: {repr(e)}")
+        request_metrics.error = repr(e)
+        save_metrics(request_metrics=request_metrics)
         return
 
+    # the context selection happens within the request, but it is part of building the prompt.
+    request_metrics.build += context_window.select_time
+    request_metrics.network = time.perf_counter() - request_start - context_window.select_time
+    request_metrics.first_byte = request_metrics.network
+    request_metrics.record_usage(response=response)
+    request_metrics.bytes_out = len(response.text.encode('utf-8'))
+
     end_time: float = time.time()
+    context_window.record_usage(response=response)
     subtitle: str = (
         f"[bold bright_yellow]Time Elapsed: {(end_time - start_time):.1f}s[/]"
         f"[bright_blue] | [/][bold bright_red]Prompt Count: {prompt_count}[/]"
+        f"[bright_blue] | [/]{get_context_usage()}"
     )
+    if cache_key is not None:
+        store_response(cache_key=cache_key, response=response.text)
+        subtitle += '[bright_blue] | [/][bold bright_green]Cache: MISS[/]'
+
+    render_start: float = time.perf_counter()
     panel: Panel = Panel(
         Markdown(
             markup=response.text,
@@ -134,41 +368,837 @@ def send_prompt(user_prompt: str) -> None:
 
     Loading.stop()
     log(anything=panel)
+    request_metrics.render = time.perf_counter() - render_start
+    request_metrics.total = request_metrics.build + request_metrics.network + request_metrics.render
+    save_metrics(request_metrics=request_metrics)
 
 
-def run() -> None:
+def add_repo_context(user_prompt: str) -> str | None:
+    """
+    Add the snippets of the repository in the working directory that match the prompt, if it has the @repo marker.
+
+    Return None if the search was cancelled.
+    """
+    if '@repo' not in user_prompt:
+        return user_prompt
+
+    try:
+        from components import repo_index
+    except ModuleNotFoundError as e:
+        if e.name != 'numpy':
+            raise
+        log_error(message='The @repo marker needs NumPy, install it with `pip install numpy`.')
+        return user_prompt
+
+    if not repo_index.has_repo_marker(user_prompt=user_prompt):
+        return user_prompt
+
+    Loading.start(message='[bold bright_blue]Searching the repository...')
+    try:
+        index, _ = repo_index.get_repo_index(path=os.getcwd())
+        prompt, locations = repo_index.add_repo_context(
+            user_prompt=user_prompt,
+            repo_index=index,
+            snippet_count=conf['settings']['repo_snippet_count']
+        )
+    except KeyboardInterrupt:
+        Loading.stop()
+        log_info(message='The search of the repository was cancelled.')
+        return None
+    except Exception as e:
+        Loading.stop()
+        log_error(message=f"Unable to search the repository: {repr(e)}")
+        return user_prompt
+    finally:
+        Loading.stop()
+
+    if len(locations) == 0:
+        log_info(message='No part of the repository matches the prompt.')
+    else:
+        log_info(message=f"Added {len(locations)} snippet(s) of the repository: {', '.join(locations)}")
+
+    return prompt
+
+
+def stream_prompt(
+        user_prompt: str,
+        title: str,
+        cache_key: str | None,
+        request_metrics: RequestMetrics,
+        cancel_event: Event | None = None
+) -> None:
+    from components.code_blocks import CodeBlockIndex, set_code_block_index
+    from components.stream import MarkdownStream
+
+    global prompt_count
+
+    Loading.start(message=f"{title} is thinking...")
+
+    context_window: 'ContextWindow' = get_context_window()
+    # in the interactive loop the user can type below the output, so it cannot be redrawn in place.
+    markdown_stream: MarkdownStream = MarkdownStream(title=title, live=not Loading.quiet)
+    # the code blocks are indexed while they arrive, so copying one of them does not scan the response again.
+    code_block_index: CodeBlockIndex = CodeBlockIndex()
+    first_token_time: float | None = None
+    byte_count: int = 0
+    start_time: float = time.time()
+    request_start: float = time.perf_counter()
+    try:
+        response: 'GenerateContentResponse' = context_window.send_message(
+            user_prompt=user_prompt,
+            stream=True,
+            cancel_event=cancel_event
+        )
+        for chunk in response if cancel_event is None else iterate_cancellable(
+                iterable=response,
+                cancel_event=cancel_event
+        ):
+            if first_token_time is None:
+                first_token_time = time.time()
+                request_metrics.first_byte = time.perf_counter() - request_start - context_window.select_time
+                if Loading.quiet:
+                    # the answer is only printed block by block, the toolbar keeps showing that it is arriving.
+                    Loading.update(message=f"{title} is answering...")
+                else:
+                    Loading.stop()
+                markdown_stream.start()
+
+            render_start: float = time.perf_counter()
+            byte_count += len(chunk.text.encode('utf-8'))
+            token_count: int | None = get_generated_token_count(chunk=chunk)
+            Loading.update(byte_count=byte_count, token_count=token_count)
+            code_block_index.feed(chunk=chunk.text)
+            markdown_stream.update(
+                chunk=chunk.text,
+                subtitle=(
+                    f"[bold bright_yellow]First Token: {(first_token_time - start_time):.1f}s[/]"
+                    f"[bright_blue] | [/][bold bright_green]Received: {format_size(size=byte_count)}"
+                    + (f", {token_count} tokens" if token_count else '') + '[/]'
+                )
+            )
+            request_metrics.render += time.perf_counter() - render_start
+        # the pair is only added to the chat history once the whole response was received.
+        context_window.commit(user_prompt=user_prompt, response=response)
+        prompt_count += 1
+        get_connection_warmer().mark_used()
+    except (KeyboardInterrupt, RequestCancelled,):
+        Loading.stop()
+        # the part of the answer that was received stays on the screen, but it is not added to the chat history.
+        markdown_stream.stop(subtitle='[bold bright_red]Cancelled[/]')
+        log_cancelled(request_metrics=request_metrics)
+        return
+    except Exception as e:
+        Loading.stop()
+        markdown_stream.stop()
+        log_error(message=f"Google API request failed to connect: {repr(e)}")
+        request_metrics.error = repr(e)
+        save_metrics(request_metrics=request_metrics)
+        return
+
+    code_block_index.finish()
+    set_code_block_index(code_block_index=code_block_index)
+
+    # the chunks are rendered while they are received, so the render time is not part of the network time.
+    request_metrics.build += context_window.select_time
+    request_metrics.network = (
+        time.perf_counter() - request_start - context_window.select_time - request_metrics.render
+    )
+    request_metrics.record_usage(response=response)
+    request_metrics.bytes_out = len(markdown_stream.text.encode('utf-8'))
+
+    end_time: float = time.time()
+    context_window.record_usage(response=response)
+    time_to_first_token: float = (first_token_time or end_time) - start_time
+    subtitle: str = (
+        f"[bold bright_yellow]First Token: {time_to_first_token:.1f}s[/]"
+        f"[bright_blue] | [/][bold bright_yellow]Time Elapsed: {(end_time - start_time):.1f}s[/]"
+        f"[bright_blue] | [/][bold bright_red]Prompt Count: {prompt_count}[/]"
+        f"[bright_blue] | [/]{get_context_usage()}"
+    )
+    if cache_key is not None:
+        store_response(cache_key=cache_key, response=markdown_stream.text)
+        subtitle += '[bright_blue] | [/][bold bright_green]Cache: MISS[/]'
+
+    render_start: float = time.perf_counter()
+    Loading.stop()
+    markdown_stream.start()
+    markdown_stream.stop(subtitle=subtitle)
+    request_metrics.render += time.perf_counter() - render_start
+    request_metrics.total = request_metrics.build + request_metrics.network + request_metrics.render
+    save_metrics(request_metrics=request_metrics)
+
+
+def get_generated_token_count(chunk: 'GenerateContentResponse') -> int | None:
+    # every chunk of a streamed response reports the number of tokens generated so far.
+    try:
+        return chunk.usage_metadata.candidates_token_count or None
+    except (AttributeError, ValueError,):
+        return None
+
+
+def send_input_prompt(user_prompt: str, paths: List[str]) -> bool:
+    """
+    Answer the prompt about files, directories and stdin ('-'), which are read as a stream.
+
+    An input larger than the context of the model is answered in parts by concurrent requests, and the answers of the
+    parts are combined into one. Return False if the input is empty.
+    """
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+
+    new_line()
+    title: str = f'[bold bright_blue]{display_name}'
+
+    start_time: float = time.time()
+    try:
+        answer, map_reduce = answer_input(user_prompt=user_prompt, paths=paths, title=title)
+    except KeyboardInterrupt:
+        Loading.stop()
+        log_info(message='The request was cancelled, the prompt was not added to the conversation.')
+        return True
+    except OSError as e:
+        Loading.stop()
+        log_error(message=f"Unable to read the input: {repr(e)}")
+        return True
+    except Exception as e:
+        Loading.stop()
+        log_error(message=f"Google API request failed to connect: {repr(e)}")
+        return True
+
+    if answer is None:
+        return False
+
+    add_input_turn(user_prompt=user_prompt, paths=paths, answer=answer)
+
+    end_time: float = time.time()
+    log(anything=Panel(
+        Markdown(
+            markup=answer,
+            code_theme='monokai'
+        ),
+        border_style='bright_blue',
+        title=title,
+        title_align='left',
+        subtitle=(
+            f"[bold bright_yellow]Time Elapsed: {(end_time - start_time):.1f}s[/]"
+            f"[bright_blue] | [/][bold bright_green]Input: {format_size(size=map_reduce.byte_count)} in "
+            f"{map_reduce.chunk_count} part(s)[/]"
+            f"[bright_blue] | [/][bold bright_red]Prompt Count: {prompt_count}[/]"
+        ),
+        subtitle_align='right'
+    ))
+    return True
+
+
+def answer_input(user_prompt: str, paths: List[str], title: str) -> 'Tuple[str | None, MapReduce]':
+    """
+    Answer the prompt about the input with a map-reduce, while the spinner shows the progress.
+
+    The answer is None if the input is empty. The errors are raised to the caller.
+    """
+    from components.ingest import MapReduce, get_chunk_size, read_lines
+
+    def show_progress(map_reduce: MapReduce) -> None:
+        if map_reduce.reducing:
+            message: str = f"{title} is combining the answers of {map_reduce.chunk_count} parts..."
+        elif map_reduce.chunk_count > 1:
+            message = f"{title} is reading the input... {map_reduce.answered_count}/{map_reduce.chunk_count} parts"
+        else:
+            message = f"{title} is reading the input..."
+        Loading.update(byte_count=map_reduce.byte_count, message=message)
+
+    map_reduce: MapReduce = MapReduce(
+        question=user_prompt,
+        chunk_size=get_chunk_size(question=user_prompt),
+        concurrency=conf['settings']['ingest_concurrency'],
+        on_progress=show_progress
+    )
+    Loading.start(message=f"{title} is reading the input...")
+    try:
+        answer: str | None = map_reduce.answer(lines=read_lines(paths=paths, stdin=sys.stdin))
+    finally:
+        Loading.stop()
+
+    return answer, map_reduce
+
+
+def add_input_turn(user_prompt: str, paths: List[str], answer: str) -> None:
     global prompt_count
-    user_prompt: str | None = ' '.join(sys.argv[1:]) if sys.argv[1:] else None
+
+    # the model does not get the input again with the next prompts, only the question and its answer.
+    append_chat_turn(
+        user_prompt=f"{user_prompt}\n\n(asked about {', '.join('stdin' if path == '-' else path for path in paths)})",
+        response=answer
+    )
+    prompt_count += 1
+
+
+def send_plain_prompt(user_prompt: str, output_mode: str, paths: List[str]) -> int:
+    """
+    Answer the prompt without rich, for scripts, and return the exit code.
+
+    'raw' writes the text to stdout as it arrives, 'json' writes a JSON object with the text, the model, the latency,
+    the token usage and the finish reason. Errors and progress go to stderr.
+    """
+    global prompt_count
+
+    user_prompt = add_repo_context(user_prompt=user_prompt)
+    if user_prompt is None:
+        return 130
+
+    title: str = f'[bold bright_blue]{display_name}'
+    start_time: float = time.perf_counter()
+    if len(paths) != 0:
+        try:
+            answer, _ = answer_input(user_prompt=user_prompt, paths=paths, title=title)
+        except KeyboardInterrupt:
+            return 130
+        except OSError as e:
+            return write_plain_error(
+                output_mode=output_mode,
+                message=f"Unable to read the input: {repr(e)}",
+                error=repr(e),
+                latency=time.perf_counter() - start_time
+            )
+        except Exception as e:
+            return write_plain_error(
+                output_mode=output_mode,
+                message=f"Google API request failed to connect: {repr(e)}",
+                error=repr(e),
+                latency=time.perf_counter() - start_time
+            )
+
+        # an empty stdin, e.g. /dev/null in a script, is not an input.
+        if answer is not None:
+            add_input_turn(user_prompt=user_prompt, paths=paths, answer=answer)
+            write_plain_answer(output_mode=output_mode, text=answer, latency=time.perf_counter() - start_time)
+            return 0
+
+    request_metrics: RequestMetrics = RequestMetrics(model_name=model_name, stream=output_mode == 'raw')
+    request_metrics.bytes_in = len(user_prompt.encode('utf-8'))
+    request_metrics.connection = 'warm' if get_connection_warmer().is_warm() else 'cold'
+
+    context_window: 'ContextWindow' = get_context_window()
+    text: str = ''
+    chunks: List[str] = []
+    byte_count: int = 0
+    Loading.start(message=f"{title} is thinking...")
+    try:
+        response: 'GenerateContentResponse' = context_window.send_message(
+            user_prompt=user_prompt,
+            stream=output_mode == 'raw'
+        )
+        if output_mode == 'raw':
+            for chunk in response:
+                if request_metrics.first_byte is None:
+                    request_metrics.first_byte = time.perf_counter() - start_time
+                    # the spinner is on stderr, it only shares the terminal with an answer that is not piped.
+                    if sys.stdout.isatty():
+                        Loading.stop()
+                    else:
+                        Loading.update(message=f"{title} is answering...")
+
+                chunk_text: str = chunk.text
+                byte_count += len(chunk_text.encode('utf-8'))
+                Loading.update(byte_count=byte_count, token_count=get_generated_token_count(chunk=chunk))
+                sys.stdout.write(chunk_text)
+                sys.stdout.flush()
+                chunks.append(chunk_text)
+            text = ''.join(chunks)
+            context_window.commit(user_prompt=user_prompt, response=response)
+        else:
+            text = response.text
+        prompt_count += 1
+    except KeyboardInterrupt:
+        Loading.stop()
+        request_metrics.error = 'cancelled'
+        save_metrics(request_metrics=request_metrics)
+        return 130
+    except Exception as e:
+        Loading.stop()
+        request_metrics.error = repr(e)
+        save_metrics(request_metrics=request_metrics)
+        return write_plain_error(
+            output_mode=output_mode,
+            message=f"Google API request failed to connect: {repr(e)}",
+            error=repr(e),
+            latency=time.perf_counter() - start_time
+        )
+    finally:
+        Loading.stop()
+
+    latency: float = time.perf_counter() - start_time
+    context_window.record_usage(response=response)
+    request_metrics.record_usage(response=response)
+    request_metrics.bytes_out = len(text.encode('utf-8'))
+    request_metrics.network = request_metrics.total = latency
+    if request_metrics.first_byte is None:
+        request_metrics.first_byte = latency
+    save_metrics(request_metrics=request_metrics)
+
+    if output_mode == 'raw':
+        if not text.endswith('\n'):
+            sys.stdout.write('\n')
+    else:
+        write_plain_answer(
+            output_mode=output_mode,
+            text=text,
+            latency=latency,
+            usage={'prompt_tokens': request_metrics.tokens_in, 'response_tokens': request_metrics.tokens_out},
+            finish_reason=response.candidates[0].finish_reason.name
+        )
+
+    return 0
+
+
+def write_plain_answer(
+        output_mode: str,
+        text: str,
+        latency: float,
+        usage: Dict[str, int] | None = None,
+        finish_reason: str | None = None
+) -> None:
+    if output_mode == 'json':
+        sys.stdout.write(json.dumps(obj={
+            'model': model_name,
+            'text': text,
+            'latency': latency,
+            'usage': usage,
+            'finish_reason': finish_reason
+        }, ensure_ascii=False) + '\n')
+    else:
+        sys.stdout.write(text if text.endswith('\n') else f'{text}\n')
+
+    sys.stdout.flush()
+
+
+def write_plain_error(output_mode: str, message: str, error: str, latency: float) -> int:
+    """
+    Report the error, on stdout as JSON or on stderr, and return the exit code.
+    """
+    if output_mode == 'json':
+        sys.stdout.write(json.dumps(obj={'model': model_name, 'error': error, 'latency': latency}) + '\n')
+    else:
+        log_error(message=message)
+
+    return 1
+
+
+def log_cancelled(request_metrics: RequestMetrics) -> None:
+    log_info(message='The request was cancelled, the prompt was not added to the conversation.')
+    request_metrics.error = 'cancelled'
+    save_metrics(request_metrics=request_metrics)
+
+
+def send_fan_out_prompt(user_prompt: str, cancel_event: Event | None = None) -> None:
+    """
+    Send the prompt to every model of the fan-out, and add the answer of one of them to the conversation.
+
+    Either every answer is shown side by side and the user chooses one, or only the first answer is shown and kept.
+    """
+    from concurrent.futures import Future
+    from rich.table import Table
+
+    from components.fanout import first_answer, get_fan_out
+
+    global prompt_count
+
+    display_names: str = ', '.join(supported_models[name] for name in fan_out_models)
+    Loading.start(message=f"[bold bright_blue]{display_names}[/] are thinking...")
+
+    futures: List[Future] = get_fan_out(model_names=fan_out_models).send(user_prompt=user_prompt)
+
+    def wait_answers() -> List['Answer']:
+        return [first_answer(futures=futures)] if first_wins else [future.result() for future in futures]
+
+    try:
+        answers: List['Answer'] = wait_answers() if cancel_event is None else run_cancellable(
+            function=wait_answers,
+            cancel_event=cancel_event
+        )
+    except (KeyboardInterrupt, RequestCancelled,):
+        Loading.stop()
+        # the models that are still answering keep their answer in their own session only.
+        log_info(message='The request was cancelled, the prompt was not added to the conversation.')
+        return
+    finally:
+        Loading.stop()
+
+    grid: Table = Table.grid(expand=True, padding=(0, 1,))
+    for _ in answers:
+        grid.add_column(ratio=1)
+    grid.add_row(*(to_answer_panel(answer=answer) for answer in answers))
+    log(anything=grid)
+
+    chosen_answer: 'Answer | None' = answers[0]
+    if not first_wins and interactive_loop is not None:
+        import asyncio
+
+        # the menu is shown by the event loop, once the prompt has left the terminal. the next prompts wait for it.
+        chosen_answer = asyncio.run_coroutine_threadsafe(
+            choose_answer_at_prompt(answers=answers),
+            interactive_loop
+        ).result()
+    elif not first_wins:
+        chosen_answer = choose_answer(answers=answers)
+    if chosen_answer is not None and chosen_answer.error is None:
+        append_chat_turn(user_prompt=user_prompt, response=chosen_answer.text)
+        prompt_count += 1
+
+
+def to_answer_panel(answer: 'Answer') -> 'Panel':
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+
+    return Panel(
+        Markdown(markup=answer.text, code_theme='monokai') if answer.error is None
+        else f'[bright_red]ERROR: {answer.error}[/]',
+        border_style='bright_blue' if answer.error is None else 'bright_red',
+        title=f'[bold bright_blue]{answer.model_session.display_name}',
+        title_align='left',
+        subtitle=f"[bold bright_yellow]Time Elapsed: {answer.latency:.1f}s[/]",
+        subtitle_align='right'
+    )
+
+
+async def choose_answer_at_prompt(answers: List['Answer']) -> 'Answer | None':
+    """
+    Choose the answer from the interactive loop, the prompt that is being typed is left until the choice is made.
+    """
+    import asyncio
+
+    while True:
+        leave_prompt()
+        try:
+            # the prompt may be about to start, it is left again until the terminal is free.
+            await asyncio.wait_for(terminal_lock.acquire(), timeout=Loading.sleep_time)
+            break
+        except asyncio.TimeoutError:
+            pass
+
+    try:
+        return choose_answer(answers=answers)
+    finally:
+        terminal_lock.release()
+
+
+def choose_answer(answers: List['Answer']) -> 'Answer | None':
+    from components.selection import terminal_menu
+
+    succeeded_answers: List['Answer'] = [answer for answer in answers if answer.error is None]
+    if len(succeeded_answers) <= 1:
+        return succeeded_answers[0] if succeeded_answers else None
+
+    entries: List[str] = [
+        f'[{index}] {answer.model_session.display_name} ({answer.latency:.1f}s)'
+        for index, answer in enumerate(succeeded_answers, start=1)
+    ] + [f'[{len(succeeded_answers) + 1}] None of them']
+    try:
+        answer_index: int | None = terminal_menu(
+            menu_title='Which answer goes into the conversation?',
+            entries=entries
+        ).show()
+    except Exception as e:
+        log_error(message=f"Unable to show the answers to choose from: {repr(e)}")
+        return None
+
+    new_line()
+    if answer_index is None or answer_index >= len(succeeded_answers):
+        return None
+
+    return succeeded_answers[answer_index]
+
+
+def get_context_usage() -> str:
+    context_window: 'ContextWindow' = get_context_window()
+    context_usage: str = (
+        f"[bold bright_magenta]Context: {format_token_count(token_count=context_window.token_count)}"
+        f"/{format_token_count(token_count=context_window.budget)} tokens[/]"
+    )
+    return context_usage
+
+
+def store_response(cache_key: str, response: str) -> None:
+    from components.cache import get_response_cache
+
+    try:
+        get_response_cache().put(key=cache_key, model_name=model_name, response=response)
+    except Exception as e:
+        log_error(message=f"Unable to cache the response: {repr(e)}")
+
+
+def save_metrics(request_metrics: RequestMetrics) -> None:
+    try:
+        record_metrics(request_metrics=request_metrics)
+    except Exception as e:
+        log_error(message=f"Unable to record the request metrics: {repr(e)}")
+
+
+def save_session() -> None:
+    """
+    Autosave the turns of the conversation, the file is written in the background.
+    """
+    from components.autosave import Autosave, get_autosave
+
+    autosave: Autosave | None = get_autosave()
+    if autosave is not None and prompt_count != 0:
+        autosave.save(history=get_chat_history())
+
+
+def archive_conversations() -> None:
+    from components.archive import archive_old_conversations
 
     save_dir: str = conf['settings']['save_dir']
     if not os.path.exists(path=save_dir):
-        os.makedirs(name=save_dir)
+        log_info(message='There are no saved conversations to archive.')
+        return
+
+    try:
+        archived_file_names: List[str] = archive_old_conversations(
+            save_dir=save_dir,
+            days=conf['settings']['archive_after_days']
+        )
+    except Exception as e:
+        log_error(message=f"Unable to archive the saved conversations: {repr(e)}")
+        return
+
+    log_info(
+        message=f"Archived {len(archived_file_names)} conversation(s) that were not updated for "
+                f"{conf['settings']['archive_after_days']} days."
+    )
+
+
+def export_conversation(arguments: Arguments) -> int:
+    from components import archive
+
+    path: str | None = archive.find_saved_conversation(save_dir=conf['settings']['save_dir'], name=arguments.export)
+    if path is None:
+        log_error(message=f"No saved conversation found: \[{arguments.export}]")  # noqa: disable=W605
+        return 1
+
+    if not archive.is_saved_conversation(path=path):
+        log_error(message=f"Not a saved conversation: \[{path}]")  # noqa: disable=W605
+        return 1
+
+    try:
+        sys.stdout.write(archive.export_conversation(
+            path=path,
+            output_format=arguments.export_format,
+            last_turn_count=arguments.last
+        ))
+    except Exception as e:
+        log_error(message=f"Unable to export the conversation \[{path}]: {repr(e)}")  # noqa: disable=W605
+        return 1
+
+    return 0
+
+
+def run_batch_mode(arguments: Arguments) -> int:
+    import asyncio
+    from components.batch import run_batch
+
+    try:
+        if arguments.batch == '-':
+            return asyncio.run(run_batch(
+                source=sys.stdin,
+                output=sys.stdout,
+                concurrency=arguments.concurrency,
+                rate=arguments.rate
+            ))
+
+        with open(arguments.batch, 'r', encoding='utf-8') as file:
+            return asyncio.run(run_batch(
+                source=file,
+                output=sys.stdout,
+                concurrency=arguments.concurrency,
+                rate=arguments.rate
+            ))
+    except KeyboardInterrupt:
+        quit_program()
+    except OSError as e:
+        log_error(message=f"Unable to read the batch file \[{arguments.batch}]: {repr(e)}")  # noqa: disable=W605
+        return 1
+
+
+def run() -> None:
+    global prompt_count, use_cache, fan_out_models, first_wins
+    arguments: Arguments = Arguments(argv=sys.argv[1:])
+
+    if arguments.version:
+        print_version()
+        return
+    elif arguments.help:
+        print_usage()
+        return
+    elif arguments.error is not None:
+        log_error(message=arguments.error)
+        print_usage()
+        return
+
+    if arguments.stats:
+        print_stats()
+        return
+
+    if arguments.archive:
+        archive_conversations()
+        return
+
+    if arguments.export is not None:
+        sys.exit(export_conversation(arguments=arguments))
+
+    if arguments.no_cache:
+        use_cache = False
 
-    if user_prompt is not None:
-        if user_prompt.strip() == '--version' or user_prompt.strip() == '-v':
-            print_version()
+    if len(arguments.fan_out) != 0:
+        from components.fanout import validate_model_names
+
+        unsupported_models: List[str] = validate_model_names(model_names=arguments.fan_out)
+        if len(unsupported_models) != 0:
+            log_error(message=f"Unsupported models for --fan-out: {', '.join(unsupported_models)}")
             return
-        elif user_prompt.strip() == '--help' or user_prompt.strip() == '-h':
-            print_usage()
+
+        fan_out_models = arguments.fan_out
+        first_wins = arguments.first_wins
+
+    if arguments.batch is not None:
+        sys.exit(1 if run_batch_mode(arguments=arguments) != 0 else 0)
+
+    if arguments.daemon:
+        from components.daemon import serve
+
+        serve(socket_path=conf['settings']['daemon_socket_path'])
+        return
+
+    user_prompt: str | None = arguments.prompt
+    input_paths: List[str] = arguments.files
+    # input piped into geminal, e.g. `cat app.log | geminal why did it fail?`, is read like a file.
+    if user_prompt is not None and len(input_paths) == 0 and has_piped_input():
+        input_paths = ['-']
+
+    output_mode: str | None = arguments.output_mode
+    # an answer that is piped into another program, e.g. `geminal explain this | less`, is written as plain text.
+    if output_mode is None and user_prompt is not None and len(fan_out_models) == 0 and \
+            arguments.session is None and not sys.stdout.isatty():
+        output_mode = 'raw'
+
+    if output_mode is not None:
+        # stdout only gets the answer, the errors and the spinner go to stderr.
+        console.stderr = True
+        Loading.quiet = not console.is_terminal
+        exit_code: int = send_plain_prompt(user_prompt=user_prompt, output_mode=output_mode, paths=input_paths)
+        save_session()
+        sys.exit(exit_code)
+
+    # a one-shot prompt is answered by the daemon if one is running, in the session it keeps for this name.
+    if user_prompt is not None and len(fan_out_models) == 0 and len(input_paths) == 0 and \
+            os.path.exists(conf['settings']['daemon_socket_path']):
+        from components.client import forward_prompt
+
+        if forward_prompt(
+                socket_path=conf['settings']['daemon_socket_path'],
+                user_prompt=user_prompt,
+                session=arguments.session or 'default',
+                use_cache=use_cache
+        ):
             return
-        else:
-            send_prompt(user_prompt=user_prompt)
-    else:
-        print_welcome()
 
-    action: Action = Action(prompt_count=prompt_count)
+    if arguments.session is not None:
+        log_error(message='Named sessions need a running daemon, start one with `geminal --daemon`.')
+        return
 
-    while True:
+    save_dir: str = conf['settings']['save_dir']
+    if not os.path.exists(path=save_dir):
+        os.makedirs(name=save_dir)
+
+    if user_prompt is not None and len(input_paths) != 0:
+        # an empty stdin, e.g. /dev/null in a script, is not an input.
+        if not send_input_prompt(user_prompt=user_prompt, paths=input_paths):
+            send_prompt(user_prompt=user_prompt)
+        save_session()
+        # the interactive loop cannot read the prompts from a stdin that was piped or redirected.
+        if not sys.stdin.isatty():
+            return
+    elif user_prompt is not None:
+        send_prompt(user_prompt=user_prompt)
+        save_session()
+        if not sys.stdin.isatty():
+            return
+    else:
         # check if this program is running in the docker container.
         if not os.path.exists('/.dockerenv'):
-            action.interact_w_partial_action_menu()
+            from components.action import resume_last_session
 
-        user_prompt: str = get_prompt()
-        if user_prompt is not None:
-            send_prompt(user_prompt=user_prompt)
-            if user_prompt == 'exit':
-                quit_program()
-            action: Action = Action(prompt_count=prompt_count)
+            prompt_count = resume_last_session()
+        if prompt_count == 0:
+            print_welcome()
+
+    import asyncio
+
+    asyncio.run(run_interactive_loop())
+
+
+async def run_interactive_loop() -> None:
+    """
+    Read prompts while the previous ones are answered.
+
+    The answers are sent and rendered by a task of their own, in the order the prompts were typed, and printed above
+    the input line. Actions are run with slash commands or their key bindings, without a menu in between prompts.
+    Ctrl-C cancels the prompt that is being answered, the queued ones are still sent.
+    """
+    import asyncio
+    from prompt_toolkit.patch_stdout import patch_stdout
+
+    global interactive_loop, terminal_lock
+
+    prompt_available: asyncio.Event = asyncio.Event()
+    answering: bool = False
+
+    async def answer_prompts() -> None:
+        global answer_cancel_event
+        nonlocal answering
+
+        while True:
+            await prompt_available.wait()
+            while len(prompt_queue) != 0:
+                answering = True
+                answer_cancel_event = Event()
+                try:
+                    await asyncio.to_thread(send_prompt, prompt_queue.pop(0), answer_cancel_event)
+                    save_session()
+                finally:
+                    answering = False
+                    answer_cancel_event = None
+            prompt_available.clear()
+
+    Loading.quiet = True
+    interactive_loop = asyncio.get_running_loop()
+    terminal_lock = asyncio.Lock()
+    answer_task: asyncio.Task = asyncio.create_task(answer_prompts())
+    warm_up: bool = conf['settings']['warm_up']
+    if warm_up:
+        # the connection is set up while the first prompt is typed, and kept alive for the whole session, including
+        # long answers and menus.
+        get_connection_warmer().start()
+    try:
+        with patch_stdout(raw=True):
+            while True:
+                async with terminal_lock:
+                    user_prompt: str | None = await get_prompt()
+                if user_prompt is None:
+                    continue
+
+                prompt_queue.append(user_prompt)
+                prompt_available.set()
+                if user_prompt == 'exit':
+                    while answering or len(prompt_queue) != 0:
+                        await asyncio.sleep(Loading.sleep_time)
+                    quit_program()
+    finally:
+        if warm_up:
+            get_connection_warmer().stop()
+        answer_task.cancel()
+        interactive_loop = None
+        Loading.quiet = False
 
 
 if __name__ == '__main__':
@@ -30,27 +30,35 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
 """
-import json
 import os
-import re
-from typing import Any, Dict, Generator, List
+from typing import Dict, List
 
-from prompt_toolkit import HTML, prompt
+from prompt_toolkit import HTML, PromptSession
 from prompt_toolkit.clipboard.pyperclip import PyperclipClipboard
-from pygments import lexers, formatters, highlight
-from pygments.lexer import Lexer
 from rich.markdown import Markdown
 from rich.panel import Panel
 from simple_term_menu import TerminalMenu
 
+from . import conversation
+from .archive import is_archive, unpack_archive
+from .autosave import Autosave, get_autosave
+from .catalog import Catalog, format_time, get_catalog
+from .code_blocks import CodeBlock, get_code_block_index, highlight_code
+from .commands import command_keys, commands
 from .config import conf
-from .console import log, log_error, log_info, new_line
-from .gemini import get_last_response, get_chat_history, display_name
+from .console import console, log, log_error, log_info, new_line
+from .conversation import Conversation, migrate_legacy_conversations, turn_to_text
+from .gemini import display_name, get_chat_history, get_last_response, model_name, set_chat_history
 from .selection import Selection, confirmation_action
-from .utils import quit_program, restart_program, to_separated_text_w_char
+from .utils import format_size, quit_program, restart_program, to_separated_text_w_char
 
 is_loaded: bool = False
 save_dir: str = conf['settings']['save_dir']
+loaded_message_count: int = max(conf['settings']['loaded_message_count'], 1)
+
+# turns of the loaded conversation, and the index of the earliest one that was rendered.
+loaded_turns: List[Dict] = []
+rendered_turn_index: int = 0
 clipboard: PyperclipClipboard = PyperclipClipboard()
 
 
@@ -62,28 +70,34 @@ class Action:
             prompt_count=self.prompt_count
         )
 
-    def interact_w_partial_action_menu(self) -> None:
-        user_selection: int = 0
-
-        try:
-            user_selection = self.selection.partial_interactive_actions()
-        except (KeyboardInterrupt, Exception,):
-            quit_program()
-
-        match user_selection:
-            case 1:
-                return
-            case 2:
+    async def run_command(self, command: str) -> None:
+        """
+        Run the action of a slash command, typed at the prompt or sent by its key binding.
+        """
+        match command:
+            case '/copy':
                 self.__copy_last_message()
-                self.interact_w_partial_action_menu()
-            case 3:
-                self.interact_w_full_action_menu()
-            case 4:
+            case '/code':
+                self.__copy_code_block_from_last_message()
+            case '/new':
+                discard_autosave()
+                restart_program()
+            case '/save':
+                await self.__save_conversation()
+            case '/load':
+                await self.__load_conversation()
+            case '/delete':
+                await delete_conversation()
+            case '/earlier':
+                show_earlier_messages()
+            case '/menu':
+                await self.interact_w_full_action_menu()
+            case '/quit':
                 quit_program()
             case _:
-                return
+                print_commands()
 
-    def interact_w_full_action_menu(self) -> None:
+    async def interact_w_full_action_menu(self) -> None:
         user_selection: int = 0
 
         try:
@@ -96,22 +110,20 @@ class Action:
                 return
             case 2:
                 self.__copy_last_message()
-                self.interact_w_partial_action_menu()
             case 3:
                 self.__copy_code_block_from_last_message()
-                self.interact_w_partial_action_menu()
             case 4:
+                discard_autosave()
                 restart_program()
             case 5:
-                self.__save_conversation(get_chat_history())
-                self.interact_w_partial_action_menu()
+                await self.__save_conversation()
             case 6:
-                self.__load_conversation()
-                self.interact_w_partial_action_menu()
+                await self.__load_conversation()
             case 7:
-                delete_conversation()
-                self.interact_w_partial_action_menu()
+                await delete_conversation()
             case 8:
+                show_earlier_messages()
+            case 9:
                 quit_program()
             case _:
                 return
@@ -134,74 +146,25 @@ class Action:
             log_error(message='There are no messages to copy.')
             return
 
-        markdown_code_blocks: List[str] = re.findall(
-            pattern=r'```(\w*)\n(.*?)```',
-            string=get_last_response(),
-            flags=re.DOTALL
-        )
+        code_blocks: List[CodeBlock] = get_code_block_index(text=get_last_response()).blocks
 
-        match len(markdown_code_blocks):
+        match len(code_blocks):
             case 0:
                 log_error(message='There are no code blocks from the last message to copy.')
                 return
 
             case 1:
-                clipboard.set_text(text=markdown_code_blocks[0][1])
+                clipboard.set_text(text=code_blocks[0].code)
                 log_info(message='Copied the selected code block to your clipboard.')
                 return
 
             case _:
-                languages: List[str] = []
-                code_block_dict: Dict = {}
-
-                def get_code_blocks_from_last_message() -> Generator[str, Any, None]:
-                    nonlocal languages
-                    nonlocal code_block_dict
-                    nonlocal markdown_code_blocks
-
-                    languages = []
-                    code_block_dict = {}
-
-                    for i, (language, code) in enumerate(iterable=markdown_code_blocks, start=1):
-                        language_w_index: str = f"[{i}] {language if len(language) != 0 else '_'}"
-                        code_block_dict[
-                            language if len(language) != 0 else '_'
-                        ] = code
-                        languages.append(language_w_index)
-
-                    return (lang for lang in languages)
-
-                def highlight_code_block(language_w_index: str) -> str:
-                    lexer_name: str = language_w_index.split()[-1].strip()
-                    code_block: str = code_block_dict[lexer_name]
-
-                    try:
-                        lexer: Lexer = lexers.get_lexer_by_name(
-                            _alias=lexer_name,
-                            stripnl=False,
-                            stripall=False
-                        )
-                    except (Exception,):
-                        lexer = lexers.get_lexer_by_name(
-                            _alias='text',
-                            stripnl=False,
-                            stripall=False
-                        )
-
-                    formatter = formatters.TerminalFormatter(
-                        bg='dark'
-                    )  # dark or light
-
-                    highlighted_code_block: str = highlight(
-                        code=code_block,
-                        lexer=lexer,
-                        formatter=formatter
-                    )
-
-                    return highlighted_code_block
+                def highlight_code_block(index: str) -> str:
+                    code_block: CodeBlock = code_blocks[int(index)]
+                    return highlight_code(code=code_block.code, language=code_block.language)
 
                 code_block_menu: TerminalMenu = TerminalMenu(
-                    menu_entries=get_code_blocks_from_last_message(),
+                    menu_entries=[f'{code_block.label}|{code_block.index}' for code_block in code_blocks],
                     title='[*] Available code blocks:',
                     preview_command=highlight_code_block,
                     preview_size=0.5,
@@ -212,9 +175,7 @@ class Action:
                 selected_code_block: str = ''
 
                 try:
-                    selected_code_block = code_block_dict[
-                        languages[code_block_index].split()[-1]
-                    ]
+                    selected_code_block = code_blocks[code_block_index].code
                 except (KeyboardInterrupt, Exception,):
                     quit_program()
 
@@ -222,66 +183,71 @@ class Action:
                 log_info(message='Copied the selected code block to your clipboard.')
                 return
 
-    def __save_conversation(self, chat_history: str) -> None:
+    async def __save_conversation(self) -> None:
         log(anything='[*] You selected the action to save the current conversation.')
 
         if self.prompt_count == 0:
             log_error(message='The conversation is empty. There is nothing to save.')
             return
-        else:
-            placeholder: HTML = HTML('<i><ansigray>Enter a name for this conversation</ansigray></i>')
-            prefix_prompt: HTML = HTML('<b><ansibrightblue>[*] Name this conversation:</ansibrightblue></b> ')
-
-            file_name_to_save: str = ''
 
+        current_conversation: Conversation | None = conversation.current_conversation
+        if current_conversation is not None:
             try:
-                file_name_to_save = f"""{prompt(message=prefix_prompt, placeholder=placeholder).strip()}"""
-            except KeyboardInterrupt:
-                quit_program()
+                turns: List[Dict] = current_conversation.sync(history=get_chat_history())
             except Exception as e:
-                log_error(message=f"An error occurred while naming the conversation: {repr(e)}")
+                log_error(message=f"Unable to save the conversation: {repr(e)}")
                 return
 
-            def chat_log_to_json(chat_log: str) -> str:
-                chat_log = chat_log.replace('text:', '"text":')
-                chat_log = chat_log.replace('\n, parts ', '\n},\n')
-                chat_log = chat_log.replace('\n}\nrole', ',\n  "role"')
-                chat_log = chat_log.replace(
-                    '"role": "model"\n]',
-                    '"role": "model"\n}]'
-                )
-                chat_log = chat_log.replace('[parts {', '[{')
-                chat_log = chat_log.replace('\\n', '\\\\n')
-                chat_log = chat_log.replace("\\'", "'")
-                return chat_log
-
-            def get_unique_file_path(filename: str) -> str:
-                suffix: str = '.json'
-                count: int = 0
-
-                unique_file_path: str = os.path.join(save_dir, f"{filename}{suffix}")
-                while os.path.exists(unique_file_path):
-                    count += 1
-                    unique_file_path = os.path.join(save_dir, f"{filename}_{str(count)}{suffix}")
-
-                return unique_file_path
-
-            file_name: str = to_separated_text_w_char(s=file_name_to_save)
-            file_path: str = get_unique_file_path(file_name)
-            file_content = json.loads(
-                s=chat_log_to_json(
-                    chat_log=chat_history
-                )
-            )
+            record_conversation(saved_conversation=current_conversation, turns=turns)
+            log_info(
+                message=f"Saved {len(turns)} new message(s) to \[{current_conversation.path}]."
+            )  # noqa: disable=W605
+            return
+
+        placeholder: HTML = HTML('<i><ansigray>Enter a name for this conversation</ansigray></i>')
+        prefix_prompt: HTML = HTML('<b><ansibrightblue>[*] Name this conversation:</ansibrightblue></b> ')
+
+        file_name_to_save: str = ''
+
+        try:
+            file_name_to_save = (
+                await PromptSession().prompt_async(message=prefix_prompt, placeholder=placeholder)
+            ).strip()
+        except KeyboardInterrupt:
+            quit_program()
+        except Exception as e:
+            log_error(message=f"An error occurred while naming the conversation: {repr(e)}")
+            return
+
+        def get_unique_file_path(filename: str) -> str:
+            suffix: str = conversation.FILE_SUFFIX
+            count: int = 0
+
+            unique_file_path: str = os.path.join(save_dir, f"{filename}{suffix}")
+            while os.path.exists(unique_file_path):
+                count += 1
+                unique_file_path = os.path.join(save_dir, f"{filename}_{str(count)}{suffix}")
 
-            with open(file_path, 'w', encoding='utf-8') as file:
-                json.dump(obj=file_content, fp=file, indent=2)
+            return unique_file_path
 
-            new_line()
-            log_info(message=f"Saved file as \[{file_path}].")  # noqa: disable=W605
+        file_name: str = to_separated_text_w_char(s=file_name_to_save)
+        file_path: str = get_unique_file_path(file_name)
+
+        try:
+            current_conversation = Conversation.create(path=file_path, model_name=model_name)
+            turns: List[Dict] = current_conversation.sync(history=get_chat_history())
+        except Exception as e:
+            log_error(message=f"Unable to save the conversation: {repr(e)}")
             return
 
-    def __load_conversation(self) -> None:
+        conversation.current_conversation = current_conversation
+        record_conversation(saved_conversation=current_conversation, turns=turns)
+
+        new_line()
+        log_info(message=f"Saved file as \[{file_path}].")  # noqa: disable=W605
+        return
+
+    async def __load_conversation(self) -> None:
         global is_loaded
 
         log('[*] You selected the action to load a saved conversation.')
@@ -292,78 +258,249 @@ class Action:
 
         is_loaded = True
 
-        file_names: list[str] = sorted(os.listdir(path=save_dir))
-        if len(file_names) == 0:
-            log_error(message='No saved conversations found.')
-            return
-
-        file_name_menu: TerminalMenu = TerminalMenu(
-            menu_entries=file_names,
-            title='[*] Available saved conversation files:'
+        selected_file_name: str | None = await select_conversation(
+            menu_title='[*] Available saved conversations:'
         )
-        file_name_index: int = file_name_menu.show()
-        selected_file_name: str = ''
-
-        try:
-            selected_file_name = f'{file_names[file_name_index]}'
-        except (KeyboardInterrupt, Exception,):
-            quit_program()
+        if selected_file_name is None:
+            return
 
         selected_file_path: str = os.path.join(
             save_dir, selected_file_name
         )
 
+        # an archived conversation becomes a conversation file again, so the new turns can be appended to it.
+        if is_archive(path=selected_file_path):
+            try:
+                selected_file_path = unpack_archive(path=selected_file_path)
+            except Exception as e:
+                log_error(
+                    message=f"Unable to unpack the archived conversation \[{selected_file_name}]: {repr(e)}"
+                )  # noqa: disable=W605
+                return
+
         try:
-            with open(file=selected_file_path, mode='r', encoding='utf-8') as file:
-                file_content: str = json.load(fp=file)
+            loaded_conversation, turns = Conversation.open(path=selected_file_path)
         except (Exception,):
             log_error(
                 message=f'Unable to open the selected conversation file: \[{selected_file_name}].'
             )  # noqa: disable=W605
             return
 
-        for message in file_content:
-            role: str = message['role']
-            if role == 'user':
-                log(anything=f"[bold][bright_blue]$[/] {message['text']}")
-            elif role == 'model':
-                text = (
-                    message['text']
-                    .replace("'", "\\'")
-                    .replace('\\n', '\n')
-                )
-                panel: Panel = Panel(
-                    Markdown(
-                        markup=text,
-                        code_theme='monokai'
-                    ),
-                    border_style='bright_blue',
-                    title=f'[bold bright_blue]{display_name}',
-                    title_align='left',
-                    subtitle=None,
-                    subtitle_align='right'
-                )
-                log(anything=panel)
-            else:
-                pass
+        # the model gets the whole conversation as context, but only the last messages are rendered.
+        set_chat_history(turns=turns)
+        conversation.current_conversation = loaded_conversation
+        self.prompt_count = sum(1 for turn in turns if turn['role'] == 'user')
+        self.selection.prompt_count = self.prompt_count
 
+        show_loaded_turns(turns=turns)
 
-def delete_conversation() -> None:
-    log(anything='[*] You selected the action to delete a saved conversation.')
 
-    file_names: List[str] = os.listdir(path=save_dir)
+def print_commands() -> None:
+    log(anything='[*] Available actions:')
+    for command, description in commands.items():
+        key: str | None = command_keys.get(command)
+        log(anything=f"    [bold cyan]{command:<9}[/]{description}" + (f" (Ctrl-X {key.upper()})" if key else ''))
+
+
+def show_loaded_turns(turns: List[Dict]) -> None:
+    """
+    Render the last messages of a loaded conversation, the earlier ones are shown on demand.
+    """
+    global loaded_turns, rendered_turn_index
+
+    loaded_turns = turns
+    rendered_turn_index = max(len(turns) - loaded_message_count, 0)
+
+    render_turns(turns=turns[rendered_turn_index:])
+    if rendered_turn_index != 0:
+        log_info(
+            message=f"{rendered_turn_index} earlier message(s) are not shown. "
+                    f"Type /earlier to read them."
+        )
+
+
+def render_turns(turns: List[Dict]) -> None:
+    for turn in turns:
+        role: str = turn['role']
+        if role == 'user':
+            log(anything=f"[bold][bright_blue]$[/] {turn_to_text(turn=turn)}")
+        elif role == 'model':
+            panel: Panel = Panel(
+                Markdown(
+                    markup=turn_to_text(turn=turn),
+                    code_theme='monokai'
+                ),
+                border_style='bright_blue',
+                title=f'[bold bright_blue]{display_name}',
+                title_align='left',
+                subtitle=None,
+                subtitle_align='right'
+            )
+            log(anything=panel)
+        else:
+            pass
+
+
+def show_earlier_messages() -> None:
+    """
+    Show the previous page of messages of the loaded conversation in a pager.
+    """
+    global rendered_turn_index
+
+    log(anything='[*] You selected the action to show earlier messages of the loaded conversation.')
+
+    if rendered_turn_index == 0:
+        log_error(message='There are no earlier messages to show.')
+        return
+
+    start_index: int = max(rendered_turn_index - loaded_message_count, 0)
+    with console.pager(styles=True):
+        render_turns(turns=loaded_turns[start_index:rendered_turn_index])
+
+    rendered_turn_index = start_index
+    log_info(message=f"{rendered_turn_index} earlier message(s) are left.")
+
+
+def resume_last_session() -> int:
+    """
+    Offer to resume the conversation of the last session, which was autosaved after every turn.
+
+    Return the number of prompts of the resumed conversation, or 0 if it was not resumed.
+    """
+    global is_loaded
+
+    autosave: Autosave | None = get_autosave()
+    if autosave is None:
+        return 0
+
+    last_session_path: str | None = autosave.find_last_session()
+    if last_session_path is None:
+        return 0
+
+    user_confirmation: bool = False
+    try:
+        user_confirmation = confirmation_action(
+            menu_title=f"Resume the last session from {format_time(timestamp=os.path.getmtime(last_session_path))} "
+                       f"({format_size(size=os.path.getsize(last_session_path))})?"
+        )
+    except (KeyboardInterrupt, Exception,):
+        quit_program()
+
+    if not user_confirmation:
+        return 0
+
+    try:
+        turns: List[Dict] = autosave.resume(path=last_session_path)
+    except Exception as e:
+        log_error(message=f"Unable to resume the last session: {repr(e)}")
+        return 0
+
+    # the session goes on in the same file, so it can be resumed again after this run.
+    set_chat_history(turns=turns)
+    is_loaded = True
+
+    new_line()
+    show_loaded_turns(turns=turns)
+    return sum(1 for turn in turns if turn['role'] == 'user')
+
+
+def discard_autosave() -> None:
+    # a new conversation is started on purpose, the abandoned one is not offered to be resumed.
+    autosave: Autosave | None = get_autosave()
+    if autosave is not None:
+        autosave.discard()
+
+
+def migrate_conversations() -> None:
+    try:
+        migrated_file_names: List[str] = migrate_legacy_conversations(save_dir=save_dir)
+    except Exception as e:
+        log_error(message=f"Unable to migrate the saved conversations: {repr(e)}")
+        return
+
+    if len(migrated_file_names) != 0:
+        log_info(
+            message=f"Migrated {len(migrated_file_names)} conversation(s) to the new format. "
+                    f"The original files are kept in \[{os.path.join(save_dir, conversation.LEGACY_DIR_NAME)}]."
+        )  # noqa: disable=W605
+
+
+def record_conversation(saved_conversation: Conversation, turns: List[Dict]) -> None:
+    try:
+        get_catalog().record(conversation=saved_conversation, turns=turns)
+    except Exception as e:
+        log_error(message=f"Unable to update the conversation catalog: {repr(e)}")
+
+
+async def select_conversation(menu_title: str) -> str | None:
+    """
+    Let the user search the saved conversations and pick one of them. Return its file name.
+    """
+    migrate_conversations()
+
+    catalog: Catalog = get_catalog()
+    try:
+        catalog.sync()
+    except Exception as e:
+        log_error(message=f"Unable to update the conversation catalog: {repr(e)}")
+        return None
+
+    placeholder: HTML = HTML('<i><ansigray>Search the saved conversations, or leave it empty to list all</ansigray></i>')
+    prefix_prompt: HTML = HTML('<b><ansibrightblue>[*] Search:</ansibrightblue></b> ')
+
+    query: str = ''
+    try:
+        query = (await PromptSession().prompt_async(message=prefix_prompt, placeholder=placeholder)).strip()
+    except KeyboardInterrupt:
+        quit_program()
+    except Exception as e:
+        log_error(message=f"An error occurred while getting the search query: {repr(e)}")
+        return None
+
+    saved_conversations: List[Dict] = catalog.search(query=query)
+    if len(saved_conversations) == 0:
+        log_error(message='No saved conversations found.')
+        return None
+
+    previews: Dict[str, str] = {
+        saved_conversation['file_name']: saved_conversation['preview']
+        for saved_conversation in saved_conversations
+    }
+
+    # the text after '|' is not displayed, it is passed to the preview command.
     file_name_menu: TerminalMenu = TerminalMenu(
-        menu_entries=file_names,
-        title='[*] Available saved conversations files:'
+        menu_entries=[
+            f"{saved_conversation['title']} "
+            f"({saved_conversation['turn_count']} messages, {format_size(size=saved_conversation['byte_size'])}, "
+            f"{format_time(timestamp=saved_conversation['updated_at'])})|{saved_conversation['file_name']}"
+            for saved_conversation in saved_conversations
+        ],
+        title=menu_title,
+        preview_command=lambda file_name: previews.get(file_name, ''),
+        preview_size=0.25,
+        show_search_hint=True,
+        shortcut_key_highlight_style=('fg_cyan', 'bold',)
     )
     file_name_index: int = file_name_menu.show()
     selected_file_name: str = ''
 
     try:
-        selected_file_name = f'{file_names[file_name_index]}'
+        selected_file_name = f"{saved_conversations[file_name_index]['file_name']}"
     except (KeyboardInterrupt, Exception,):
         quit_program()
 
+    return selected_file_name
+
+
+async def delete_conversation() -> None:
+    log(anything='[*] You selected the action to delete a saved conversation.')
+
+    selected_file_name: str | None = await select_conversation(
+        menu_title='[*] Available saved conversations:'
+    )
+    if selected_file_name is None:
+        return
+
     selected_file_path: str = os.path.join(save_dir, selected_file_name)
 
     user_confirmation: bool = confirmation_action(
@@ -373,13 +510,23 @@ def delete_conversation() -> None:
     if user_confirmation:
         try:
             os.unlink(path=selected_file_path)
-            log_info(message=f'Deleted file as \[{selected_file_path}].')  # noqa: disable=W605
-            return
         except Exception as e:
             log_error(
                 message=f'Unable to delete file as \[{selected_file_path}]: {repr(e)}'
             )  # noqa: disable=W605
             return
+
+        if conversation.current_conversation is not None and \
+                conversation.current_conversation.path == selected_file_path:
+            conversation.current_conversation = None
+
+        try:
+            get_catalog().remove(file_name=selected_file_name)
+        except Exception as e:
+            log_error(message=f"Unable to update the conversation catalog: {repr(e)}")
+
+        log_info(message=f'Deleted file as \[{selected_file_path}].')  # noqa: disable=W605
+        return
     else:
         log_info(message='Do nothing.')
         return
@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from bisect import bisect_right
+from typing import Any, Dict, List, Tuple
+
+from .conversation import FILE_SUFFIX, is_conversation, read_conversation, turn_to_text
+
+ARCHIVE_SUFFIX: str = '.archive'
+MAGIC: bytes = b'GMA1'
+# the offset and the size of the index, then the magic number, at the end of the file.
+TRAILER: struct.Struct = struct.Struct('<QI4s')
+# turns are compressed together until a block holds this many bytes of JSON lines.
+BLOCK_SIZE: int = 64 * 1024
+
+
+class ConversationArchive:
+    """
+    A conversation packed into compressed blocks of turns, followed by a compressed index of the blocks.
+
+    The file is memory-mapped and only the index is read when it is opened, so a single turn or the last turns of a
+    long conversation are read by decompressing only the blocks they are in.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+
+        with open(path, 'rb') as file:
+            self.__buffer: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.__buffer) < len(MAGIC) + TRAILER.size or self.__buffer[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not a conversation archive: {path}")
+
+        index_offset, index_size, magic = TRAILER.unpack_from(self.__buffer, len(self.__buffer) - TRAILER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"The conversation archive is truncated: {path}")
+
+        index: Dict[str, Any] = json.loads(zlib.decompress(self.__buffer[index_offset:index_offset + index_size]))
+        self.metadata: Dict[str, Any] = index['metadata']
+        # (offset, size, index of the first turn, number of turns) of every block.
+        self.blocks: List[List[int]] = index['blocks']
+        self.turn_count: int = sum(block[3] for block in self.blocks)
+
+        self.__first_turn_indexes: List[int] = [block[2] for block in self.blocks]
+
+    def read_turn(self, index: int) -> Dict[str, Any]:
+        if not 0 <= index < self.turn_count:
+            raise IndexError(f"Turn {index} is out of range, the conversation has {self.turn_count} turns.")
+
+        return self.read_turns(start=index, stop=index + 1)[0]
+
+    def read_turns(self, start: int = 0, stop: int | None = None) -> List[Dict[str, Any]]:
+        stop = self.turn_count if stop is None else min(stop, self.turn_count)
+        start = max(start, 0)
+        if start >= stop:
+            return []
+
+        turns: List[Dict[str, Any]] = []
+        for block_index in range(
+                bisect_right(self.__first_turn_indexes, start) - 1,
+                bisect_right(self.__first_turn_indexes, stop - 1)
+        ):
+            offset, size, first_turn_index, turn_count = self.blocks[block_index]
+            lines: List[bytes] = zlib.decompress(self.__buffer[offset:offset + size]).splitlines()
+            turns.extend(
+                json.loads(line) for line in lines[max(start - first_turn_index, 0):stop - first_turn_index]
+            )
+
+        return turns
+
+    def tail(self, count: int) -> List[Dict[str, Any]]:
+        return self.read_turns(start=self.turn_count - count)
+
+    def close(self) -> None:
+        self.__buffer.close()
+
+    def __enter__(self) -> 'ConversationArchive':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @staticmethod
+    def pack(path: str, metadata: Dict[str, Any], turns: List[Dict[str, Any]]) -> None:
+        """
+        Write the turns into a new archive, the file only appears once it is complete.
+        """
+        temporary_path: str = f'{path}.tmp'
+        blocks: List[Tuple[int, int, int, int]] = []
+
+        with open(temporary_path, 'wb') as file:
+            file.write(MAGIC)
+
+            first_turn_index: int = 0
+            while first_turn_index < len(turns):
+                lines: List[bytes] = []
+                byte_size: int = 0
+                while first_turn_index + len(lines) < len(turns) and byte_size < BLOCK_SIZE:
+                    line: bytes = json.dumps(obj=turns[first_turn_index + len(lines)], ensure_ascii=False).encode()
+                    lines.append(line)
+                    byte_size += len(line) + 1
+
+                block: bytes = zlib.compress(b'\n'.join(lines), level=9)
+                blocks.append((file.tell(), len(block), first_turn_index, len(lines),))
+                file.write(block)
+                first_turn_index += len(lines)
+
+            index: bytes = zlib.compress(json.dumps(obj={'metadata': metadata, 'blocks': blocks}).encode(), level=9)
+            index_offset: int = file.tell()
+            file.write(index)
+            file.write(TRAILER.pack(index_offset, len(index), MAGIC))
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, path)
+
+
+def is_archive(path: str) -> bool:
+    return path.endswith(ARCHIVE_SUFFIX)
+
+
+def strip_suffix(file_name: str) -> str:
+    for suffix in (FILE_SUFFIX, ARCHIVE_SUFFIX,):
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+
+    return file_name
+
+
+def read_saved_conversation(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Read the metadata and the turns of a saved conversation, whether it is archived or not.
+    """
+    if not is_archive(path):
+        return read_conversation(path=path)
+
+    with ConversationArchive(path=path) as archive:
+        return archive.metadata, archive.read_turns()
+
+
+def archive_conversation(path: str) -> str:
+    """
+    Pack a saved conversation into an archive next to it, then delete the conversation file. Return the archive path.
+    """
+    metadata, turns = read_conversation(path=path)
+    archive_path: str = f'{strip_suffix(path)}{ARCHIVE_SUFFIX}'
+
+    # the modification time is kept, it is the time the conversation was last updated.
+    modified_at: float = os.path.getmtime(path)
+    ConversationArchive.pack(path=archive_path, metadata=metadata, turns=turns)
+    os.utime(archive_path, (modified_at, modified_at,))
+    os.unlink(path)
+
+    return archive_path
+
+
+def unpack_archive(path: str) -> str:
+    """
+    Turn an archive back into a conversation file that new turns can be appended to. Return the conversation path.
+    """
+    metadata, turns = read_saved_conversation(path=path)
+    conversation_path: str = f'{strip_suffix(path)}{FILE_SUFFIX}'
+
+    temporary_path: str = f'{conversation_path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        file.write(''.join(json.dumps(obj=record, ensure_ascii=False) + '\n' for record in [metadata, *turns]))
+    os.replace(temporary_path, conversation_path)
+    os.unlink(path)
+
+    return conversation_path
+
+
+def archive_old_conversations(save_dir: str, days: int) -> List[str]:
+    """
+    Archive the conversations that were not updated for `days` days. Return the archived file names.
+    """
+    archived_file_names: List[str] = []
+    updated_before: float = time.time() - days * 24 * 60 * 60
+
+    with os.scandir(save_dir) as entries:
+        paths: List[str] = [
+            entry.path for entry in entries
+            if entry.name.endswith(FILE_SUFFIX) and entry.is_file() and entry.stat().st_mtime < updated_before
+        ]
+
+    for path in sorted(paths):
+        archive_conversation(path=path)
+        archived_file_names.append(os.path.basename(path))
+
+    return archived_file_names
+
+
+def export_conversation(path: str, output_format: str, last_turn_count: int | None = None) -> str:
+    """
+    Export a saved conversation, or its last turns, as plain JSON or as Markdown.
+    """
+    if is_archive(path):
+        with ConversationArchive(path=path) as archive:
+            metadata: Dict[str, Any] = archive.metadata
+            turns: List[Dict[str, Any]] = archive.read_turns() if last_turn_count is None else archive.tail(
+                count=last_turn_count
+            )
+    else:
+        metadata, turns = read_conversation(path=path)
+        if last_turn_count is not None:
+            turns = turns[max(len(turns) - last_turn_count, 0):]
+
+    if output_format == 'json':
+        return json.dumps(
+            obj={
+                'metadata': metadata,
+                'turns': [{'role': turn['role'], 'text': turn_to_text(turn=turn)} for turn in turns]
+            },
+            ensure_ascii=False,
+            indent=2
+        )
+
+    sections: List[str] = [f"# {strip_suffix(os.path.basename(path))}"]
+    for turn in turns:
+        role: str = 'You' if turn['role'] == 'user' else metadata.get('model_name') or 'Gemini'
+        sections.append(f"## {role}\n\n{turn_to_text(turn=turn).strip()}")
+
+    return '\n\n'.join(sections) + '\n'
+
+
+def find_saved_conversation(save_dir: str, name: str) -> str | None:
+    """
+    Find a saved conversation by its file name, with or without the suffix, in the save directory.
+
+    A path outside of the save directory is only accepted with the suffix of a conversation or an archive, so that
+    another file is not taken for a conversation.
+    """
+    if os.path.basename(name) != name:
+        if name.endswith((FILE_SUFFIX, ARCHIVE_SUFFIX,)) and os.path.isfile(name):
+            return name
+        return None
+
+    for file_name in (name, f'{name}{FILE_SUFFIX}', f'{name}{ARCHIVE_SUFFIX}',):
+        path: str = os.path.join(save_dir, file_name)
+        if file_name.endswith((FILE_SUFFIX, ARCHIVE_SUFFIX,)) and os.path.isfile(path):
+            return path
+
+    return None
+
+
+def is_saved_conversation(path: str) -> bool:
+    """
+    Check the header of a conversation file, or the magic numbers at both ends of an archive, without reading it all.
+    """
+    if not is_archive(path):
+        return is_conversation(path=path)
+
+    try:
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC or file.seek(0, os.SEEK_END) < len(MAGIC) + TRAILER.size:
+                return False
+            file.seek(-TRAILER.size, os.SEEK_END)
+            return TRAILER.unpack(file.read(TRAILER.size))[2] == MAGIC
+    except OSError:
+        return False
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+from typing import List
+
+
+class Arguments:
+    """
+    Parse the command-line arguments of Geminal.
+
+    Options are only recognized before the prompt, so a prompt can still contain words starting with '-'.
+    Use '--' to end the options explicitly, e.g. `geminal -- stats` sends 'stats' as a prompt.
+    """
+
+    def __init__(self, argv: List[str]) -> None:
+        self.version: bool = False
+        self.help: bool = False
+        self.stats: bool = False
+        self.archive: bool = False
+        self.export: str | None = None
+        self.export_format: str = 'markdown'
+        self.last: int | None = None
+        self.no_cache: bool = False
+        # 'raw' or 'json' to answer without rich, e.g. for scripts.
+        self.output_mode: str | None = None
+        self.daemon: bool = False
+        self.session: str | None = None
+        self.fan_out: List[str] = []
+        self.first_wins: bool = False
+        self.files: List[str] = []
+        self.batch: str | None = None
+        self.concurrency: int = 4
+        self.rate: float | None = None
+        self.prompt: str | None = None
+        self.error: str | None = None
+
+        self.__parse(argv=argv)
+
+    def __parse(self, argv: List[str]) -> None:
+        if len(argv) == 1 and argv[0] in ('-v', '--version',):
+            self.version = True
+            return
+        elif len(argv) == 1 and argv[0] in ('-h', '--help',):
+            self.help = True
+            return
+        elif len(argv) == 1 and argv[0] == 'stats':
+            self.stats = True
+            return
+        elif len(argv) == 1 and argv[0] == 'archive':
+            self.archive = True
+            return
+
+        index: int = 0
+        while index < len(argv):
+            argument: str = argv[index]
+
+            if argument == '--':
+                index += 1
+                break
+            elif argument == '--no-cache':
+                self.no_cache = True
+            elif argument == '--daemon':
+                self.daemon = True
+            elif argument == '--first-wins':
+                self.first_wins = True
+            elif argument in ('--raw', '--json',):
+                if self.output_mode is not None:
+                    self.error = 'The options --raw and --json cannot be used together.'
+                    return
+                self.output_mode = argument[2:]
+            elif argument in (
+                    '-f', '--file', '--batch', '--concurrency', '--rate', '--session', '--fan-out', '--export', '--format',
+                    '--last',
+            ):
+                if index + 1 >= len(argv):
+                    self.error = f"Missing value for the option: {argument}"
+                    return
+
+                index += 1
+                if not self.__set_value(option=argument, value=argv[index]):
+                    return
+            elif argument.startswith('--'):
+                self.error = f"Unknown option: {argument}"
+                return
+            else:
+                break
+
+            index += 1
+
+        if argv[index:]:
+            self.prompt = ' '.join(argv[index:])
+
+        if self.daemon and (self.prompt is not None or self.batch is not None):
+            self.error = 'The option --daemon does not take a prompt.'
+        elif self.session is not None and self.prompt is None:
+            self.error = 'The option --session needs a prompt.'
+        elif self.first_wins and len(self.fan_out) == 0:
+            self.error = 'The option --first-wins needs --fan-out.'
+        elif len(self.files) != 0 and self.prompt is None:
+            self.error = 'The option --file needs a prompt.'
+        elif self.export is not None and self.prompt is not None:
+            self.error = 'The option --export does not take a prompt.'
+        elif self.export is None and (self.export_format != 'markdown' or self.last is not None):
+            self.error = 'The options --format and --last need --export.'
+        elif self.output_mode is not None and self.prompt is None:
+            self.error = f"The option --{self.output_mode} needs a prompt."
+        elif self.output_mode is not None and (len(self.fan_out) != 0 or self.session is not None):
+            self.error = f"The option --{self.output_mode} cannot be used with --fan-out or --session."
+
+    def __set_value(self, option: str, value: str) -> bool:
+        try:
+            match option:
+                case '-f' | '--file':
+                    self.files.append(value)
+                case '--batch':
+                    self.batch = value
+                case '--session':
+                    self.session = value
+                case '--fan-out':
+                    self.fan_out = [name.strip() for name in value.split(',') if name.strip() != '']
+                    if len(self.fan_out) < 2:
+                        raise ValueError(value)
+                case '--concurrency':
+                    self.concurrency = int(value)
+                    if self.concurrency < 1:
+                        raise ValueError(value)
+                case '--rate':
+                    self.rate = float(value)
+                    if self.rate <= 0:
+                        raise ValueError(value)
+                case '--export':
+                    self.export = value
+                case '--format':
+                    if value not in ('json', 'markdown',):
+                        raise ValueError(value)
+                    self.export_format = value
+                case '--last':
+                    self.last = int(value)
+                    if self.last < 1:
+                        raise ValueError(value)
+        except ValueError:
+            self.error = f"Invalid value for the option {option}: {value}"
+            return False
+
+        return True
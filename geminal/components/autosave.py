@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import atexit
+import fcntl
+import os
+import time
+from queue import Queue
+from threading import Lock, Thread
+from typing import Dict, IO, List, Sequence, TYPE_CHECKING
+
+from .config import conf
+from .console import log_error
+from .conversation import FILE_SUFFIX, Conversation
+from .gemini import model_name
+
+if TYPE_CHECKING:
+    from .turns import Turn
+
+
+class Autosave:
+    """
+    Save the conversation to a session file after every turn, so that a crash or a dropped connection does not lose it.
+
+    The turns are appended by a background thread, so the chat loop never waits for the disk. The snapshots that are
+    queued while a write is in progress are written together, with a single fsync. A line that was only partially
+    written is dropped when the session file is read again.
+    """
+
+    def __init__(self, sessions_dir: str, session_count: int) -> None:
+        self.sessions_dir: str = sessions_dir
+        # the number of session files that are kept, the older ones are deleted.
+        self.session_count: int = max(session_count, 1)
+        self.conversation: Conversation | None = None
+
+        self.__snapshots: Queue = Queue()
+        self.__lock: Lock = Lock()
+        self.__thread: Thread | None = None
+        self.__session_file: IO | None = None
+        self.__failed: bool = False
+
+    def save(self, history: Sequence['Turn']) -> None:
+        """
+        Queue a snapshot of the chat history, the turns that are not in the session file yet are appended.
+        """
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = Thread(target=self.__run, name='geminal-autosave', daemon=True)
+                self.__thread.start()
+                atexit.register(self.flush)
+
+        self.__snapshots.put(list(history))
+
+    def flush(self) -> None:
+        """
+        Wait until the queued snapshots are written.
+        """
+        self.__snapshots.join()
+
+    def discard(self) -> None:
+        """
+        Delete the session file of the current conversation, so that it is not offered to be resumed on the next start.
+        """
+        self.flush()
+
+        with self.__lock:
+            if self.conversation is None:
+                return
+
+            path: str = self.conversation.path
+            self.conversation = None
+            if self.__session_file is not None:
+                self.__session_file.close()
+                self.__session_file = None
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def resume(self, path: str) -> List[Dict]:
+        """
+        Continue the session of a previous run in its own file, and return its turns.
+        """
+        # the partial last line is only removed once no other Geminal can be appending to the session.
+        self.__lock_session(path=path)
+        self.conversation, turns = Conversation.open(path=path)
+
+        return turns
+
+    def find_last_session(self) -> str | None:
+        """
+        Return the path of the latest session file that is not used by another running Geminal.
+        """
+        for path in self.__list_sessions():
+            if not is_locked(path=path):
+                return path
+
+        return None
+
+    def __run(self) -> None:
+        while True:
+            history: List['Turn'] = self.__snapshots.get()
+            snapshot_count: int = 1
+            # the latest snapshot contains the turns of the ones that were queued before it.
+            while not self.__snapshots.empty():
+                history = self.__snapshots.get_nowait()
+                snapshot_count += 1
+
+            try:
+                self.__write(history=history)
+            except Exception as e:
+                # the error is shown once, the next turns are still tried.
+                if not self.__failed:
+                    self.__failed = True
+                    log_error(message=f"Unable to autosave the conversation: {repr(e)}")
+            finally:
+                for _ in range(snapshot_count):
+                    self.__snapshots.task_done()
+
+    def __write(self, history: List['Turn']) -> None:
+        if len(history) == 0:
+            return
+
+        # the session file is created with the first turn, so a run without any prompt leaves no file behind.
+        if self.conversation is None:
+            os.makedirs(name=self.sessions_dir, exist_ok=True)
+            self.__delete_old_sessions()
+
+            path: str = os.path.join(self.sessions_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{FILE_SUFFIX}")
+            self.conversation = Conversation.create(path=path, model_name=model_name)
+            self.__lock_session(path=path)
+
+        self.conversation.sync(history=history, fsync=True)
+
+    def __lock_session(self, path: str) -> None:
+        # the lock is held until the program exits, so another Geminal does not resume a session that is in use.
+        self.__session_file = open(path, 'rb')
+        fcntl.flock(self.__session_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def __list_sessions(self) -> List[str]:
+        """
+        List the session files, the latest first.
+        """
+        try:
+            paths: List[str] = [
+                entry.path for entry in os.scandir(self.sessions_dir) if entry.name.endswith(FILE_SUFFIX)
+            ]
+        except FileNotFoundError:
+            return []
+
+        return sorted(paths, key=os.path.getmtime, reverse=True)
+
+    def __delete_old_sessions(self) -> None:
+        for path in self.__list_sessions()[self.session_count - 1:]:
+            if not is_locked(path=path):
+                os.remove(path)
+
+
+def is_locked(path: str) -> bool:
+    try:
+        with open(path, 'rb') as file:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+    return False
+
+
+autosave: Autosave | None = None
+
+
+def get_autosave() -> Autosave | None:
+    global autosave
+
+    if not conf['settings']['autosave']:
+        return None
+
+    if autosave is None:
+        autosave = Autosave(
+            sessions_dir=conf['settings']['sessions_dir'],
+            session_count=conf['settings']['autosave_session_count']
+        )
+
+    return autosave
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, Generator, List, TextIO, Tuple
+
+from .gemini import get_model, model_name
+from .scheduler import TokenBucket
+
+
+def read_prompts(source: TextIO) -> Generator[Tuple[int, str | None, str | None], Any, None]:
+    """
+    Read one prompt per line, either as plain text or as a JSON object with a "prompt" key.
+
+    Yield the index of the prompt, the prompt and an error message if the line could not be parsed.
+    Empty lines are skipped and do not take an index.
+    """
+    index: int = 0
+    for line in source:
+        line = line.strip()
+        if line == '':
+            continue
+
+        if line.startswith('{'):
+            try:
+                prompt: Any = json.loads(line)['prompt']
+                if not isinstance(prompt, str):
+                    raise ValueError('"prompt" must be a string')
+                yield index, prompt, None
+            except (ValueError, KeyError, TypeError,) as e:
+                yield index, None, f"Invalid JSON line: {repr(e)}"
+        else:
+            yield index, line, None
+
+        index += 1
+
+
+async def run_batch(source: TextIO, output: TextIO, concurrency: int, rate: float | None) -> int:
+    """
+    Send every prompt from `source` concurrently and write the results to `output` as JSON lines,
+    in completion order. Return the number of failed prompts.
+    """
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+    token_bucket: TokenBucket | None = TokenBucket(rate=rate, capacity=max(rate, 1)) if rate else None
+
+    async def generate(index: int, prompt: str | None, error: str | None) -> Dict[str, Any]:
+        result: Dict[str, Any] = {'index': index, 'prompt': prompt, 'model': model_name}
+        if error is not None:
+            return {**result, 'error': error}
+
+        async with semaphore:
+            if token_bucket is not None:
+                await token_bucket.acquire_async()
+
+            start_time: float = time.perf_counter()
+            try:
+                response = await get_model().generate_content_async(prompt)
+                return {**result, 'text': response.text, 'latency': time.perf_counter() - start_time}
+            except Exception as e:
+                return {**result, 'error': repr(e), 'latency': time.perf_counter() - start_time}
+
+    tasks: List[asyncio.Task] = [
+        asyncio.create_task(generate(index=index, prompt=prompt, error=error))
+        for index, prompt, error in read_prompts(source=source)
+    ]
+
+    failures: int = 0
+    for task in asyncio.as_completed(tasks):
+        result: Dict[str, Any] = await task
+        if 'error' in result:
+            failures += 1
+
+        output.write(json.dumps(obj=result, ensure_ascii=False) + '\n')
+        output.flush()
+
+    return failures
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, List
+
+from .config import conf
+
+
+class ResponseCache:
+    """
+    A content-addressed cache of model responses, stored in a SQLite database.
+
+    Entries expire after `ttl` seconds, and the least recently used entries are evicted when the total size of the
+    responses exceeds `max_size` bytes. SQLite locking makes the cache safe to share between several processes, and
+    the connection is shared by the threads that answer prompts under a lock.
+    """
+
+    def __init__(self, path: str, ttl: int, max_size: int) -> None:
+        self.path: str = path
+        self.ttl: int = ttl
+        self.max_size: int = max_size
+        self.__connection: sqlite3.Connection | None = None
+        self.__lock: Lock = Lock()
+
+    @staticmethod
+    def make_key(model_name: str, chat_history: List[Dict[str, str]], user_prompt: str) -> str:
+        payload: str = json.dumps(
+            obj=[model_name, chat_history, user_prompt],
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(',', ':',)
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self.__lock:
+            return self.__get(key=key)
+
+    def put(self, key: str, model_name: str, response: str) -> None:
+        with self.__lock:
+            self.__put(key=key, model_name=model_name, response=response)
+
+    def __get(self, key: str) -> str | None:
+        connection: sqlite3.Connection = self.__connect()
+        now: float = time.time()
+
+        with connection:
+            row: tuple | None = connection.execute(
+                'SELECT response, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response, created_at = row
+            if now - created_at > self.ttl:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                return None
+
+            connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key,))
+
+        return response
+
+    def __put(self, key: str, model_name: str, response: str) -> None:
+        connection: sqlite3.Connection = self.__connect()
+        now: float = time.time()
+
+        with connection:
+            # take the write lock up front, so that eviction sees a consistent total size.
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT OR REPLACE INTO responses (key, model_name, response, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model_name, response, len(response.encode('utf-8')), now, now,)
+            )
+            self.__evict(connection=connection, now=now)
+
+    def __evict(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+
+        total_size: int = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        rows: List[tuple] = connection.execute(
+            'SELECT key, size FROM responses ORDER BY accessed_at ASC'
+        ).fetchall()
+
+        evicted_keys: List[tuple] = []
+        for key, size in rows:
+            if total_size <= self.max_size:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+
+        connection.executemany('DELETE FROM responses WHERE key = ?', evicted_keys)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__connection is None:
+            os.makedirs(name=os.path.dirname(self.path), exist_ok=True)
+
+            # autocommit mode, transactions are opened explicitly or by the `with` blocks above.
+            self.__connection = sqlite3.connect(
+                database=self.path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, '
+                'model_name TEXT NOT NULL, '
+                'response TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'created_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL)'
+            )
+            self.__connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+
+        return self.__connection
+
+
+response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    global response_cache
+
+    if response_cache is None:
+        response_cache = ResponseCache(
+            path=conf['settings']['response_cache_path'],
+            ttl=conf['settings']['response_cache_ttl'],
+            max_size=conf['settings']['response_cache_max_size']
+        )
+
+    return response_cache
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List
+
+from .archive import ARCHIVE_SUFFIX, read_saved_conversation, strip_suffix
+from .config import conf
+from .conversation import FILE_SUFFIX, Conversation, turn_to_text
+from .utils import to_capitalized_plain_text
+
+PREVIEW_LENGTH: int = 200
+
+
+class Catalog:
+    """
+    An index of the saved conversations, with a full-text index of their messages, stored in a SQLite database.
+
+    The catalog is updated incrementally when a conversation is saved or deleted, and `sync` re-indexes the files
+    that were changed on disk by something else.
+    """
+
+    def __init__(self, path: str, save_dir: str) -> None:
+        self.path: str = path
+        self.save_dir: str = save_dir
+        self.__connection: sqlite3.Connection | None = None
+
+    def record(self, conversation: Conversation, turns: List[Dict[str, Any]]) -> None:
+        """
+        Add the newly saved turns of a conversation to the catalog.
+        """
+        connection: sqlite3.Connection = self.__connect()
+        file_name: str = os.path.basename(conversation.path)
+        stat: os.stat_result = os.stat(conversation.path)
+        first_turn_index: int = conversation.turn_count - len(turns)
+
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row: tuple | None = connection.execute(
+                'SELECT preview FROM conversations WHERE file_name = ?', (file_name,)
+            ).fetchone()
+
+            preview: str = row[0] if row is not None else ''
+            if preview == '':
+                preview = get_preview(turns=turns)
+
+            connection.execute(
+                'INSERT OR REPLACE INTO conversations '
+                '(file_name, title, model_name, turn_count, byte_size, created_at, updated_at, mtime, preview) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    file_name,
+                    to_capitalized_plain_text(s=strip_suffix(file_name=file_name)),
+                    conversation.metadata.get('model_name'),
+                    conversation.turn_count,
+                    stat.st_size,
+                    conversation.metadata.get('created_at') or stat.st_mtime,
+                    stat.st_mtime,
+                    stat.st_mtime_ns,
+                    preview,
+                )
+            )
+            connection.executemany(
+                'INSERT INTO messages (text, file_name, turn_index) VALUES (?, ?, ?)',
+                [
+                    (turn_to_text(turn=turn), file_name, first_turn_index + index,)
+                    for index, turn in enumerate(turns)
+                ]
+            )
+
+    def remove(self, file_name: str) -> None:
+        connection: sqlite3.Connection = self.__connect()
+
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM conversations WHERE file_name = ?', (file_name,))
+            connection.execute('DELETE FROM messages WHERE file_name = ?', (file_name,))
+
+    def sync(self) -> None:
+        """
+        Re-index the conversation files that were added, changed or removed since they were last indexed.
+
+        The catalog is rebuilt from the files on disk if its database is corrupted.
+        """
+        try:
+            self.__sync()
+        except sqlite3.DatabaseError:
+            self.__reset()
+            self.__sync()
+
+    def __sync(self) -> None:
+        connection: sqlite3.Connection = self.__connect()
+
+        indexed: Dict[str, tuple] = {
+            file_name: (byte_size, mtime)
+            for file_name, byte_size, mtime in connection.execute(
+                'SELECT file_name, byte_size, mtime FROM conversations'
+            )
+        }
+
+        on_disk: Dict[str, tuple] = {}
+        with os.scandir(self.save_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith((FILE_SUFFIX, ARCHIVE_SUFFIX,)) and entry.is_file():
+                    stat: os.stat_result = entry.stat()
+                    on_disk[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        for file_name in indexed.keys() - on_disk.keys():
+            self.remove(file_name=file_name)
+
+        for file_name, (byte_size, mtime) in on_disk.items():
+            if indexed.get(file_name) == (byte_size, mtime):
+                continue
+
+            self.remove(file_name=file_name)
+            path: str = os.path.join(self.save_dir, file_name)
+            try:
+                metadata, turns = read_saved_conversation(path=path)
+            except (OSError, ValueError,):
+                continue
+
+            self.record(conversation=Conversation(path=path, metadata=metadata, turn_count=len(turns)), turns=turns)
+
+    def __reset(self) -> None:
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+        for suffix in ('', '-wal', '-shm',):
+            if os.path.exists(f'{self.path}{suffix}'):
+                os.unlink(f'{self.path}{suffix}')
+
+    def search(self, query: str = '') -> List[Dict[str, Any]]:
+        """
+        Return the conversations whose messages match every word of the query, most recently updated first.
+
+        An empty query returns every conversation.
+        """
+        connection: sqlite3.Connection = self.__connect()
+        columns: str = (
+            'c.file_name, c.title, c.model_name, c.turn_count, c.byte_size, c.created_at, c.updated_at, c.preview'
+        )
+
+        if query.strip() == '':
+            rows: List[tuple] = connection.execute(
+                f'SELECT {columns} FROM conversations AS c ORDER BY c.updated_at DESC'
+            ).fetchall()
+        else:
+            rows = connection.execute(
+                f'SELECT {columns} FROM conversations AS c '
+                f'WHERE c.file_name IN (SELECT file_name FROM messages WHERE messages MATCH ?) '
+                f'OR c.title LIKE ? '
+                f'ORDER BY c.updated_at DESC',
+                (to_match_expression(query=query), f'%{query.strip()}%',)
+            ).fetchall()
+
+        keys: List[str] = [
+            'file_name', 'title', 'model_name', 'turn_count', 'byte_size', 'created_at', 'updated_at', 'preview'
+        ]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__connection is None:
+            os.makedirs(name=os.path.dirname(self.path), exist_ok=True)
+
+            # autocommit mode, write transactions are opened explicitly with `BEGIN IMMEDIATE`.
+            self.__connection = sqlite3.connect(database=self.path, timeout=30, isolation_level=None)
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS conversations ('
+                'file_name TEXT PRIMARY KEY, '
+                'title TEXT NOT NULL, '
+                'model_name TEXT, '
+                'turn_count INTEGER NOT NULL, '
+                'byte_size INTEGER NOT NULL, '
+                'created_at REAL NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'mtime INTEGER NOT NULL, '
+                'preview TEXT NOT NULL)'
+            )
+            self.__connection.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(text, file_name UNINDEXED, turn_index UNINDEXED)'
+            )
+
+        return self.__connection
+
+
+def get_preview(turns: List[Dict[str, Any]]) -> str:
+    for turn in turns:
+        if turn['role'] == 'user':
+            return ' '.join(turn_to_text(turn=turn).split())[:PREVIEW_LENGTH]
+
+    return ''
+
+
+def to_match_expression(query: str) -> str:
+    """
+    Quote every word of the query, so that FTS5 operators typed by the user are searched as plain text.
+
+    The last word is matched as a prefix, to filter while typing.
+    """
+    words: List[str] = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    words[-1] += '*'
+    return ' '.join(words)
+
+
+def format_time(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+
+catalog: Catalog | None = None
+
+
+def get_catalog() -> Catalog:
+    global catalog
+
+    if catalog is None:
+        catalog = Catalog(path=conf['settings']['catalog_path'], save_dir=conf['settings']['save_dir'])
+
+    return catalog
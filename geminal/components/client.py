@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import json
+import os
+import shutil
+import socket
+import sys
+from typing import Any, Dict, List
+
+# this module is the whole `geminal-client` command, so it only imports the standard library to start quickly.
+
+
+def get_socket_path() -> str:
+    """
+    Get the socket of the daemon, the same as conf['settings']['daemon_socket_path'] without importing the config.
+    """
+    socket_path: str = os.environ.get(
+        'GEMINAL_SOCKET',
+        os.path.join(os.path.expanduser('~'), '.geminal', 'daemon.sock')
+    )
+    return socket_path
+
+
+def forward_prompt(socket_path: str, user_prompt: str, session: str, use_cache: bool = True) -> bool:
+    """
+    Send a prompt to the daemon and copy the rendered response to stdout as it arrives.
+
+    The daemon expands the @repo marker with the repository of the working directory, and only uses the response cache
+    if `use_cache` is set and the cache is enabled.
+
+    Return False if no daemon is listening on the socket.
+    """
+    connection: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        return False
+
+    terminal_size: os.terminal_size = shutil.get_terminal_size()
+    request: Dict[str, Any] = {
+        'prompt': user_prompt,
+        'session': session,
+        'cwd': os.getcwd(),
+        'cache': use_cache,
+        'width': terminal_size.columns,
+        'height': terminal_size.lines,
+        'terminal': sys.stdout.isatty()
+    }
+
+    with connection:
+        connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        connection.shutdown(socket.SHUT_WR)
+
+        while True:
+            data: bytes = connection.recv(64 * 1024)
+            if not data:
+                break
+
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+    return True
+
+
+def run() -> None:
+    """
+    Usage: geminal-client [--session NAME] PROMPT
+    """
+    argv: List[str] = sys.argv[1:]
+    session: str = 'default'
+
+    if len(argv) >= 2 and argv[0] == '--session':
+        session = argv[1]
+        argv = argv[2:]
+    if len(argv) != 0 and argv[0] == '--':
+        argv = argv[1:]
+
+    if len(argv) == 0:
+        sys.stderr.write('Usage: geminal-client [--session NAME] PROMPT\n')
+        sys.exit(2)
+
+    socket_path: str = get_socket_path()
+    try:
+        if not forward_prompt(socket_path=socket_path, user_prompt=' '.join(argv), session=session):
+            sys.stderr.write(f'No daemon is listening on {socket_path}, start one with `geminal --daemon`.\n')
+            sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(130)
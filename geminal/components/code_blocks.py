@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import functools
+import re
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pygments.formatter import Formatter
+    from pygments.lexer import Lexer
+
+# a fence only counts at the beginning of a line, see `__scan`. a closing fence has nothing but backticks and spaces.
+FENCE_PATTERN: re.Pattern = re.compile(pattern=r'(```+)(\w*)([^\n]*)(?:\n|\Z)')
+
+
+class CodeBlock:
+    def __init__(self, index: int, language: str, code: str, offset: int) -> None:
+        self.index: int = index
+        self.language: str = language
+        self.code: str = code
+        # position of the opening fence in the response.
+        self.offset: int = offset
+        self.line_count: int = code.count('\n') + (0 if code.endswith('\n') or len(code) == 0 else 1)
+
+    @property
+    def label(self) -> str:
+        return (
+            f"[{self.index + 1}] {self.language or '_'} "
+            f"({self.line_count} {'line' if self.line_count == 1 else 'lines'})"
+        )
+
+
+class CodeBlockIndex:
+    """
+    The fenced code blocks of a response, in the order they appear.
+
+    The response can be fed chunk by chunk while it is streamed, then `finish` is called once it is complete. Fences
+    only count at the beginning of a line, as in Markdown, so the complete lines of every chunk are scanned once and
+    only the line that is not complete yet is kept in a buffer, besides the code of the block that is open.
+    """
+
+    def __init__(self) -> None:
+        self.blocks: List[CodeBlock] = []
+
+        self.__chunks: List[str] = []
+        self.__buffer: str = ''
+        self.__buffer_offset: int = 0
+        self.__open_offset: int | None = None
+        self.__open_language: str = ''
+        self.__code_parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        if len(self.__chunks) > 1:
+            self.__chunks = [''.join(self.__chunks)]
+
+        return self.__chunks[0] if len(self.__chunks) != 0 else ''
+
+    @classmethod
+    def from_text(cls, text: str) -> 'CodeBlockIndex':
+        code_block_index: CodeBlockIndex = cls()
+        code_block_index.feed(chunk=text)
+        code_block_index.finish()
+        return code_block_index
+
+    def feed(self, chunk: str) -> None:
+        self.__chunks.append(chunk)
+
+        end: int = chunk.rfind('\n')
+        if end == -1:
+            self.__buffer += chunk
+            return
+
+        lines: str = self.__buffer + chunk[:end + 1]
+        self.__buffer = chunk[end + 1:]
+        self.__scan(lines=lines)
+
+    def finish(self) -> None:
+        """
+        Scan the last line, and close the block that is still open at the end of the response, as Markdown does.
+        """
+        if self.__buffer != '':
+            self.__scan(lines=self.__buffer)
+            self.__buffer = ''
+
+        if self.__open_offset is not None:
+            self.__close_block()
+
+    def __scan(self, lines: str) -> None:
+        # the code of a block is cut out between its fences, the other lines are skipped.
+        position: int = 0
+        for match in FENCE_PATTERN.finditer(lines):
+            # searching for the backticks is much faster than matching every line, the indentation is checked here.
+            line_start: int = lines.rfind('\n', 0, match.start()) + 1
+            if lines[line_start:match.start()].strip(' \t') != '':
+                continue
+
+            if self.__open_offset is None:
+                self.__open_offset = self.__buffer_offset + match.start(1)
+                self.__open_language = match.group(2)
+            elif match.group(2) == '' and match.group(3).strip() == '':
+                # the indentation of the closing fence is not part of the code.
+                self.__code_parts.append(lines[position:line_start])
+                self.__close_block()
+            else:
+                continue
+
+            position = match.end()
+
+        if self.__open_offset is not None and position < len(lines):
+            self.__code_parts.append(lines[position:])
+
+        self.__buffer_offset += len(lines)
+
+    def __close_block(self) -> None:
+        self.blocks.append(CodeBlock(
+            index=len(self.blocks),
+            language=self.__open_language,
+            code=''.join(self.__code_parts),
+            offset=self.__open_offset
+        ))
+        self.__open_offset = None
+        self.__open_language = ''
+        self.__code_parts = []
+
+
+last_code_block_index: CodeBlockIndex | None = None
+
+
+def get_code_block_index(text: str) -> CodeBlockIndex:
+    """
+    Get the code block index of a response, the index of the last response is reused when it is the same text.
+    """
+    global last_code_block_index
+
+    if last_code_block_index is None or last_code_block_index.text != text:
+        last_code_block_index = CodeBlockIndex.from_text(text=text)
+
+    return last_code_block_index
+
+
+def set_code_block_index(code_block_index: CodeBlockIndex) -> None:
+    global last_code_block_index
+
+    last_code_block_index = code_block_index
+
+
+@functools.lru_cache(maxsize=None)
+def get_lexer(name: str) -> 'Lexer':
+    from pygments import lexers
+
+    try:
+        return lexers.get_lexer_by_name(_alias=name, stripnl=False, stripall=False)
+    except (Exception,):
+        return lexers.get_lexer_by_name(_alias='text', stripnl=False, stripall=False)
+
+
+@functools.lru_cache(maxsize=None)
+def get_formatter() -> 'Formatter':
+    from pygments import formatters
+
+    return formatters.TerminalFormatter(bg='dark')  # dark or light
+
+
+@functools.lru_cache(maxsize=64)
+def highlight_code(code: str, language: str) -> str:
+    from pygments import highlight
+
+    highlighted_code: str = highlight(code=code, lexer=get_lexer(name=language or 'text'), formatter=get_formatter())
+    return highlighted_code
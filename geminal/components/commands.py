@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+from typing import Dict
+
+# the actions that can be run from the prompt, by typing their slash command or by pressing Ctrl-X and their key.
+# they are run by `Action.run_command`, the menus are only built when an action asks for one.
+commands: Dict[str, str] = {
+    '/copy': 'Copies the last message to your clipboard',
+    '/code': 'Copies a code block from the last message to your clipboard',
+    '/new': 'Starts a new conversation',
+    '/save': 'Saves the current conversation',
+    '/load': 'Loads a saved conversation',
+    '/delete': 'Deletes a saved conversation',
+    '/earlier': 'Shows earlier messages of the loaded conversation',
+    '/menu': 'Shows the menu of all actions',
+    '/help': 'Shows the list of actions',
+    '/quit': 'Quits the program'
+}
+command_keys: Dict[str, str] = {
+    '/copy': 'c',
+    '/code': 'b',
+    '/new': 'n',
+    '/save': 's',
+    '/load': 'o',
+    '/menu': 'm',
+    '/quit': 'q'
+}
+
+
+def is_command(user_prompt: str) -> bool:
+    return user_prompt in commands
@@ -57,6 +57,36 @@ def get_or_none(key: str) -> str | None:
     return value
 
 
+def get_bool_or_default(key: str, default: bool) -> bool:
+    """
+    Get a boolean value from environment variable or default if it does not exist.
+
+    The values 'true', '1', 'yes' and 'on' (case-insensitive) are considered as True.
+    """
+    value: str | None = __get(key, default=None)
+    if value is None:
+        return default
+
+    return value.strip().lower() in ('true', '1', 'yes', 'on',)
+
+
+def get_int_or_default(key: str, default: int) -> int:
+    """
+    Get an integer value from environment variable or default if it does not exist or is not an integer.
+    """
+    value: str | None = __get(key, default=None)
+    if value is None:
+        return default
+
+    try:
+        return int(value)
+    except ValueError:
+        log_error(
+            message=f"The \[{key}] environment variable must be an integer. Using the default value: {default}."
+        )  # noqa: disable=W605
+        return default
+
+
 def get_or_error(key: str) -> str:
     """
     Get a value from environment variable or raise an exception and quit the program if it does not exist.
@@ -71,6 +101,8 @@ def get_or_error(key: str) -> str:
         quit_program()
 
 
+home_dir: str = os.path.join(os.environ['HOME'], '.geminal')
+
 conf = {
     'app': {
         'name': 'Geminal',
@@ -78,8 +110,39 @@ conf = {
         'author': 'nhattdm'
     },
     'settings': {
-        'api_key': get_or_error('GOOGLE_API_KEY'),
         'model_name': get_or_default(key='MODEL_NAME', default='gemini-pro'),
-        'save_dir': os.path.join(os.environ['HOME'], '.geminal', 'conversations')
+        'stream_response': get_bool_or_default(key='STREAM_RESPONSE', default=True),
+        'context_token_budget': get_int_or_default(key='CONTEXT_TOKEN_BUDGET', default=0),
+        'context_policy': get_or_default(key='CONTEXT_POLICY', default='sliding'),
+        'context_pinned_turn_count': get_int_or_default(key='CONTEXT_PINNED_TURNS', default=2),
+        'save_dir': os.path.join(home_dir, 'conversations'),
+        'catalog_path': os.path.join(home_dir, 'catalog.sqlite3'),
+        'history_memory_limit': get_int_or_default(key='HISTORY_MEMORY_LIMIT', default=16 * 1024 * 1024),
+        'loaded_message_count': get_int_or_default(key='LOADED_MESSAGE_COUNT', default=10),
+        'archive_after_days': get_int_or_default(key='ARCHIVE_AFTER_DAYS', default=30),
+        'autosave': get_bool_or_default(key='AUTOSAVE', default=True),
+        'sessions_dir': os.path.join(home_dir, 'sessions'),
+        'autosave_session_count': get_int_or_default(key='AUTOSAVE_SESSION_COUNT', default=10),
+        'response_cache': get_bool_or_default(key='RESPONSE_CACHE', default=False),
+        'response_cache_path': os.path.join(home_dir, 'cache.sqlite3'),
+        'response_cache_ttl': get_int_or_default(key='RESPONSE_CACHE_TTL', default=24 * 60 * 60),
+        'response_cache_max_size': get_int_or_default(key='RESPONSE_CACHE_MAX_SIZE', default=64 * 1024 * 1024),
+        'metrics': get_bool_or_default(key='METRICS', default=True),
+        'metrics_path': os.path.join(home_dir, 'metrics.jsonl'),
+        'metrics_max_size': get_int_or_default(key='METRICS_MAX_SIZE', default=8 * 1024 * 1024),
+        'metrics_textfile': get_or_none(key='METRICS_TEXTFILE'),
+        'max_retries': get_int_or_default(key='MAX_RETRIES', default=3),
+        'retry_base_delay': get_int_or_default(key='RETRY_BASE_DELAY', default=1),
+        'retry_max_delay': get_int_or_default(key='RETRY_MAX_DELAY', default=30),
+        'request_rate': get_int_or_default(key='REQUEST_RATE', default=0),
+        'hedge_requests': get_bool_or_default(key='HEDGE_REQUESTS', default=False),
+        'ingest_chunk_tokens': get_int_or_default(key='INGEST_CHUNK_TOKENS', default=0),
+        'ingest_concurrency': get_int_or_default(key='INGEST_CONCURRENCY', default=4),
+        'repo_index_dir': os.path.join(home_dir, 'indexes'),
+        'repo_snippet_count': get_int_or_default(key='REPO_SNIPPET_COUNT', default=5),
+        'repo_index_refresh_interval': get_int_or_default(key='REPO_INDEX_REFRESH_INTERVAL', default=60),
+        'warm_up': get_bool_or_default(key='WARM_UP', default=True),
+        'keep_alive_interval': get_int_or_default(key='KEEP_ALIVE_INTERVAL', default=60),
+        'daemon_socket_path': get_or_default(key='GEMINAL_SOCKET', default=os.path.join(home_dir, 'daemon.sock'))
     }
 }
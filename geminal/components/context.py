@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import time
+from typing import Any, Dict, List, Sequence, TYPE_CHECKING
+
+from .config import conf
+from .gemini import get_chat, get_chat_history, model_name
+from .scheduler import get_request_scheduler, RequestCancelled
+from .turns import get_role_and_text, Turn, TurnHistory
+
+if TYPE_CHECKING:
+    from threading import Event
+
+    from google.generativeai import ChatSession
+    from google.generativeai.protos import Content
+    from google.generativeai.types import GenerateContentResponse
+
+# input token limits of the supported models.
+context_limits: Dict[str, int] = {
+    'gemini-pro': 30720,
+    'models/gemini-pro': 30720,
+    'gemini-1.0-pro-latest': 30720,
+    'gemini-1.0-pro': 30720,
+    'gemini-1.0-pro-001': 30720,
+    'models/gemini-1.5-pro-latest': 1048576,
+}
+
+policies: List[str] = ['sliding', 'pinned', 'summary']
+
+SUMMARY_PROMPT: str = (
+    'Summarize the conversation below for your own future reference in at most {word_count} words. Keep every fact, '
+    'name, decision and piece of code that may matter later. Answer with the summary only.'
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # about 4 bytes of English text per token, which errs on the safe side for code.
+    return len(text.encode('utf-8')) // 4 + 1
+
+
+def content_to_text(content: 'Content | Turn') -> str:
+    _, text = get_role_and_text(content=content)
+    return text
+
+
+class ContextWindow:
+    """
+    Keep the history that is sent with each prompt within a token budget.
+
+    The whole conversation stays in the chat history, only the turns that are sent to the model are selected by the
+    policy: 'sliding' keeps the most recent turns, 'pinned' also keeps the first `pinned_turn_count` turns, and
+    'summary' replaces the older turns with a running summary written by the model.
+
+    The chat history is the one of the chat session, unless another one is given, e.g. a `TurnHistory`.
+    """
+
+    def __init__(
+            self,
+            chat: 'ChatSession',
+            budget: int,
+            policy: str,
+            pinned_turn_count: int,
+            history: 'TurnHistory | List[Content] | None' = None
+    ) -> None:
+        self.chat: 'ChatSession' = chat
+        self.history: 'TurnHistory | List[Content]' = history if history is not None else chat.history
+        self.budget: int = budget
+        self.policy: str = policy if policy in policies else 'sliding'
+        # turns are dropped by request/response pairs, so that the roles keep alternating.
+        self.pinned_turn_count: int = pinned_turn_count + pinned_turn_count % 2
+        self.token_count: int = 0
+        # seconds spent selecting the turns of the last request, including the summary request of the summary policy.
+        self.select_time: float = 0.0
+
+        self.__token_counts: Dict[int, int] = {}
+        self.__summary: str = ''
+        self.__summarized_turn_count: int = 0
+
+    def count_tokens(self, content: 'Content | Turn') -> int:
+        if isinstance(content, Turn):
+            # the same estimate as `estimate_tokens`, from the size of the text, which may have been spilled to disk.
+            if content.token_count == 0:
+                content.token_count = content.size // 4 + 1
+
+            return content.token_count
+
+        text: str = content_to_text(content=content)
+        key: int = hash((content.role, text,))
+
+        if key not in self.__token_counts:
+            self.__token_counts[key] = estimate_tokens(text=text)
+
+        return self.__token_counts[key]
+
+    def send_message(
+            self,
+            user_prompt: str,
+            stream: bool = False,
+            cancel_event: 'Event | None' = None
+    ) -> 'GenerateContentResponse':
+        """
+        Send the prompt with the turns selected by the policy, instead of the whole chat history.
+
+        The request does not change the chat history, so the scheduler can retry or hedge it. The request/response pair
+        is appended to the whole chat history by `commit`, right away for a response that is not streamed, and by the
+        caller once a streamed response has been received completely. A failed or cancelled request leaves no turn
+        behind.
+        """
+        select_start: float = time.perf_counter()
+        window: List[Any] = self.select(history=self.history, user_prompt=user_prompt, cancel_event=cancel_event)
+        self.select_time = time.perf_counter() - select_start
+
+        # the turns of a `TurnHistory` are only materialized for the request.
+        contents: List[Any] = [
+            *(content.to_dict() if isinstance(content, Turn) else content for content in window),
+            {'role': 'user', 'parts': [user_prompt]}
+        ]
+        response: 'GenerateContentResponse' = get_request_scheduler().send(
+            request=lambda: self.chat.model.generate_content(contents=contents, stream=stream),
+            kind='stream' if stream else 'generate',
+            cancel_event=cancel_event
+        )
+
+        if not stream:
+            self.commit(user_prompt=user_prompt, response=response)
+
+        return response
+
+    def commit(self, user_prompt: str, response: 'GenerateContentResponse') -> None:
+        """
+        Append a request/response pair to the chat history, once the response is complete.
+        """
+        from google.generativeai import protos
+        from google.generativeai.types import content_types, generation_types
+
+        if len(response.candidates) == 0:
+            raise ValueError(f"The prompt was blocked: {response.prompt_feedback}")
+        # like `ChatSession`, a response stopped for another reason, e.g. safety, is not kept in the history.
+        if response.candidates[0].finish_reason not in (
+                protos.Candidate.FinishReason.FINISH_REASON_UNSPECIFIED,
+                protos.Candidate.FinishReason.STOP,
+                protos.Candidate.FinishReason.MAX_TOKENS,
+        ):
+            raise generation_types.StopCandidateException(response.candidates[0])
+
+        # the pair is appended in place, `ChatSession.history` also returns the list the session keeps.
+        self.history.extend([
+            content_types.to_content({'role': 'user', 'parts': [user_prompt]}),
+            response.candidates[0].content
+        ])
+
+    def select(
+            self,
+            history: 'Sequence[Content | Turn]',
+            user_prompt: str,
+            cancel_event: 'Event | None' = None
+    ) -> List[Any]:
+        token_counts: List[int] = [self.count_tokens(content=content) for content in history]
+        budget: int = self.budget - estimate_tokens(text=user_prompt)
+
+        self.token_count = sum(token_counts)
+        if self.token_count <= budget:
+            return history
+
+        pinned_turn_count: int = self.pinned_turn_count if self.policy == 'pinned' else 0
+        pinned_turn_count = min(pinned_turn_count, len(history))
+        budget -= sum(token_counts[:pinned_turn_count])
+
+        # a quarter of the budget is kept for the summary of the dropped turns.
+        summary_budget: int = self.budget // 4 if self.policy == 'summary' else 0
+        budget -= summary_budget
+
+        # keep the most recent pairs of turns that fit in the budget.
+        start_index: int = len(history)
+        kept_token_count: int = 0
+        while start_index - 2 >= pinned_turn_count and \
+                kept_token_count + token_counts[start_index - 2] + token_counts[start_index - 1] <= budget:
+            kept_token_count += token_counts[start_index - 2] + token_counts[start_index - 1]
+            start_index -= 2
+
+        window: List[Any] = history[:pinned_turn_count] + history[start_index:]
+
+        if self.policy == 'summary':
+            if self.__summarized_turn_count > len(history):
+                # the chat history was replaced, e.g. by loading a conversation.
+                self.__summary = ''
+                self.__summarized_turn_count = 0
+
+            # the turns that are already in the summary are not sent again.
+            start_index = max(start_index, self.__summarized_turn_count)
+            summary: List[Dict[str, Any]] = self.__summarize(
+                history=history,
+                end_index=start_index,
+                word_count=max(summary_budget * 3 // 4, 1),
+                cancel_event=cancel_event
+            )
+            window = summary + history[start_index:]
+
+        # the turns of the summary are plain dictionaries.
+        self.token_count = sum(
+            estimate_tokens(text=content['parts'][0]) if isinstance(content, dict) else self.count_tokens(content=content)
+            for content in window
+        )
+        return window
+
+    def record_usage(self, response: 'GenerateContentResponse') -> None:
+        """
+        Replace the estimated token count of the last response by the count reported by the API.
+        """
+        try:
+            usage_metadata: Any = response.usage_metadata
+            reply_token_count: int = usage_metadata.candidates_token_count
+            prompt_token_count: int = usage_metadata.prompt_token_count
+        except (AttributeError, ValueError,):
+            return
+
+        if reply_token_count == 0:
+            return
+
+        if len(self.history) != 0 and isinstance(self.history[-1], Turn):
+            # the reply was committed as the last turn.
+            self.history[-1].token_count = reply_token_count
+        else:
+            reply: 'Content' = response.candidates[0].content
+            self.__token_counts[hash(('model', content_to_text(content=reply),))] = reply_token_count
+        self.token_count = prompt_token_count + reply_token_count
+
+    def __summarize(
+            self,
+            history: 'Sequence[Content | Turn]',
+            end_index: int,
+            word_count: int,
+            cancel_event: 'Event | None' = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Extend the running summary with the turns before `end_index`, and return it as a pair of turns.
+
+        The summary request is cancelled with the prompt it is sent for, the running summary is then left unchanged.
+        """
+        if self.__summarized_turn_count < end_index:
+            transcript: str = '\n\n'.join(
+                f"{content.role}: {content_to_text(content=content)}"
+                for content in history[self.__summarized_turn_count:end_index]
+            )
+            previous_summary: str = f"Summary of the earlier conversation:\n{self.__summary}\n\n" if self.__summary else ''
+
+            try:
+                summary_prompt: str = (
+                    f"{SUMMARY_PROMPT.format(word_count=word_count)}\n\n{previous_summary}{transcript}"
+                )
+                response: 'GenerateContentResponse' = get_request_scheduler().send(
+                    request=lambda: self.chat.model.generate_content(summary_prompt),
+                    kind='summary',
+                    cancel_event=cancel_event
+                )
+                self.__summary = response.text
+                self.__summarized_turn_count = end_index
+            except RequestCancelled:
+                raise
+            except Exception:
+                # without a summary, the older turns are just dropped like in the sliding policy.
+                pass
+
+        if self.__summary == '':
+            return []
+
+        return [
+            {'role': 'user', 'parts': [f"Summary of our earlier conversation:\n{self.__summary}"]},
+            {'role': 'model', 'parts': ['Understood.']}
+        ]
+
+
+context_window: ContextWindow | None = None
+
+
+def get_context_budget(name: str = model_name) -> int:
+    budget: int = conf['settings']['context_token_budget']
+    if budget <= 0:
+        budget = int(context_limits.get(name, 30720) * 0.9)
+
+    return budget
+
+
+def get_context_window() -> ContextWindow:
+    global context_window
+
+    if context_window is None:
+        context_window = ContextWindow(
+            chat=get_chat(),
+            budget=get_context_budget(),
+            policy=conf['settings']['context_policy'],
+            pinned_turn_count=conf['settings']['context_pinned_turn_count'],
+            history=get_chat_history()
+        )
+
+    return context_window
+
+
+def format_token_count(token_count: int) -> str:
+    return f"{token_count / 1000:.1f}k" if token_count >= 1000 else f"{token_count}"
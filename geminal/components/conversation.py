@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import codecs
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, TYPE_CHECKING
+
+from .turns import Turn
+
+if TYPE_CHECKING:
+    from google.generativeai.protos import Content
+
+FILE_SUFFIX: str = '.jsonl'
+LEGACY_FILE_SUFFIX: str = '.json'
+LEGACY_DIR_NAME: str = 'legacy'
+# the header line only holds a few fields, a longer first line is not the header of a conversation.
+HEADER_SIZE_LIMIT: int = 64 * 1024
+PARTIAL_LINE_BLOCK_SIZE: int = 64 * 1024
+
+
+def content_to_dict(content: 'Content | Turn') -> Dict[str, Any]:
+    if isinstance(content, Turn):
+        return content.to_dict()
+
+    turn: Dict[str, Any] = {
+        'role': content.role,
+        'parts': [type(part).to_dict(part) for part in content.parts]
+    }
+    return turn
+
+
+def turn_to_text(turn: Dict[str, Any]) -> str:
+    text: str = ''.join(part.get('text', '') for part in turn['parts'])
+    return text
+
+
+class Conversation:
+    """
+    A saved conversation, stored as JSON lines: a header line with the metadata, then one line per turn.
+
+    Turns are only ever appended, so saving a new turn does not rewrite the turns that were saved before.
+    """
+
+    def __init__(self, path: str, metadata: Dict[str, Any], turn_count: int = 0) -> None:
+        self.path: str = path
+        self.metadata: Dict[str, Any] = metadata
+        self.turn_count: int = turn_count
+
+    @classmethod
+    def create(cls, path: str, model_name: str) -> 'Conversation':
+        metadata: Dict[str, Any] = {'model_name': model_name, 'created_at': time.time()}
+
+        # 'x' mode fails if the file already exists, instead of overwriting another conversation.
+        with open(path, 'x', encoding='utf-8') as file:
+            file.write(json.dumps(obj=metadata, ensure_ascii=False) + '\n')
+
+        return cls(path=path, metadata=metadata)
+
+    @classmethod
+    def open(cls, path: str) -> Tuple['Conversation', List[Dict[str, Any]]]:
+        """
+        Open a conversation to append new turns to it, and return it with its turns.
+
+        A last line that was only partially written, e.g. when the program crashed while saving, is removed first, so
+        that the next turn does not continue it. The caller must be the only one writing to the file.
+        """
+        drop_partial_line(path=path)
+        metadata, turns = read_conversation(path=path)
+        return cls(path=path, metadata=metadata, turn_count=len(turns)), turns
+
+    def append(self, contents: Iterable['Content | Turn'], fsync: bool = False) -> List[Dict[str, Any]]:
+        turns: List[Dict[str, Any]] = [content_to_dict(content=content) for content in contents]
+        if len(turns) == 0:
+            return turns
+
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(''.join(json.dumps(obj=turn, ensure_ascii=False) + '\n' for turn in turns))
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        self.turn_count += len(turns)
+        return turns
+
+    def sync(self, history: 'Sequence[Content | Turn]', fsync: bool = False) -> List[Dict[str, Any]]:
+        """
+        Append the turns of the chat history that have not been saved yet, and return them.
+        """
+        return self.append(contents=history[self.turn_count:], fsync=fsync)
+
+
+def read_conversation(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Read the metadata and the turns of a saved conversation, the file is not changed.
+
+    A damaged line is skipped. A last line without its newline is ignored, it is still being written or was cut off by a
+    crash, see `Conversation.open`.
+    """
+    metadata: Dict[str, Any] = {}
+    turns: List[Dict[str, Any]] = []
+
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+
+            try:
+                record: Any = json.loads(line)
+            except ValueError:
+                continue
+
+            if not isinstance(record, dict):
+                continue
+
+            if 'role' in record:
+                turns.append(record)
+            else:
+                metadata = record
+
+    return metadata, turns
+
+
+def is_conversation(path: str) -> bool:
+    """
+    Check that the file starts with the header line of a conversation, before it is read as one.
+    """
+    try:
+        with open(path, 'rb') as file:
+            header: Any = json.loads(file.readline(HEADER_SIZE_LIMIT))
+    except (OSError, ValueError,):
+        return False
+
+    return isinstance(header, dict) and 'created_at' in header and 'role' not in header
+
+
+def drop_partial_line(path: str) -> None:
+    """
+    Remove the last line of the file if it does not end with a newline.
+    """
+    with open(path, 'rb+') as file:
+        size: int = file.seek(0, os.SEEK_END)
+        end: int = size
+        while end > 0:
+            start: int = max(end - PARTIAL_LINE_BLOCK_SIZE, 0)
+            file.seek(start)
+            block: bytes = file.read(end - start)
+
+            newline_index: int = block.rfind(b'\n')
+            if newline_index != -1:
+                if start + newline_index + 1 != size:
+                    file.truncate(start + newline_index + 1)
+                return
+
+            end = start
+
+        file.truncate(0)
+
+
+current_conversation: Conversation | None = None
+
+
+def migrate_legacy_conversations(save_dir: str) -> List[str]:
+    """
+    Convert the conversations saved as a single JSON array by older versions into the JSON lines format.
+
+    The legacy files are moved into a 'legacy' subdirectory once they are converted. Return the converted file names.
+    """
+    migrated_file_names: List[str] = []
+
+    for file_name in sorted(os.listdir(path=save_dir)):
+        if not file_name.endswith(LEGACY_FILE_SUFFIX):
+            continue
+
+        legacy_path: str = os.path.join(save_dir, file_name)
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as file:
+                messages: List[Dict[str, str]] = json.load(fp=file)
+        except (OSError, ValueError,):
+            continue
+
+        path: str = os.path.join(save_dir, f"{file_name[:-len(LEGACY_FILE_SUFFIX)]}{FILE_SUFFIX}")
+        if os.path.exists(path):
+            continue
+
+        metadata: Dict[str, Any] = {'model_name': None, 'created_at': os.path.getmtime(legacy_path)}
+        lines: List[str] = [json.dumps(obj=metadata, ensure_ascii=False) + '\n']
+        for message in messages:
+            turn: Dict[str, Any] = {'role': message['role'], 'parts': [{'text': unescape_legacy_text(message['text'])}]}
+            lines.append(json.dumps(obj=turn, ensure_ascii=False) + '\n')
+
+        with open(path, 'x', encoding='utf-8') as file:
+            file.write(''.join(lines))
+
+        os.makedirs(name=os.path.join(save_dir, LEGACY_DIR_NAME), exist_ok=True)
+        os.replace(legacy_path, os.path.join(save_dir, LEGACY_DIR_NAME, file_name))
+        migrated_file_names.append(file_name)
+
+    return migrated_file_names
+
+
+def unescape_legacy_text(text: str) -> str:
+    """
+    The legacy files kept the escape sequences of the protobuf text format, e.g. '\\n' or '\\346\\227'.
+    """
+    try:
+        return codecs.escape_decode(text.encode('utf-8'))[0].decode('utf-8')
+    except (ValueError, UnicodeDecodeError,):
+        return text.replace('\\n', '\n')
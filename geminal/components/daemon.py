@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import time
+from threading import Lock
+from typing import Any, Dict, TYPE_CHECKING
+
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+from .autosave import Autosave
+from .cache import ResponseCache, get_response_cache
+from .config import conf
+from .console import log_error, log_info
+from .context import ContextWindow, get_context_budget
+from .gemini import display_name, get_model, model_name
+from .metrics import RequestMetrics, record_metrics
+from .stream import MarkdownStream
+from .turns import TurnHistory
+from .warmup import get_connection_warmer
+
+if TYPE_CHECKING:
+    from google.generativeai import ChatSession
+    from google.generativeai.types import GenerateContentResponse
+
+
+class Session:
+    """
+    A named chat session kept by the daemon, prompts of the same session are answered one at a time.
+
+    Every session is autosaved to a session file of its own, like the conversation of a one-shot prompt.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.lock: Lock = Lock()
+        self.prompt_count: int = 0
+        self.chat: 'ChatSession' = get_model().start_chat(history=[])
+        self.context_window: ContextWindow = ContextWindow(
+            chat=self.chat,
+            budget=get_context_budget(),
+            policy=conf['settings']['context_policy'],
+            pinned_turn_count=conf['settings']['context_pinned_turn_count'],
+            history=TurnHistory(memory_limit=conf['settings']['history_memory_limit'])
+        )
+        self.autosave: Autosave | None = Autosave(
+            sessions_dir=conf['settings']['sessions_dir'],
+            session_count=conf['settings']['autosave_session_count']
+        ) if conf['settings']['autosave'] else None
+
+
+sessions: Dict[str, Session] = {}
+sessions_lock: Lock = Lock()
+# the indexes of the repositories are kept between the prompts, and refreshed by one prompt at a time.
+repo_lock: Lock = Lock()
+
+
+def get_session(name: str) -> Session:
+    with sessions_lock:
+        if name not in sessions:
+            sessions[name] = Session(name=name)
+
+        return sessions[name]
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answer a prompt of `forward_prompt`, and stream the rendered response back to the client.
+    """
+
+    def handle(self) -> None:
+        try:
+            request: Dict[str, Any] = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+
+        output: io.TextIOWrapper = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+        # render as if the client terminal was the console, a piped client gets plain text.
+        console: Console = Console(
+            file=output,
+            width=max(int(request.get('width') or 80), 20),
+            height=max(int(request.get('height') or 24), 5),
+            force_terminal=bool(request.get('terminal')),
+            color_system='truecolor' if request.get('terminal') else None
+        )
+
+        session: Session = get_session(name=str(request.get('session') or 'default'))
+        with session.lock:
+            try:
+                answer(
+                    session=session,
+                    user_prompt=str(request.get('prompt') or ''),
+                    console=console,
+                    cwd=request.get('cwd'),
+                    use_cache=bool(request.get('cache', True))
+                )
+            except OSError:
+                # the client went away, its answer is dropped.
+                pass
+
+
+def answer(
+        session: Session,
+        user_prompt: str,
+        console: Console,
+        cwd: str | None = None,
+        use_cache: bool = True
+) -> None:
+    """
+    Answer a prompt like a one-shot prompt without the daemon: the @repo marker is expanded with the repository of the
+    working directory of the client, the response cache is used unless the client disabled it, and the session is
+    autosaved.
+    """
+    title: str = f'[bold bright_blue]{display_name}[/] [bright_blue]({session.name})'
+
+    if user_prompt.strip() == '':
+        print_error(console=console, message='The user prompt is empty!')
+        return
+
+    if cwd is not None:
+        user_prompt = add_repo_context(user_prompt=user_prompt, cwd=cwd, console=console)
+
+    request_metrics: RequestMetrics = RequestMetrics(model_name=model_name, stream=True)
+    request_metrics.bytes_in = len(user_prompt.encode('utf-8'))
+    build_start: float = time.perf_counter()
+
+    cache_key: str | None = None
+    if use_cache and conf['settings']['response_cache']:
+        cache_key = ResponseCache.make_key(
+            model_name=model_name,
+            chat_history=[{'role': turn.role, 'text': turn.text} for turn in session.context_window.history],
+            user_prompt=user_prompt
+        )
+        cached_response: str | None = None
+        try:
+            cached_response = get_response_cache().get(key=cache_key)
+        except Exception as e:
+            log_error(message=f"Unable to read the response cache: {repr(e)}")
+
+        if cached_response is not None:
+            session.context_window.history.extend(contents=[
+                {'role': 'user', 'parts': [user_prompt]},
+                {'role': 'model', 'parts': [cached_response]}
+            ])
+            session.prompt_count += 1
+            save_session(session=session)
+
+            request_metrics.cache = 'hit'
+            request_metrics.build = time.perf_counter() - build_start
+            request_metrics.bytes_out = len(cached_response.encode('utf-8'))
+            render_start: float = time.perf_counter()
+            console.print(Panel(
+                Markdown(markup=cached_response, code_theme='monokai'),
+                border_style='bright_blue',
+                title=title,
+                title_align='left',
+                subtitle=(
+                    f"[bold bright_red]Prompt Count: {session.prompt_count}[/]"
+                    f"[bright_blue] | [/][bold bright_green]Cache: HIT[/]"
+                ),
+                subtitle_align='right'
+            ))
+            request_metrics.render = time.perf_counter() - render_start
+            request_metrics.total = time.perf_counter() - build_start
+            save_metrics(request_metrics=request_metrics)
+            return
+
+        request_metrics.cache = 'miss'
+
+    request_metrics.build = time.perf_counter() - build_start
+    request_metrics.connection = 'warm' if get_connection_warmer().is_warm() else 'cold'
+
+    markdown_stream: MarkdownStream = MarkdownStream(title=title, console=console)
+    first_token_time: float | None = None
+    request_start: float = time.perf_counter()
+    try:
+        response: 'GenerateContentResponse' = session.context_window.send_message(user_prompt=user_prompt, stream=True)
+        for chunk in response:
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+                request_metrics.first_byte = first_token_time - request_start
+                markdown_stream.start()
+
+            markdown_stream.update(
+                chunk=chunk.text,
+                subtitle=f"[bold bright_yellow]First Token: {(first_token_time - request_start):.1f}s[/]"
+            )
+        session.context_window.commit(user_prompt=user_prompt, response=response)
+        session.prompt_count += 1
+        get_connection_warmer().mark_used()
+    except Exception as e:
+        markdown_stream.stop()
+        request_metrics.error = repr(e)
+        save_metrics(request_metrics=request_metrics)
+        if isinstance(e, OSError):
+            raise
+
+        print_error(console=console, message=f"Google API request failed to connect: {repr(e)}")
+        return
+
+    end_time: float = time.perf_counter()
+    session.context_window.record_usage(response=response)
+    request_metrics.record_usage(response=response)
+    request_metrics.network = end_time - request_start
+    request_metrics.total = request_metrics.build + request_metrics.network
+    request_metrics.bytes_out = len(markdown_stream.text.encode('utf-8'))
+    save_metrics(request_metrics=request_metrics)
+    if cache_key is not None:
+        store_response(cache_key=cache_key, response=markdown_stream.text)
+    save_session(session=session)
+
+    markdown_stream.start()
+    markdown_stream.stop(subtitle=(
+        f"[bold bright_yellow]First Token: {((first_token_time or end_time) - request_start):.1f}s[/]"
+        f"[bright_blue] | [/][bold bright_yellow]Time Elapsed: {(end_time - request_start):.1f}s[/]"
+        f"[bright_blue] | [/][bold bright_red]Prompt Count: {session.prompt_count}[/]"
+        + ('[bright_blue] | [/][bold bright_green]Cache: MISS[/]' if cache_key is not None else '')
+    ))
+
+
+def add_repo_context(user_prompt: str, cwd: str, console: Console) -> str:
+    """
+    Add the snippets of the repository in the working directory of the client that match the prompt, if it has the
+    @repo marker. The index of the repository stays in memory, so only the files that changed are read again.
+    """
+    if '@repo' not in user_prompt:
+        return user_prompt
+
+    try:
+        from . import repo_index
+    except ModuleNotFoundError as e:
+        if e.name != 'numpy':
+            raise
+        print_error(console=console, message='The @repo marker needs NumPy, install it with `pip install numpy`.')
+        return user_prompt
+
+    if not repo_index.has_repo_marker(user_prompt=user_prompt):
+        return user_prompt
+
+    try:
+        with repo_lock:
+            index, _ = repo_index.get_repo_index(path=cwd)
+            prompt, locations = repo_index.add_repo_context(
+                user_prompt=user_prompt,
+                repo_index=index,
+                snippet_count=conf['settings']['repo_snippet_count']
+            )
+    except Exception as e:
+        print_error(console=console, message=f"Unable to search the repository: {repr(e)}")
+        return user_prompt
+
+    if len(locations) == 0:
+        print_info(console=console, message='No part of the repository matches the prompt.')
+    else:
+        print_info(
+            console=console,
+            message=f"Added {len(locations)} snippet(s) of the repository: {', '.join(locations)}"
+        )
+
+    return prompt
+
+
+def print_error(console: Console, message: str) -> None:
+    console.print(Panel(renderable=f'[bright_red]ERROR: {message}[/]', border_style='bright_red'))
+
+
+def print_info(console: Console, message: str) -> None:
+    console.print(Panel(renderable=f'[bold bright_blue]INFO:[/] [bright_blue]{message}', border_style='bright_blue'))
+
+
+def save_session(session: Session) -> None:
+    if session.autosave is not None:
+        session.autosave.save(history=session.context_window.history)
+
+
+def store_response(cache_key: str, response: str) -> None:
+    try:
+        get_response_cache().put(key=cache_key, model_name=model_name, response=response)
+    except Exception as e:
+        log_error(message=f"Unable to cache the response: {repr(e)}")
+
+
+def save_metrics(request_metrics: RequestMetrics) -> None:
+    try:
+        record_metrics(request_metrics=request_metrics)
+    except Exception as e:
+        log_error(message=f"Unable to record the request metrics: {repr(e)}")
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads: bool = True
+
+
+def serve(socket_path: str) -> None:
+    """
+    Keep the model client configured and its connection open, and answer the prompts sent to the Unix socket.
+    """
+    if os.path.exists(socket_path):
+        if is_listening(socket_path=socket_path):
+            log_error(message=f"A daemon is already listening on \\[{socket_path}].")  # noqa: disable=W605
+            return
+        # left by a daemon that was killed.
+        os.remove(socket_path)
+
+    get_model()
+    if conf['settings']['warm_up']:
+        # the connection is kept alive for the whole life of the daemon.
+        get_connection_warmer().start()
+    os.makedirs(name=os.path.dirname(socket_path), exist_ok=True)
+
+    # only the owner can connect to the socket.
+    umask: int = os.umask(0o177)
+    try:
+        server: DaemonServer = DaemonServer(socket_path, RequestHandler)
+    finally:
+        os.umask(umask)
+
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+    log_info(message=f"Geminal is listening on \\[{socket_path}], stop it with Ctrl+C.")  # noqa: disable=W605
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def is_listening(socket_path: str) -> bool:
+    connection: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        connection.close()
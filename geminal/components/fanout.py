@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from threading import Lock
+from typing import Dict, List, TYPE_CHECKING
+
+from .config import conf
+from .context import ContextWindow, get_context_budget
+from .gemini import get_chat_turns, get_model, supported_models
+from .metrics import RequestMetrics, record_metrics
+
+if TYPE_CHECKING:
+    from google.generativeai import ChatSession
+    from google.generativeai.types import GenerateContentResponse
+
+
+class ModelSession:
+    """
+    The chat session of one model of the fan-out, it starts from the main conversation and then keeps its own turns.
+    """
+
+    def __init__(self, model_name: str) -> None:
+        self.model_name: str = model_name
+        self.display_name: str = supported_models[model_name]
+        self.lock: Lock = Lock()
+        self.chat: 'ChatSession' = get_model(name=model_name).start_chat(
+            history=[{'role': turn['role'], 'parts': [turn['text']]} for turn in get_chat_turns()]
+        )
+        self.context_window: ContextWindow = ContextWindow(
+            chat=self.chat,
+            budget=get_context_budget(name=model_name),
+            policy=conf['settings']['context_policy'],
+            pinned_turn_count=conf['settings']['context_pinned_turn_count']
+        )
+
+
+class Answer:
+    def __init__(self, model_session: ModelSession, text: str | None, error: str | None, latency: float) -> None:
+        self.model_session: ModelSession = model_session
+        self.text: str | None = text
+        self.error: str | None = error
+        self.latency: float = latency
+
+
+class FanOut:
+    """
+    Send every prompt to several models at the same time, each model answers in its own session.
+    """
+
+    def __init__(self, model_names: List[str]) -> None:
+        self.model_names: List[str] = model_names
+        self.__model_sessions: Dict[str, ModelSession] = {}
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=len(model_names),
+            thread_name_prefix='geminal-fan-out'
+        )
+
+    def send(self, user_prompt: str) -> List[Future]:
+        """
+        Send the prompt to every model, and return the futures of their answers in the order of the models.
+        """
+        model_sessions: List[ModelSession] = [
+            self.__get_model_session(model_name=model_name) for model_name in self.model_names
+        ]
+        return [
+            self.__executor.submit(self.__ask, model_session=model_session, user_prompt=user_prompt)
+            for model_session in model_sessions
+        ]
+
+    def __get_model_session(self, model_name: str) -> ModelSession:
+        # the sessions are created on the first prompt, so they start from the conversation the user was having.
+        if model_name not in self.__model_sessions:
+            self.__model_sessions[model_name] = ModelSession(model_name=model_name)
+
+        return self.__model_sessions[model_name]
+
+    @staticmethod
+    def __ask(model_session: ModelSession, user_prompt: str) -> Answer:
+        request_metrics: RequestMetrics = RequestMetrics(model_name=model_session.model_name, stream=False)
+        request_metrics.bytes_in = len(user_prompt.encode('utf-8'))
+
+        # a model that is still answering the previous prompt, e.g. in first-wins mode, is waited for.
+        with model_session.lock:
+            start_time: float = time.perf_counter()
+            try:
+                response: 'GenerateContentResponse' = model_session.context_window.send_message(user_prompt=user_prompt)
+                text: str = response.text
+            except Exception as e:
+                request_metrics.error = repr(e)
+                answer: Answer = Answer(
+                    model_session=model_session,
+                    text=None,
+                    error=repr(e),
+                    latency=time.perf_counter() - start_time
+                )
+            else:
+                model_session.context_window.record_usage(response=response)
+                request_metrics.record_usage(response=response)
+                request_metrics.bytes_out = len(text.encode('utf-8'))
+                answer = Answer(
+                    model_session=model_session,
+                    text=text,
+                    error=None,
+                    latency=time.perf_counter() - start_time
+                )
+
+        request_metrics.network = request_metrics.first_byte = request_metrics.total = answer.latency
+        try:
+            record_metrics(request_metrics=request_metrics)
+        except Exception:
+            pass
+
+        return answer
+
+
+def first_answer(futures: List[Future]) -> Answer:
+    """
+    Wait for the first successful answer, or for the last failed one if every model failed.
+    """
+    answer: Answer | None = None
+    for future in as_completed(futures):
+        answer = future.result()
+        if answer.error is None:
+            break
+
+    return answer
+
+
+fan_out: FanOut | None = None
+
+
+def get_fan_out(model_names: List[str]) -> FanOut:
+    global fan_out
+
+    if fan_out is None or fan_out.model_names != model_names:
+        fan_out = FanOut(model_names=model_names)
+
+    return fan_out
+
+
+def validate_model_names(model_names: List[str]) -> List[str]:
+    """
+    Return the names that are not supported models.
+    """
+    return [name for name in model_names if name not in supported_models]
@@ -30,15 +30,17 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
 """
-from typing import Dict
+from threading import Lock
+from typing import Any, Dict, List, TYPE_CHECKING
 
-from google.generativeai import GenerativeModel, ChatSession
 from rich.panel import Panel
 
-from .config import conf
+from .config import conf, get_or_error
 from .console import log, new_line
+from .turns import TurnHistory
 
-import google.generativeai as client
+if TYPE_CHECKING:
+    from google.generativeai import GenerativeModel, ChatSession
 
 supported_models: Dict[str, str] = {
     'gemini-pro': 'Gemini Pro',
@@ -57,24 +59,85 @@ def validate_model_name(name: str) -> str:
         return 'gemini-pro'
 
 
-api_key: str = conf['settings']['api_key']
 model_name: str = conf['settings']['model_name']
 model_name = validate_model_name(model_name)
 display_name: str = supported_models[model_name]
 
-client.configure(api_key=api_key)
-model: GenerativeModel = client.GenerativeModel(model_name=model_name)
-chat: ChatSession = model.start_chat(history=[])
+# the Google SDK is slow to import, so the client is only configured when the first prompt is sent.
+model: 'GenerativeModel | None' = None
+# models of the fan-out mode, other than `model_name`.
+other_models: Dict[str, 'GenerativeModel'] = {}
+# only the model of the chat session is used, the turns are kept in `chat_history`.
+chat: 'ChatSession | None' = None
+chat_history: TurnHistory | None = None
+# the connection is warmed up from another thread while the user is typing.
+model_lock: Lock = Lock()
+
+
+def get_model(name: str | None = None) -> 'GenerativeModel':
+    global model
+
+    with model_lock:
+        if model is None:
+            import google.generativeai as client
+
+            client.configure(api_key=get_or_error('GOOGLE_API_KEY'))
+            model = client.GenerativeModel(model_name=model_name)
+
+        if name is None or name == model_name:
+            return model
+
+        if name not in other_models:
+            import google.generativeai as client
+
+            other_models[name] = client.GenerativeModel(model_name=name)
+
+        return other_models[name]
+
+
+def get_chat() -> 'ChatSession':
+    global chat
+
+    if chat is None:
+        chat = get_model().start_chat()
+
+    return chat
+
+
+def get_chat_history() -> TurnHistory:
+    global chat_history
+
+    if chat_history is None:
+        chat_history = TurnHistory(memory_limit=conf['settings']['history_memory_limit'])
+
+    return chat_history
+
+
+def set_chat_history(turns: List[Dict[str, Any]]) -> None:
+    """
+    Replace the chat history with saved turns, e.g. when a saved conversation is loaded.
+    """
+    get_chat_history().replace(contents=turns)
 
 
 def get_last_response() -> str:
-    last_response: str = chat.history[-1].parts[0].text
+    last_response: str = get_chat_history()[-1].text
     return last_response
 
 
-def get_chat_history() -> str:
-    chat_history: str = str(chat.history)
-    return chat_history
+def get_chat_turns() -> List[Dict[str, str]]:
+    chat_turns: List[Dict[str, str]] = [{'role': turn.role, 'text': turn.text} for turn in get_chat_history()]
+    return chat_turns
+
+
+def append_chat_turn(user_prompt: str, response: str) -> None:
+    """
+    Add a request/response pair that was not sent through the chat session, e.g. a cached response.
+    """
+    get_chat_history().extend(contents=[
+        {'role': 'user', 'parts': [user_prompt]},
+        {'role': 'model', 'parts': [response]}
+    ])
 
 
 def print_welcome() -> None:
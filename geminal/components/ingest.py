@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Set, TextIO
+
+from .config import conf
+from .context import estimate_tokens, get_context_budget
+from .gemini import get_model
+from .scheduler import get_request_scheduler
+
+MAP_PROMPT: str = (
+    'The input below is part {index} of a larger input, which is too large to be read at once. Answer the question '
+    'using this part only. If this part has nothing relevant to the question, answer with "{nothing_relevant}" only.'
+    '\n\nQuestion: {question}\n\nPart {index} of the input:\n{chunk}'
+)
+REDUCE_PROMPT: str = (
+    'The question below was asked about a large input, which was split into parts that were answered one by one. '
+    'Combine the answers of the parts into a single complete answer to the question, without mentioning the parts.'
+    '\n\nQuestion: {question}\n\n{answers}'
+)
+NOTHING_RELEVANT: str = 'Nothing relevant.'
+# tokens of the prompt templates, kept out of the chunk size.
+TEMPLATE_TOKEN_COUNT: int = 256
+# the first bytes of a file that are read to tell a text file from a binary one.
+SNIFF_SIZE: int = 8192
+SKIPPED_DIR_NAMES: Set[str] = {'__pycache__', 'node_modules'}
+
+
+def read_lines(paths: List[str], stdin: TextIO) -> Iterator[str]:
+    """
+    Read the lines of files, of the text files in directories, and of stdin for '-', one line at a time.
+
+    Every file starts with a line giving its path, so that the model can tell the files apart. Hidden files and
+    directories, and binary files found in directories, are skipped.
+    """
+    for path in paths:
+        if path == '-':
+            yield from stdin
+        elif os.path.isdir(path):
+            for file_path in walk_text_files(path=path):
+                yield from read_file_lines(path=file_path)
+        else:
+            yield from read_file_lines(path=path)
+
+
+def read_file_lines(path: str) -> Iterator[str]:
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        yield f'==> {path} <==\n'
+        for line in file:
+            yield line if line.endswith('\n') else f'{line}\n'
+
+
+def walk_text_files(path: str) -> Iterator[str]:
+    for dir_path, dir_names, file_names in os.walk(path):
+        dir_names[:] = sorted(
+            name for name in dir_names if not name.startswith('.') and name not in SKIPPED_DIR_NAMES
+        )
+        for file_name in sorted(file_names):
+            file_path: str = os.path.join(dir_path, file_name)
+            if not file_name.startswith('.') and is_text_file(path=file_path):
+                yield file_path
+
+
+def is_text_file(path: str) -> bool:
+    try:
+        with open(path, 'rb') as file:
+            return b'\0' not in file.read(SNIFF_SIZE)
+    except OSError:
+        return False
+
+
+def split_chunks(lines: Iterable[str], chunk_size: int) -> Iterator[str]:
+    """
+    Group the lines into chunks of at most `chunk_size` bytes, a line longer than a chunk is split.
+    """
+    chunk: List[str] = []
+    byte_count: int = 0
+
+    for line in lines:
+        line_size: int = len(line.encode('utf-8'))
+        if byte_count + line_size > chunk_size and len(chunk) != 0:
+            yield ''.join(chunk)
+            chunk = []
+            byte_count = 0
+
+        if line_size <= chunk_size:
+            chunk.append(line)
+            byte_count += line_size
+            continue
+
+        start: int = 0
+        while start < len(line):
+            piece: str = line[start:start + chunk_size]
+            # text that is not ASCII takes more bytes than characters.
+            while len(piece.encode('utf-8')) > chunk_size:
+                piece = piece[:len(piece) // 2]
+            yield piece
+            start += len(piece)
+
+    if len(chunk) != 0:
+        yield ''.join(chunk)
+
+
+class MapReduce:
+    """
+    Answer a question about an input that may not fit in the context of the model.
+
+    The input is split into chunks that fit. Each chunk is answered on its own by concurrent requests (map), then the
+    partial answers are combined into one answer (reduce), in several rounds if they do not fit at once either. The
+    chunks are only read when a request can be sent, so at most `concurrency` chunks are held in memory at once.
+    """
+
+    def __init__(
+            self,
+            question: str,
+            chunk_size: int,
+            concurrency: int,
+            on_progress: Callable[['MapReduce'], None] | None = None
+    ) -> None:
+        self.question: str = question
+        self.chunk_size: int = chunk_size
+        self.concurrency: int = max(concurrency, 1)
+        self.on_progress: Callable[['MapReduce'], None] | None = on_progress
+
+        self.byte_count: int = 0
+        self.chunk_count: int = 0
+        self.answered_count: int = 0
+        self.request_count: int = 0
+        self.reducing: bool = False
+
+        self.__executor: ThreadPoolExecutor | None = None
+
+    def answer(self, lines: Iterable[str]) -> str | None:
+        """
+        Answer the question about the lines, or return None if there are none.
+        """
+        chunks: Iterator[str] = self.__count_chunks(chunks=split_chunks(lines=lines, chunk_size=self.chunk_size))
+        first_chunk: str | None = next(chunks, None)
+        if first_chunk is None:
+            return None
+
+        second_chunk: str | None = next(chunks, None)
+        if second_chunk is None:
+            # the input fits in the context, it is sent with the question at once.
+            return self.__generate(prompt=f'{self.question}\n\n{first_chunk}')
+
+        self.__executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='geminal-map-reduce')
+        try:
+            answers: List[str] = self.__map(chunks=itertools.chain([first_chunk, second_chunk], chunks))
+            self.reducing = True
+            return self.__reduce(answers=answers)
+        finally:
+            # the requests that were not sent yet are dropped, e.g. when one of them failed or on Ctrl-C.
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def __count_chunks(self, chunks: Iterator[str]) -> Iterator[str]:
+        for chunk in chunks:
+            self.byte_count += len(chunk.encode('utf-8'))
+            self.chunk_count += 1
+            self.__report_progress()
+            yield chunk
+
+    def __map(self, chunks: Iterable[str]) -> List[str]:
+        answers: Dict[int, str] = {}
+        futures: Dict[Future, int] = {}
+        pending: Set[Future] = set()
+
+        def collect(done: Iterable[Future]) -> None:
+            for future in done:
+                answers[futures.pop(future)] = future.result()
+
+        for index, chunk in enumerate(chunks):
+            if len(pending) >= self.concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done=done)
+
+            future: Future = self.__executor.submit(
+                self.__generate,
+                prompt=MAP_PROMPT.format(
+                    index=index + 1,
+                    nothing_relevant=NOTHING_RELEVANT,
+                    question=self.question,
+                    chunk=chunk
+                )
+            )
+            futures[future] = index
+            pending.add(future)
+
+        collect(done=wait(pending)[0])
+        return [answers[index] for index in sorted(answers)]
+
+    def __reduce(self, answers: List[str]) -> str:
+        relevant_answers: List[str] = [
+            answer for answer in answers if answer.strip().rstrip('.') != NOTHING_RELEVANT.rstrip('.')
+        ] or answers
+
+        while True:
+            groups: List[List[str]] = self.__group(answers=relevant_answers)
+            prompts: List[str] = [
+                REDUCE_PROMPT.format(
+                    question=self.question,
+                    answers='\n\n'.join(f'Answer for part {index + 1}:\n{answer}' for index, answer in enumerate(group))
+                )
+                for group in groups
+            ]
+            if len(prompts) == 1:
+                return self.__generate(prompt=prompts[0])
+
+            relevant_answers = list(self.__executor.map(lambda prompt: self.__generate(prompt=prompt), prompts))
+
+    def __group(self, answers: List[str]) -> List[List[str]]:
+        """
+        Group the answers so that each group fits in one chunk, every group but the last one has two answers or more.
+        """
+        groups: List[List[str]] = [[]]
+        byte_count: int = 0
+        for answer in answers:
+            answer_size: int = len(answer.encode('utf-8'))
+            if byte_count + answer_size > self.chunk_size and len(groups[-1]) >= 2:
+                groups.append([])
+                byte_count = 0
+
+            groups[-1].append(answer)
+            byte_count += answer_size
+
+        return groups
+
+    def __generate(self, prompt: str) -> str:
+        self.request_count += 1
+        self.__report_progress()
+
+        text: str = get_request_scheduler().send(
+            request=lambda: get_model().generate_content(prompt).text,
+            kind='map_reduce'
+        )
+
+        self.answered_count += 1
+        self.__report_progress()
+        return text
+
+    def __report_progress(self) -> None:
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+
+def get_chunk_size(question: str) -> int:
+    """
+    Get the size of the chunks in bytes, so that a chunk and the question fit in the context of the model.
+    """
+    chunk_token_count: int = conf['settings']['ingest_chunk_tokens']
+    if chunk_token_count <= 0:
+        chunk_token_count = get_context_budget() - estimate_tokens(text=question) - TEMPLATE_TOKEN_COUNT
+
+    # about 4 bytes per token, like `estimate_tokens`.
+    return max(chunk_token_count, 1) * 4
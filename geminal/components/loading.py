@@ -31,46 +31,127 @@ SOFTWARE.
 
 """
 import logging
+import time
 
-from time import sleep
-from threading import Thread
+from threading import Event, Lock, Thread
 from typing import Tuple
 
-from rich.console import Console
+from rich.text import Text
+
+from .console import console
+from .utils import format_size
 
 
 class Loading:
+    """
+    A spinner shown while waiting for a response, with the elapsed time and the progress reported by `update`.
+
+    A single render thread draws on the shared console. `stop` wakes it up immediately and waits for it, so the
+    response can be printed right after.
+    """
     sleep_time: float = 0.1
     is_querying: bool | None = None
+    # in the interactive loop, the prompt shows the status in its toolbar instead.
+    quiet: bool = False
 
     __spinner: Tuple = ('⣾ ', '⣽ ', '⣻ ', '⢿ ', '⡿ ', '⣟ ', '⣯ ', '⣷ ')
+    __lock: Lock = Lock()
+    __stop_event: Event = Event()
+    __thread: Thread | None = None
+    __message: str = ''
+    __start_time: float = 0.0
+    __byte_count: int = 0
+    __token_count: int = 0
+    __line_length: int = 0
+
+    @classmethod
+    def __action(cls):
+        frame: int = 0
+        while not cls.__stop_event.is_set():
+            spin: str = cls.__spinner[frame % len(cls.__spinner)]
+            line: Text = Text.from_markup(f' {cls.__message} {spin}{cls.__get_progress()}')
+            line_length: int = line.cell_len
+            # pad the line to erase the end of a longer previous one.
+            line.pad_right(max(cls.__line_length - line_length, 0))
+            console.print(line, end='\r', highlight=False)
+            cls.__line_length = line_length
+            frame += 1
+            cls.__stop_event.wait(timeout=cls.sleep_time)
 
     @classmethod
-    def __action(cls, message: str):
-        while cls.is_querying:
-            for spin in cls.__spinner:
-                Console().print(f' {message} {spin}', end='\r')
-                if not cls.is_querying:
-                    break
-                sleep(cls.sleep_time)
+    def __get_progress(cls) -> str:
+        progress: str = f'{time.perf_counter() - cls.__start_time:.1f}s'
+        if cls.__byte_count > 0:
+            progress += f' | {format_size(size=cls.__byte_count)}'
+        if cls.__token_count > 0:
+            progress += f' | {cls.__token_count} tokens'
+
+        return progress
 
     @classmethod
     def start(cls, message: str):
-        try:
-            cls.is_querying = True
-            thread: Thread = Thread(target=cls.__action, args=(message,))
-            thread.start()
-            return thread
-        except Exception as ex:
-            cls.is_querying = False
+        with cls.__lock:
+            if cls.is_querying:
+                return cls.__thread
+
+            try:
+                cls.is_querying = True
+                cls.__stop_event.clear()
+                cls.__message = message
+                cls.__start_time = time.perf_counter()
+                cls.__byte_count = 0
+                cls.__token_count = 0
+                cls.__line_length = 0
+                if cls.quiet:
+                    return None
+
+                cls.__thread = Thread(target=cls.__action, daemon=True)
+                cls.__thread.start()
+                return cls.__thread
+            except Exception as ex:
+                cls.is_querying = False
+                cls.__thread = None
+
+                def getExc(e):
+                    return e.args[1] if len(e.args) > 1 else str(e)
+
+                logging.debug(getExc(ex))
 
-            def getExc(e):
-                return e.args[1] if len(e.args) > 1 else str(e)
+    @classmethod
+    def update(cls, byte_count: int | None = None, token_count: int | None = None, message: str | None = None):
+        """
+        Report the progress of the running task, e.g. the bytes or tokens received so far, or a new message.
+        """
+        if message is not None:
+            cls.__message = message
+        if byte_count is not None:
+            cls.__byte_count = byte_count
+        if token_count is not None:
+            cls.__token_count = token_count
+
+    @classmethod
+    def get_status(cls) -> str | None:
+        """
+        Get the message and the progress as plain text, while a task is running.
+        """
+        if not cls.is_querying:
+            return None
 
-            logging.debug(getExc(ex))
+        return f'{Text.from_markup(cls.__message).plain} {cls.__get_progress()}'
 
     @classmethod
     def stop(cls):
-        if cls.is_querying:
+        with cls.__lock:
+            if not cls.is_querying:
+                return
+
             cls.is_querying = False
-            sleep(cls.sleep_time)
+            if cls.__thread is None:
+                return
+
+            cls.__stop_event.set()
+            cls.__thread.join()
+            cls.__thread = None
+
+            if cls.__line_length > 0:
+                console.print(' ' * cls.__line_length, end='\r', markup=False, highlight=False)
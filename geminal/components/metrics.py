@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import fcntl
+import json
+import math
+import os
+import re
+import time
+from typing import Any, Dict, List
+
+from .config import conf
+
+PHASES: List[str] = ['build', 'first_byte', 'network', 'render', 'total']
+
+
+class RequestMetrics:
+    """
+    Timings by phase, in seconds, and sizes of a single request.
+
+    build: preparing the request (cache lookup, context selection), first_byte: until the first chunk arrived,
+    network: waiting for the API, render: rendering the response, total: the whole request as the user sees it.
+    """
+
+    def __init__(self, model_name: str, stream: bool) -> None:
+        self.model_name: str = model_name
+        self.stream: bool = stream
+        self.timestamp: float = time.time()
+        self.cache: str | None = None
+        # 'warm' if the connection was used or warmed up recently, 'cold' if it had to be set up for this request.
+        self.connection: str | None = None
+        self.error: str | None = None
+
+        self.build: float = 0.0
+        self.first_byte: float | None = None
+        self.network: float = 0.0
+        self.render: float = 0.0
+        self.total: float = 0.0
+
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        self.tokens_in: int = 0
+        self.tokens_out: int = 0
+
+    def record_usage(self, response: Any) -> None:
+        try:
+            self.tokens_in = response.usage_metadata.prompt_token_count
+            self.tokens_out = response.usage_metadata.candidates_token_count
+        except (AttributeError, ValueError,):
+            pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'timestamp': self.timestamp,
+            'model_name': self.model_name,
+            'stream': self.stream,
+            'cache': self.cache,
+            'connection': self.connection,
+            'error': self.error,
+            **{phase: getattr(self, phase) for phase in PHASES},
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'tokens_in': self.tokens_in,
+            'tokens_out': self.tokens_out
+        }
+
+
+def record_metrics(request_metrics: RequestMetrics) -> None:
+    """
+    Append the metrics of a request to the metrics log, and update the Prometheus textfile if one is configured.
+    """
+    if not conf['settings']['metrics']:
+        return
+
+    path: str = conf['settings']['metrics_path']
+    os.makedirs(name=os.path.dirname(path), exist_ok=True)
+    # a single write in append mode, so that lines of concurrent processes are not interleaved.
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(obj=request_metrics.to_dict(), ensure_ascii=False) + '\n')
+        file.flush()
+        size: int = os.fstat(file.fileno()).st_size
+
+    if size > conf['settings']['metrics_max_size']:
+        rotate_log(path=path, max_size=conf['settings']['metrics_max_size'])
+
+    textfile_path: str | None = conf['settings']['metrics_textfile']
+    if textfile_path:
+        write_textfile(path=textfile_path, request_metrics=request_metrics)
+
+
+def rotate_log(path: str, max_size: int) -> None:
+    """
+    Move a metrics log that grew over `max_size` bytes to `path.1`, replacing the previous one, so that the logs take at
+    most about twice `max_size`.
+
+    A lock file serializes the rotations of concurrent processes, the size is checked again once it is taken.
+    """
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            if os.path.getsize(path) > max_size:
+                os.replace(path, f'{path}.1')
+        except FileNotFoundError:
+            pass
+
+
+def write_textfile(path: str, request_metrics: RequestMetrics) -> None:
+    """
+    Add the request to the counters of a textfile for the textfile collector of node_exporter.
+
+    The file is replaced atomically, and a lock file serializes the updates of concurrent processes.
+    """
+    labels: str = f'model="{request_metrics.model_name}"'
+    increments: Dict[str, float] = {
+        f'geminal_requests_total{{{labels}}}': 1,
+        f'geminal_request_errors_total{{{labels}}}': 1 if request_metrics.error is not None else 0,
+        f'geminal_request_cache_hits_total{{{labels}}}': 1 if request_metrics.cache == 'hit' else 0,
+        f'geminal_request_bytes_total{{{labels},direction="in"}}': request_metrics.bytes_in,
+        f'geminal_request_bytes_total{{{labels},direction="out"}}': request_metrics.bytes_out,
+        f'geminal_request_tokens_total{{{labels},direction="in"}}': request_metrics.tokens_in,
+        f'geminal_request_tokens_total{{{labels},direction="out"}}': request_metrics.tokens_out,
+        **{
+            f'geminal_request_phase_seconds_total{{{labels},phase="{phase}"}}': getattr(request_metrics, phase) or 0
+            for phase in PHASES
+        }
+    }
+
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        counters: Dict[str, float] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    match: re.Match | None = re.match(pattern=r'^(geminal_\S+) (\S+)$', string=line.strip())
+                    if match is not None:
+                        counters[match.group(1)] = float(match.group(2))
+
+        for key, value in increments.items():
+            counters[key] = counters.get(key, 0) + value
+
+        lines: List[str] = []
+        for name, help_text in (
+                ('geminal_requests_total', 'Number of requests sent to Gemini.'),
+                ('geminal_request_errors_total', 'Number of failed requests.'),
+                ('geminal_request_cache_hits_total', 'Number of requests answered from the response cache.'),
+                ('geminal_request_bytes_total', 'Bytes of the prompts and of the responses.'),
+                ('geminal_request_tokens_total', 'Tokens of the prompts and of the responses.'),
+                ('geminal_request_phase_seconds_total', 'Time spent in each phase of the requests.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{key} {value:g}' for key, value in sorted(counters.items()) if key.startswith(f'{name}{{'))
+
+        temporary_path: str = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, path)
+
+
+def read_metrics(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the records of the metrics log, and of the previous one that was rotated, the oldest first.
+    """
+    records: List[Dict[str, Any]] = []
+    for log_path in (f'{path}.1', path,):
+        if not os.path.exists(log_path):
+            continue
+
+        with open(log_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+
+    return records
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if len(values) == 0:
+        return math.nan
+
+    rank: int = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def get_stats(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Summarize the metrics log per model: request and error counts, and p50/p95/p99 of every phase.
+
+    The time to first byte is also split by cold and warm connections. The requests answered from the response cache
+    are left out of the phases, they would make the API look faster, their total time is summarized on its own.
+    """
+    records_by_model: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        records_by_model.setdefault(record.get('model_name') or 'unknown', []).append(record)
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for model_name, model_records in sorted(records_by_model.items()):
+        succeeded_records: List[Dict[str, Any]] = [record for record in model_records if record.get('error') is None]
+        answered_records: List[Dict[str, Any]] = [
+            record for record in succeeded_records if record.get('cache') != 'hit'
+        ]
+        cache_hit_records: List[Dict[str, Any]] = [
+            record for record in succeeded_records if record.get('cache') == 'hit'
+        ]
+
+        stats[model_name] = {
+            'requests': len(model_records),
+            'errors': len(model_records) - len(succeeded_records),
+            'cache_hits': len(cache_hit_records),
+            'phases': {}
+        }
+        for phase in PHASES:
+            values: List[float] = sorted(
+                record[phase] for record in answered_records if record.get(phase) is not None
+            )
+            stats[model_name]['phases'][phase] = get_percentiles(values=values)
+
+        for connection in ('cold', 'warm',):
+            values: List[float] = sorted(
+                record['first_byte'] for record in answered_records
+                if record.get('connection') == connection and record.get('first_byte') is not None
+            )
+            if len(values) != 0:
+                stats[model_name]['phases'][f'first_byte ({connection})'] = get_percentiles(values=values)
+
+        values: List[float] = sorted(
+            record['total'] for record in cache_hit_records if record.get('total') is not None
+        )
+        if len(values) != 0:
+            stats[model_name]['phases']['total (cache hit)'] = get_percentiles(values=values)
+
+    return stats
+
+
+def get_percentiles(values: List[float]) -> Dict[str, float]:
+    return {f'p{p}': percentile(values=values, p=p) for p in (50, 95, 99,)}
+
+
+def print_stats() -> None:
+    from rich.table import Table
+
+    from .console import log, log_error
+
+    stats: Dict[str, Dict[str, Any]] = get_stats(records=read_metrics(path=conf['settings']['metrics_path']))
+    if len(stats) == 0:
+        log_error(message='There are no recorded requests yet.')
+        return
+
+    for model_name, model_stats in stats.items():
+        table: Table = Table(
+            title=f'[bold bright_blue]{model_name}',
+            title_justify='left',
+            caption=(
+                f"Requests: {model_stats['requests']} | Errors: {model_stats['errors']} "
+                f"| Cache Hits: {model_stats['cache_hits']}"
+            ),
+            caption_justify='left',
+            border_style='bright_blue'
+        )
+        table.add_column('Phase', style='bold')
+        for p in (50, 95, 99,):
+            table.add_column(f'p{p}', justify='right')
+
+        for phase, percentiles in model_stats['phases'].items():
+            table.add_row(phase, *(
+                '-' if math.isnan(value) else f'{value * 1000:.0f} ms' for value in percentiles.values()
+            ))
+
+        log(anything=table)
@@ -0,0 +1,457 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import subprocess
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from .config import conf
+from .ingest import SKIPPED_DIR_NAMES, is_text_file
+
+REPO_MARKER_PATTERN: re.Pattern = re.compile(r'(?<!\S)@repo\b')
+TOKEN_PATTERN: re.Pattern = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|[0-9]+')
+SUBWORD_PATTERN: re.Pattern = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+# longer terms are mostly encoded data, e.g. base64, they would only grow the vocabulary.
+MAX_TERM_LENGTH: int = 64
+# larger files are mostly generated, e.g. lock files or minified code.
+MAX_FILE_SIZE: int = 1024 * 1024
+SNIPPET_LINE_COUNT: int = 40
+INDEX_VERSION: int = 1
+# the usual BM25 parameters.
+K1: float = 1.2
+B: float = 0.75
+
+REPO_CONTEXT_PROMPT: str = (
+    'The snippets below are the parts of the repository at {root} that are the most relevant to the prompt that '
+    'follows them.\n\n{snippets}\n\n{prompt}'
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split code or prose into lowercase terms. An identifier also gives its parts, e.g. `getContextWindow` gives
+    'getcontextwindow', 'get', 'context' and 'window'.
+    """
+    terms: List[str] = list(itertools.chain.from_iterable(map(split_word, TOKEN_PATTERN.findall(text))))
+    return terms
+
+
+@lru_cache(maxsize=65536)
+def split_word(word: str) -> Tuple[str, ...]:
+    # the same identifiers come back over and over in code, they are only split once.
+    if len(word) > MAX_TERM_LENGTH:
+        return ()
+
+    parts: List[str] = SUBWORD_PATTERN.findall(word)
+    if len(parts) <= 1:
+        return word.lower(),
+
+    return word.lower(), *(part.lower() for part in parts)
+
+
+def find_repo_root(path: str) -> str:
+    """
+    Find the root of the git repository that contains the path, or return the path itself.
+    """
+    directory: str = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(directory, '.git')):
+            return directory
+
+        parent: str = os.path.dirname(directory)
+        if parent == directory:
+            return os.path.abspath(path)
+        directory = parent
+
+
+def get_repo_state(root: str) -> List[int] | None:
+    """
+    Get a fingerprint of the git index and HEAD, or None outside of a git repository. It only costs two `stat`s.
+
+    git rewrites its index when files are added, committed or checked out, and when `git status` sees a tracked file
+    that changed. HEAD changes with the branch.
+    """
+    state: List[int] = []
+    for name in ('index', 'HEAD',):
+        try:
+            stat: os.stat_result = os.stat(os.path.join(root, '.git', name))
+        except OSError:
+            return None
+        # the index is replaced by a new file when it is written, so its inode changes too.
+        state.extend([stat.st_ino, stat.st_mtime_ns, stat.st_size])
+
+    return state
+
+
+def list_files(root: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    List the files of the repository with their modification time and size, the ignored files of git are left out.
+    """
+    paths: List[str] | None = None
+    if os.path.exists(os.path.join(root, '.git')):
+        try:
+            output: bytes = subprocess.run(
+                ['git', '-C', root, 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=True
+            ).stdout
+            paths = [path for path in output.decode('utf-8', errors='surrogateescape').split('\0') if path != '']
+        except (OSError, subprocess.CalledProcessError,):
+            paths = None
+
+    if paths is None:
+        paths = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = [name for name in dir_names if not name.startswith('.') and name not in SKIPPED_DIR_NAMES]
+            paths.extend(
+                os.path.relpath(os.path.join(dir_path, file_name), root)
+                for file_name in file_names if not file_name.startswith('.')
+            )
+
+    for path in paths:
+        try:
+            stat: os.stat_result = os.stat(os.path.join(root, path))
+        except OSError:
+            continue
+
+        if stat.st_size <= MAX_FILE_SIZE:
+            yield path, stat.st_mtime_ns, stat.st_size
+
+
+class RepoIndex:
+    """
+    A BM25 index of the text files of a repository, split into snippets of `SNIPPET_LINE_COUNT` lines.
+
+    The postings are NumPy arrays sorted by term, with the offset of the postings of every term, so a query only reads
+    the postings of its own terms and scores them with vectorized operations. `refresh` only tokenizes the files whose
+    size or modification time changed, the postings of the other files are kept and renumbered.
+
+    Listing the files of a large repository is the slow part of a refresh, so it is skipped while the git index and
+    HEAD did not change, see `is_up_to_date`.
+    """
+
+    def __init__(self, root: str, path: str) -> None:
+        self.root: str = root
+        self.path: str = path
+        # the time of the last refresh, and the state of the git repository before it.
+        self.refreshed_at: float | None = None
+        self.state: List[int] | None = None
+
+        # [path relative to the root, modification time in ns, size] of every listed file.
+        self.files: List[list] = []
+        self.terms: Dict[str, int] = {}
+        self.term_offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        self.posting_docs: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.posting_freqs: np.ndarray = np.zeros(0, dtype=np.int32)
+        # the file, the first line and the number of terms of every snippet.
+        self.doc_files: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.doc_starts: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.doc_lengths: np.ndarray = np.zeros(0, dtype=np.int32)
+
+        self.__norms: np.ndarray | None = None
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_lengths)
+
+    def load(self) -> bool:
+        try:
+            with np.load(self.path) as data:
+                metadata: Dict = json.loads(data['metadata'].tobytes())
+                if metadata.get('version') != INDEX_VERSION or metadata.get('root') != self.root:
+                    return False
+
+                self.files = metadata['files']
+                self.refreshed_at = metadata.get('refreshed_at')
+                self.state = metadata.get('state')
+                self.terms = {term: term_id for term_id, term in enumerate(metadata['terms'])}
+                self.term_offsets = data['term_offsets']
+                self.posting_docs = data['posting_docs']
+                self.posting_freqs = data['posting_freqs']
+                self.doc_files = data['doc_files']
+                self.doc_starts = data['doc_starts']
+                self.doc_lengths = data['doc_lengths']
+        except (OSError, ValueError, KeyError,):
+            return False
+
+        self.__norms = None
+        return True
+
+    def save(self) -> None:
+        metadata: Dict = {
+            'version': INDEX_VERSION,
+            'root': self.root,
+            'refreshed_at': self.refreshed_at,
+            'state': self.state,
+            'files': self.files,
+            'terms': list(self.terms)
+        }
+
+        os.makedirs(name=os.path.dirname(self.path), exist_ok=True)
+        # `np.savez` adds the suffix to a name without it.
+        temporary_path: str = f'{self.path[:-len(".npz")]}.tmp.npz'
+        np.savez(
+            temporary_path,
+            metadata=np.frombuffer(json.dumps(obj=metadata, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+            term_offsets=self.term_offsets,
+            posting_docs=self.posting_docs,
+            posting_freqs=self.posting_freqs,
+            doc_files=self.doc_files,
+            doc_starts=self.doc_starts,
+            doc_lengths=self.doc_lengths
+        )
+        os.replace(temporary_path, self.path)
+
+    def is_up_to_date(self, refresh_interval: int) -> bool:
+        """
+        Check if the files can be searched without listing them again: the last refresh was less than
+        `refresh_interval` seconds ago and the git index and HEAD did not change since then. An edit that git has not
+        seen yet is picked up by the next refresh after the interval.
+        """
+        if self.refreshed_at is None or not 0 <= time.time() - self.refreshed_at < refresh_interval:
+            return False
+
+        return self.state == get_repo_state(root=self.root)
+
+    def refresh(self) -> int:
+        """
+        Re-index the files that were added, changed or removed since the last refresh. Return how many were indexed.
+        """
+        # the state is taken before the files are listed, a change made in between is seen by the next refresh.
+        state: List[int] | None = get_repo_state(root=self.root)
+        indexed_files: Dict[str, Tuple[int, int, int]] = {
+            path: (file_index, mtime, size,) for file_index, (path, mtime, size) in enumerate(self.files)
+        }
+
+        kept_file_indexes: List[int] = []
+        changed_files: List[list] = []
+        for path, mtime, size in list_files(root=self.root):
+            indexed_file: Tuple[int, int, int] | None = indexed_files.get(path)
+            if indexed_file is not None and indexed_file[1:] == (mtime, size,):
+                kept_file_indexes.append(indexed_file[0])
+            else:
+                changed_files.append([path, mtime, size])
+
+        self.refreshed_at = time.time()
+        self.state = state
+        if len(changed_files) == 0 and len(kept_file_indexes) == len(self.files):
+            return 0
+
+        # the postings of the files that did not change are kept, with the files and the snippets renumbered.
+        file_numbers: np.ndarray = np.full(len(self.files), -1, dtype=np.int64)
+        file_numbers[kept_file_indexes] = np.arange(len(kept_file_indexes))
+        kept_docs: np.ndarray = file_numbers[self.doc_files] >= 0
+        doc_numbers: np.ndarray = np.cumsum(kept_docs) - 1
+
+        posting_terms: np.ndarray = np.repeat(
+            np.arange(len(self.term_offsets) - 1, dtype=np.int32), np.diff(self.term_offsets)
+        )
+        kept_postings: np.ndarray = kept_docs[self.posting_docs]
+
+        files: List[list] = [self.files[file_index] for file_index in kept_file_indexes]
+        doc_files: List[int] = []
+        doc_starts: List[int] = []
+        doc_lengths: List[int] = []
+        new_terms: List[int] = []
+        new_freqs: List[int] = []
+        # the number of distinct terms of every new snippet.
+        new_doc_sizes: List[int] = []
+
+        for changed_file in changed_files:
+            file_index: int = len(files)
+            files.append(changed_file)
+            for start, snippet in self.__read_snippets(path=changed_file[0]):
+                term_counts: Counter = Counter(tokenize(text=snippet))
+                new_terms.extend([self.terms.setdefault(term, len(self.terms)) for term in term_counts])
+                new_freqs.extend(term_counts.values())
+                new_doc_sizes.append(len(term_counts))
+
+                doc_files.append(file_index)
+                doc_starts.append(start)
+                doc_lengths.append(sum(term_counts.values()))
+
+        kept_doc_count: int = int(np.count_nonzero(kept_docs))
+        new_docs: np.ndarray = np.repeat(
+            np.arange(kept_doc_count, kept_doc_count + len(new_doc_sizes), dtype=np.int32), new_doc_sizes
+        )
+
+        all_terms: np.ndarray = np.concatenate([posting_terms[kept_postings], np.array(new_terms, dtype=np.int32)])
+        # the snippets of the changed files come last, so a stable sort keeps the postings of a term sorted by snippet.
+        order: np.ndarray = np.argsort(all_terms, kind='stable')
+        self.posting_docs = np.concatenate([
+            doc_numbers[self.posting_docs[kept_postings]].astype(np.int32), new_docs
+        ])[order]
+        self.posting_freqs = np.concatenate([
+            self.posting_freqs[kept_postings], np.array(new_freqs, dtype=np.int32)
+        ])[order]
+        self.term_offsets = np.concatenate([
+            np.zeros(1, dtype=np.int64), np.cumsum(np.bincount(all_terms, minlength=len(self.terms)))
+        ])
+
+        self.doc_files = np.concatenate([
+            file_numbers[self.doc_files[kept_docs]].astype(np.int32), np.array(doc_files, dtype=np.int32)
+        ])
+        self.doc_starts = np.concatenate([self.doc_starts[kept_docs], np.array(doc_starts, dtype=np.int32)])
+        self.doc_lengths = np.concatenate([self.doc_lengths[kept_docs], np.array(doc_lengths, dtype=np.int32)])
+        self.files = files
+        self.__norms = None
+
+        return len(changed_files)
+
+    def search(self, query: str, count: int) -> List[Tuple[str, int, float]]:
+        """
+        Return the path, the first line and the BM25 score of the snippets that match the query best.
+        """
+        term_ids: List[int] = sorted({self.terms[term] for term in tokenize(text=query) if term in self.terms})
+        if self.doc_count == 0 or len(term_ids) == 0 or count <= 0:
+            return []
+
+        if self.__norms is None:
+            average_length: float = max(float(self.doc_lengths.mean()), 1.0)
+            self.__norms = (K1 * (1 - B + B * self.doc_lengths / average_length)).astype(np.float32)
+
+        scores: np.ndarray = np.zeros(self.doc_count, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+            if start == end:
+                continue
+
+            docs: np.ndarray = self.posting_docs[start:end]
+            freqs: np.ndarray = self.posting_freqs[start:end].astype(np.float32)
+            idf: float = math.log(1 + (self.doc_count - (end - start) + 0.5) / (end - start + 0.5))
+            # a term has at most one posting per snippet, so the scores can be added with fancy indexing.
+            scores[docs] += idf * freqs * (K1 + 1) / (freqs + self.__norms[docs])
+
+        count = min(count, self.doc_count)
+        best_docs: np.ndarray = np.argpartition(-scores, count - 1)[:count]
+        best_docs = best_docs[np.argsort(-scores[best_docs], kind='stable')]
+
+        return [
+            (self.files[self.doc_files[doc]][0], int(self.doc_starts[doc]), float(scores[doc]),)
+            for doc in best_docs if scores[doc] > 0
+        ]
+
+    def read_snippet(self, path: str, start: int) -> str:
+        with open(os.path.join(self.root, path), 'r', encoding='utf-8', errors='replace') as file:
+            lines: List[str] = file.readlines()
+
+        return ''.join(lines[start:start + SNIPPET_LINE_COUNT])
+
+    def __read_snippets(self, path: str) -> Iterator[Tuple[int, str]]:
+        file_path: str = os.path.join(self.root, path)
+        if not is_text_file(path=file_path):
+            return
+
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+                lines: List[str] = file.readlines()
+        except OSError:
+            return
+
+        # the path is part of the first snippet, so that a file can be found by its name.
+        for start in range(0, len(lines), SNIPPET_LINE_COUNT):
+            snippet: str = ''.join(lines[start:start + SNIPPET_LINE_COUNT])
+            yield start, f'{path}\n{snippet}' if start == 0 else snippet
+
+
+def has_repo_marker(user_prompt: str) -> bool:
+    return REPO_MARKER_PATTERN.search(user_prompt) is not None
+
+
+def add_repo_context(user_prompt: str, repo_index: RepoIndex, snippet_count: int) -> Tuple[str, List[str]]:
+    """
+    Replace the @repo marker of the prompt with the snippets of the repository that match it best.
+
+    Return the new prompt and the locations of the snippets.
+    """
+    prompt: str = REPO_MARKER_PATTERN.sub('', user_prompt).strip()
+
+    snippets: List[str] = []
+    locations: List[str] = []
+    for path, start, _ in repo_index.search(query=prompt, count=snippet_count):
+        try:
+            snippet: str = repo_index.read_snippet(path=path, start=start)
+        except OSError:
+            continue
+
+        location: str = f'{path}:{start + 1}-{start + len(snippet.splitlines())}'
+        snippets.append(f'{location}\n```\n{snippet.rstrip()}\n```')
+        locations.append(location)
+
+    if len(snippets) == 0:
+        return prompt, locations
+
+    return REPO_CONTEXT_PROMPT.format(root=repo_index.root, snippets='\n\n'.join(snippets), prompt=prompt), locations
+
+
+repo_indexes: Dict[str, RepoIndex] = {}
+
+
+def get_repo_index(path: str) -> Tuple[RepoIndex, int]:
+    """
+    Get the index of the repository that contains the path, refreshed if it is not up to date.
+
+    Return the index and the number of files that were indexed by the refresh.
+    """
+    root: str = find_repo_root(path=path)
+    if root not in repo_indexes:
+        repo_index: RepoIndex = RepoIndex(
+            root=root,
+            path=os.path.join(
+                conf['settings']['repo_index_dir'], f"{hashlib.sha1(root.encode('utf-8')).hexdigest()[:16]}.npz"
+            )
+        )
+        repo_index.load()
+        repo_indexes[root] = repo_index
+
+    repo_index = repo_indexes[root]
+    if repo_index.is_up_to_date(refresh_interval=conf['settings']['repo_index_refresh_interval']):
+        return repo_index, 0
+
+    state: List[int] | None = repo_index.state
+    indexed_file_count: int = repo_index.refresh()
+    # the state of the refresh is saved with the index, so that the next run can skip listing the files too.
+    if indexed_file_count != 0 or repo_index.state != state:
+        repo_index.save()
+
+    return repo_index, indexed_file_count
@@ -0,0 +1,360 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+from .config import conf, get_or_error
+
+T = TypeVar('T')
+
+# seconds between two checks of a cancellation, while a request is waited for.
+poll_interval: float = 0.05
+
+
+class RequestCancelled(Exception):
+    """
+    The request was cancelled by the user before it was answered.
+    """
+
+
+class TokenBucket:
+    """
+    Limit the request rate to `rate` requests per second, with bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.__tokens: float = capacity
+        self.__updated_at: float = time.monotonic()
+        self.__lock: Lock = Lock()
+
+    def acquire(self, cancel_event: Event | None = None) -> None:
+        """
+        Wait for a token, and raise `RequestCancelled` as soon as `cancel_event` is set.
+        """
+        while True:
+            wait_time: float = self.__take()
+            if wait_time == 0:
+                return
+
+            if cancel_event is None:
+                time.sleep(wait_time)
+            elif cancel_event.wait(timeout=wait_time):
+                raise RequestCancelled()
+
+    async def acquire_async(self) -> None:
+        import asyncio
+
+        while True:
+            wait_time: float = self.__take()
+            if wait_time == 0:
+                return
+
+            await asyncio.sleep(wait_time)
+
+    def try_acquire(self) -> bool:
+        return self.__take() == 0
+
+    def __take(self) -> float:
+        """
+        Take a token if there is one, otherwise return how long to wait for the next one.
+        """
+        with self.__lock:
+            now: float = time.monotonic()
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated_at) * self.rate)
+            self.__updated_at = now
+
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return 0
+
+            return (1 - self.__tokens) / self.rate
+
+
+class RequestScheduler:
+    """
+    Send requests to the API with retries, a rate limit and optional hedging.
+
+    Overloaded and unavailable errors and timeouts are retried up to `max_retries` times, after the delay the API asked
+    for or with an exponential backoff with full jitter. With hedging, a request that has not been answered after the
+    p95 latency of the previous requests of the same kind is sent a second time, and the first answer wins.
+
+    A request must not change any state, e.g. the chat history, so that it can be sent more than once.
+    """
+
+    # hedging starts once the p95 latency is known well enough.
+    min_latency_count: int = 20
+
+    def __init__(
+            self,
+            max_retries: int,
+            base_delay: float,
+            max_delay: float,
+            token_bucket: TokenBucket | None,
+            hedge: bool
+    ) -> None:
+        self.max_retries: int = max(max_retries, 0)
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.token_bucket: TokenBucket | None = token_bucket
+        self.hedge: bool = hedge
+
+        self.__latencies: Dict[str, Deque[float]] = {}
+        self.__executor: ThreadPoolExecutor | None = None
+
+    def send(self, request: Callable[[], T], kind: str = 'default', cancel_event: Event | None = None) -> T:
+        """
+        Send the request, and raise `RequestCancelled` as soon as `cancel_event` is set, even while it is retried.
+        """
+        attempt: int = 0
+        while True:
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(cancel_event=cancel_event)
+
+            start_time: float = time.perf_counter()
+            try:
+                if cancel_event is None:
+                    result: T = self.__send_hedged(request=request, kind=kind) if self.hedge else request()
+                else:
+                    result = run_cancellable(
+                        function=lambda: self.__send_hedged(request=request, kind=kind) if self.hedge else request(),
+                        cancel_event=cancel_event
+                    )
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(error=e):
+                    raise
+
+                retry_after: float | None = get_retry_after(error=e)
+                if retry_after is not None and retry_after > self.max_delay:
+                    raise
+
+                delay: float = retry_after if retry_after is not None else self.get_backoff(attempt=attempt)
+                logging.debug(f"Retrying the request in {delay:.1f}s after: {repr(e)}")
+                attempt += 1
+                if cancel_event is None:
+                    time.sleep(delay)
+                elif cancel_event.wait(timeout=delay):
+                    raise RequestCancelled()
+                continue
+
+            self.__latencies.setdefault(kind, deque(maxlen=200)).append(time.perf_counter() - start_time)
+            return result
+
+    def get_backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def get_hedge_delay(self, kind: str) -> float | None:
+        latencies: List[float] = sorted(self.__latencies.get(kind, ()))
+        if len(latencies) < self.min_latency_count:
+            return None
+
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    def __send_hedged(self, request: Callable[[], T], kind: str) -> T:
+        hedge_delay: float | None = self.get_hedge_delay(kind=kind)
+        if hedge_delay is None:
+            return request()
+
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='geminal-request')
+
+        futures: List[Future] = [self.__executor.submit(request)]
+        done: Any = wait(futures, timeout=hedge_delay)[0]
+        # the hedged request counts against the rate limit, it is not sent without a token.
+        if len(done) == 0 and (self.token_bucket is None or self.token_bucket.try_acquire()):
+            futures.append(self.__executor.submit(request))
+
+        error: BaseException | None = None
+        while len(futures) != 0:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the slower request keeps running, its answer is dropped.
+                    return future.result()
+                error = error or future.exception()
+
+            futures = list(pending)
+
+        raise error
+
+
+def run_cancellable(function: Callable[[], T], cancel_event: Event) -> T:
+    """
+    Call the function in a thread of its own, and stop waiting for it once `cancel_event` is set.
+
+    A blocking read of the connection cannot be interrupted from another thread, so a cancelled call keeps running in
+    the background and its result is dropped.
+    """
+    outcome: List[Tuple[Any, BaseException | None]] = []
+    done_event: Event = Event()
+
+    def call() -> None:
+        try:
+            outcome.append((function(), None,))
+        except BaseException as e:
+            outcome.append((None, e,))
+        done_event.set()
+
+    Thread(target=call, name='geminal-cancellable', daemon=True).start()
+    while not done_event.wait(timeout=poll_interval):
+        if cancel_event.is_set():
+            raise RequestCancelled()
+
+    result, error = outcome[0]
+    if error is not None:
+        raise error
+
+    return result
+
+
+def iterate_cancellable(iterable: Iterable[T], cancel_event: Event) -> Iterator[T]:
+    """
+    Iterate over e.g. a streamed response in a thread of its own, and stop once `cancel_event` is set.
+
+    Like `run_cancellable`, the next item that is being waited for when the iteration is cancelled is dropped.
+    """
+    end: object = object()
+    items: Queue = Queue()
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                items.put((item, None,))
+                # the rest of a cancelled response is not read.
+                if cancel_event.is_set():
+                    return
+        except BaseException as e:
+            items.put((end, e,))
+            return
+        items.put((end, None,))
+
+    Thread(target=produce, name='geminal-cancellable', daemon=True).start()
+    while True:
+        try:
+            item, error = items.get(timeout=poll_interval)
+        except Empty:
+            if cancel_event.is_set():
+                raise RequestCancelled()
+            continue
+
+        if cancel_event.is_set():
+            raise RequestCancelled()
+        if error is not None:
+            raise error
+        if item is end:
+            return
+        yield item
+
+
+def is_retryable(error: Exception) -> bool:
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        exceptions = None
+
+    if exceptions is not None and isinstance(error, (
+            exceptions.TooManyRequests,
+            exceptions.ResourceExhausted,
+            exceptions.InternalServerError,
+            exceptions.ServiceUnavailable,
+            exceptions.GatewayTimeout,
+            exceptions.DeadlineExceeded,
+    )):
+        return True
+
+    return isinstance(error, (TimeoutError, ConnectionError,))
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """
+    Get the delay asked by the API before retrying, from the Retry-After header or the RetryInfo of the error.
+    """
+    headers: Any = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers is not None:
+        try:
+            return float(headers.get('Retry-After'))
+        except (TypeError, ValueError,):
+            pass
+
+    for detail in getattr(error, 'details', None) or []:
+        retry_delay: Any = getattr(detail, 'retry_delay', None)
+        if retry_delay is None:
+            continue
+        if hasattr(retry_delay, 'total_seconds'):
+            return retry_delay.total_seconds()
+        if hasattr(retry_delay, 'seconds'):
+            return retry_delay.seconds + getattr(retry_delay, 'nanos', 0) / 1e9
+
+    return None
+
+
+token_buckets: Dict[str, TokenBucket] = {}
+request_scheduler: RequestScheduler | None = None
+
+
+def get_token_bucket(api_key: str) -> TokenBucket | None:
+    """
+    Get the token bucket of an API key, the quota is shared by everything that uses the same key.
+    """
+    rate: int = conf['settings']['request_rate']
+    if rate <= 0:
+        return None
+
+    if api_key not in token_buckets:
+        token_buckets[api_key] = TokenBucket(rate=rate / 60, capacity=max(rate / 60, 1))
+
+    return token_buckets[api_key]
+
+
+def get_request_scheduler() -> RequestScheduler:
+    global request_scheduler
+
+    if request_scheduler is None:
+        request_scheduler = RequestScheduler(
+            max_retries=conf['settings']['max_retries'],
+            base_delay=conf['settings']['retry_base_delay'],
+            max_delay=conf['settings']['retry_max_delay'],
+            token_bucket=get_token_bucket(api_key=get_or_error('GOOGLE_API_KEY')),
+            hedge=conf['settings']['hedge_requests']
+        )
+
+    return request_scheduler
@@ -49,7 +49,8 @@ class Selection:
             '[5] Saves the current conversation',
             '[6] Loads a saved conversation',
             '[7] Deletes a saved conversation',
-            '[8] Quits the program'
+            '[8] Shows earlier messages of the loaded conversation',
+            '[9] Quits the program'
         ]
 
         action_menu: TerminalMenu = TerminalMenu(
@@ -61,22 +62,6 @@ class Selection:
         action_index: int = action_menu.show()
         return action_index + 1
 
-    def partial_interactive_actions(self) -> int:
-        actions: List[str] = [
-            '[1] Starts a conversation' if self.prompt_count == 0 else '[1] Continues the conversation',
-            '[2] Copies the last message to your clipboard',
-            '[3] Shows more actions',
-            '[4] Quits the program'
-        ]
-
-        action_menu: TerminalMenu = terminal_menu(
-            menu_title='Interactive actions:',
-            entries=actions
-        )
-
-        action_index: int = action_menu.show()
-        return action_index + 1
-
 
 def terminal_menu(menu_title: str, entries: Iterable[str]) -> TerminalMenu:
     _terminal_menu: TerminalMenu = TerminalMenu(
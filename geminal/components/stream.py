@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import time
+from typing import List
+
+from rich.box import ROUNDED, Box
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.segment import Segment, Segments
+from rich.style import Style
+from rich.text import Text
+
+from .console import console as shared_console
+
+
+class MarkdownStream:
+    """
+    Render a streamed Markdown response as a panel, chunk by chunk.
+
+    Completed Markdown blocks are parsed and rendered only once, then printed above the live area. Only the
+    unfinished tail of the response is re-parsed, at most once every `refresh_interval` seconds, and once more when the
+    stream stops. Without `live`, e.g. while the user can type below the output, only the completed blocks are printed
+    as they arrive.
+    """
+
+    def __init__(
+            self,
+            title: str,
+            code_theme: str = 'monokai',
+            border_style: str = 'bright_blue',
+            console: Console | None = None,
+            live: bool = True,
+            refresh_interval: float = 0.1
+    ) -> None:
+        self.title: str = title
+        self.code_theme: str = code_theme
+        self.border_style: str = border_style
+        self.text: str = ''
+        # the daemon renders for a client on a console of its own.
+        self.console: Console = console or shared_console
+        self.live: bool = live
+        self.refresh_interval: float = refresh_interval
+
+        self.__started: bool = False
+        self.__committed_offset: int = 0
+        self.__scan_offset: int = 0
+        self.__in_fence: bool = False
+        self.__has_block: bool = False
+        self.__live: Live | None = None
+        self.__refreshed_at: float = 0.0
+
+    def start(self) -> None:
+        if self.__started:
+            return
+
+        self.__started = True
+        self.console.print(Segments(self.__to_segments(lines=self.__panel_lines(renderable=Text(''))[:1])))
+        if not self.live:
+            return
+
+        self.__live = Live(
+            console=self.console,
+            auto_refresh=False,
+            transient=True,
+            vertical_overflow='visible'
+        )
+        self.__live.start()
+
+    def update(self, chunk: str, subtitle: str | None = None) -> None:
+        self.text += chunk
+
+        block: str | None = self.__commit()
+        if block is not None:
+            self.__print_block(block=block)
+
+        now: float = time.perf_counter()
+        if self.__live is not None and now - self.__refreshed_at >= self.refresh_interval:
+            self.__refreshed_at = now
+            tail_lines: List[List[Segment]] = self.__tail_lines() + self.__bottom_lines(subtitle=subtitle)
+            # keep the live area within the terminal, otherwise it cannot be redrawn in place.
+            self.__live.update(
+                renderable=Segments(self.__to_segments(lines=tail_lines[-max(self.console.height - 1, 1):])),
+                refresh=True
+            )
+
+    def stop(self, subtitle: str | None = None) -> None:
+        if not self.__started:
+            return
+
+        self.__started = False
+        if self.__live is not None:
+            self.__live.stop()
+            self.__live = None
+
+        self.console.print(Segments(
+            self.__to_segments(lines=self.__tail_lines() + self.__bottom_lines(subtitle=subtitle))
+        ))
+        self.console.print()
+
+    def __commit(self) -> str | None:
+        """
+        Find the last blank line outside a code fence and return the text before it, if it has not been committed.
+        """
+        boundary: int | None = None
+
+        while True:
+            end: int = self.text.find('\n', self.__scan_offset)
+            if end == -1:
+                break
+
+            line: str = self.text[self.__scan_offset:end].strip()
+            self.__scan_offset = end + 1
+
+            if line.startswith('```') or line.startswith('~~~'):
+                self.__in_fence = not self.__in_fence
+            elif not self.__in_fence and line == '':
+                boundary = self.__scan_offset
+
+        if boundary is None:
+            return None
+
+        block: str = self.text[self.__committed_offset:boundary]
+        self.__committed_offset = boundary
+        return block if block.strip() != '' else None
+
+    def __print_block(self, block: str) -> None:
+        lines: List[List[Segment]] = []
+        if self.__has_block:
+            lines.extend(self.__frame_lines(lines=[[]], width=max(self.console.width - 4, 1)))
+
+        lines.extend(self.__markdown_lines(markup=block))
+        self.__has_block = True
+
+        if self.__live is not None:
+            self.__live.console.print(Segments(self.__to_segments(lines=lines)))
+        else:
+            self.console.print(Segments(self.__to_segments(lines=lines)))
+
+    def __tail_lines(self) -> List[List[Segment]]:
+        tail: str = self.text[self.__committed_offset:]
+        if tail.strip() == '':
+            return []
+
+        lines: List[List[Segment]] = []
+        if self.__has_block:
+            lines.extend(self.__frame_lines(lines=[[]], width=max(self.console.width - 4, 1)))
+
+        lines.extend(self.__markdown_lines(markup=tail))
+        return lines
+
+    def __bottom_lines(self, subtitle: str | None) -> List[List[Segment]]:
+        return self.__panel_lines(renderable=Text(''), subtitle=subtitle)[-1:]
+
+    def __markdown_lines(self, markup: str) -> List[List[Segment]]:
+        # the panel borders and paddings take 4 columns.
+        width: int = max(self.console.width - 4, 1)
+        lines: List[List[Segment]] = self.console.render_lines(
+            Markdown(markup=markup, code_theme=self.code_theme),
+            self.console.options.update(width=width),
+            pad=False
+        )
+
+        # blocks are separated by one blank line already, as rich does between Markdown elements.
+        while len(lines) != 0 and all(
+            segment.text.strip() == '' and (segment.style is None or segment.style.bgcolor is None)
+            for segment in lines[0]
+        ):
+            lines.pop(0)
+
+        return self.__frame_lines(lines=lines, width=width)
+
+    def __frame_lines(self, lines: List[List[Segment]], width: int) -> List[List[Segment]]:
+        """
+        Put the lines between the borders of the panel, the way `Panel` does, without rendering them a second time.
+        """
+        box: Box = ROUNDED.substitute(options=self.console.options, safe=self.console.safe_box)
+        border_style: Style = self.console.get_style(self.border_style)
+        line_start: List[Segment] = [Segment(box.mid_left, border_style), Segment(' ')]
+        line_end: List[Segment] = [Segment(' '), Segment(box.mid_right, border_style)]
+
+        return [line_start + Segment.adjust_line_length(line=line, length=width) + line_end for line in lines]
+
+    def __panel_lines(self, renderable, subtitle: str | None = None) -> List[List[Segment]]:
+        panel: Panel = Panel(
+            renderable,
+            border_style=self.border_style,
+            title=self.title,
+            title_align='left',
+            subtitle=subtitle,
+            subtitle_align='right'
+        )
+        return self.console.render_lines(panel, self.console.options)
+
+    @staticmethod
+    def __to_segments(lines: List[List[Segment]]) -> List[Segment]:
+        segments: List[Segment] = []
+        for line in lines:
+            segments.extend(line)
+            segments.append(Segment.line())
+
+        return segments
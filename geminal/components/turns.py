@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+import sys
+import tempfile
+from threading import Lock
+from typing import Any, Dict, IO, Iterable, List, overload, Sequence, Tuple
+
+
+class TurnBuffer:
+    """
+    An append-only file that holds the text of the turns, it is deleted once no turn refers to it anymore.
+    """
+
+    def __init__(self) -> None:
+        self.__file: IO = tempfile.TemporaryFile(prefix='geminal-turns-')
+        self.__lock: Lock = Lock()
+        self.size: int = 0
+
+    def write(self, data: bytes) -> int:
+        """
+        Append the data, and return its offset.
+        """
+        with self.__lock:
+            offset: int = self.size
+            os.pwrite(self.__file.fileno(), data, offset)
+            self.size += len(data)
+
+        return offset
+
+    def read(self, offset: int, size: int) -> bytes:
+        data: bytes = os.pread(self.__file.fileno(), size, offset)
+        return data
+
+
+class Turn:
+    """
+    A turn of the chat history. Its text is written to the buffer of the history, and only kept in memory while the
+    turn is recent enough.
+    """
+
+    __slots__ = ('role', 'offset', 'size', 'token_count', '__buffer', '__text')
+
+    def __init__(self, role: str, text: str, buffer: TurnBuffer) -> None:
+        data: bytes = text.encode('utf-8')
+
+        # the roles of the contents are new strings, they are shared by all the turns instead.
+        self.role: str = sys.intern(role)
+        self.offset: int = buffer.write(data=data)
+        self.size: int = len(data)
+        # 0 until it is estimated or reported by the API.
+        self.token_count: int = 0
+        self.__buffer: TurnBuffer = buffer
+        self.__text: str | None = text
+
+    @property
+    def text(self) -> str:
+        text: str | None = self.__text
+        if text is None:
+            text = self.__buffer.read(offset=self.offset, size=self.size).decode('utf-8')
+
+        return text
+
+    @property
+    def is_spilled(self) -> bool:
+        return self.__text is None
+
+    def spill(self) -> None:
+        """
+        Drop the text from memory, it is read from the buffer from now on.
+        """
+        self.__text = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Materialize the turn as the saved turns are stored, which the API also takes as a content.
+        """
+        return {'role': self.role, 'parts': [{'text': self.text}]}
+
+
+def get_role_and_text(content: Any) -> Tuple[str, str]:
+    """
+    Get the role and the text of a `Content`, a turn, or a dictionary like the saved turns.
+    """
+    if isinstance(content, Turn):
+        return content.role, content.text
+
+    if isinstance(content, dict):
+        text: str = ''.join(part if isinstance(part, str) else part.get('text', '') for part in content['parts'])
+        return content['role'], text
+
+    return content.role, ''.join(part.text for part in content.parts)
+
+
+class TurnHistory(Sequence):
+    """
+    The chat history of a long session, with a bounded memory footprint.
+
+    Every turn is a small record that points into an append-only buffer on disk. The texts of the most recent turns,
+    up to `memory_limit` bytes, are also kept in memory, the older ones are read back from the buffer when they are
+    needed, which is rare: only the turns selected by the context window are sent to the API.
+    """
+
+    def __init__(self, memory_limit: int) -> None:
+        self.memory_limit: int = max(memory_limit, 0)
+
+        self.__turns: List[Turn] = []
+        self.__buffer: TurnBuffer | None = None
+        # the turns before this index are spilled, the size of the texts that are still in memory is `memory_size`.
+        self.__spilled_count: int = 0
+        self.memory_size: int = 0
+
+    def __len__(self) -> int:
+        return len(self.__turns)
+
+    @overload
+    def __getitem__(self, index: int) -> Turn:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Turn]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Turn | List[Turn]:
+        return self.__turns[index]
+
+    def append(self, content: Any) -> None:
+        self.extend(contents=[content])
+
+    def extend(self, contents: Iterable[Any]) -> None:
+        """
+        Append `Content`s, turns, or dictionaries like the saved turns.
+        """
+        if self.__buffer is None:
+            self.__buffer = TurnBuffer()
+
+        for content in contents:
+            role, text = get_role_and_text(content=content)
+            turn: Turn = Turn(role=role, text=text, buffer=self.__buffer)
+            self.__turns.append(turn)
+            self.memory_size += turn.size
+
+        self.__spill()
+
+    def replace(self, contents: Iterable[Any]) -> None:
+        """
+        Replace the whole history, e.g. when a saved conversation is loaded.
+        """
+        # the turns of the old history, e.g. in a snapshot that is being autosaved, keep the old buffer alive.
+        self.__turns = []
+        self.__buffer = None
+        self.__spilled_count = 0
+        self.memory_size = 0
+
+        self.extend(contents=contents)
+
+    def __spill(self) -> None:
+        # the oldest turns are spilled first, the last turn may be spilled too when it is larger than the limit.
+        while self.memory_size > self.memory_limit and self.__spilled_count < len(self.__turns):
+            turn: Turn = self.__turns[self.__spilled_count]
+            turn.spill()
+            self.memory_size -= turn.size
+            self.__spilled_count += 1
@@ -34,13 +34,42 @@ SOFTWARE.
 
 def print_usage() -> None:
     print("""
-Usage: geminal [-v] [-h] [PROMPT]
+Usage: geminal [-v] [-h] [stats] [archive] [--export NAME [--format FORMAT] [--last N]] [--daemon] [--session NAME]
+               [--fan-out MODELS [--first-wins]] [--no-cache] [--batch FILE [--concurrency N] [--rate N]]
+               [--raw | --json] [-f PATH]... [PROMPT]
 
 Geminal is a chatbot on Terminal powered by Google Generative AI.
 
 options:
     -h, --help      Show this help message and exit.
     -v, --version   Show version and exit.
+    stats           Show the p50/p95/p99 latencies of the recorded requests per model and exit.
+    archive         Pack the saved conversations that were not updated for ARCHIVE_AFTER_DAYS days (default: 30)
+                    into compressed archives and exit.
+    --export NAME   Print a saved conversation, archived or not, and exit. NAME is its file name in the save
+                    directory, or the path of a .jsonl or .archive file.
+    --format FORMAT Format of the export, `markdown` (default) or `json`.
+    --last N        Only export the last N messages.
+    --daemon        Keep the model client and its connection alive, and answer prompts sent to a Unix socket.
+    --session NAME  Send the prompt to the named session of the running daemon (default: default).
+    --fan-out MODELS
+                    Send every prompt to several models at the same time (comma-separated, e.g.
+                    gemini-pro,models/gemini-1.5-pro-latest), show their answers side by side and choose the one that
+                    goes into the conversation.
+    --first-wins    With --fan-out, only show the first answer and keep it.
+    --no-cache      Do not use the response cache (enabled with RESPONSE_CACHE=true).
+    --batch FILE    Send every prompt of FILE (`-` for stdin) concurrently and print the results as JSON lines.
+                    A line is either a plain prompt or a JSON object like {"prompt": "..."}.
+    --concurrency N Number of prompts sent at the same time in batch mode (default: 4).
+    --rate N        Maximum number of prompts sent per second in batch mode.
+    --raw           Write the answer to stdout as plain text while it arrives, and exit. This is the default when
+                    stdout is not a terminal, e.g. geminal explain this error | less.
+    --json          Write the answer as a JSON object with the text, the model, the latency, the token usage and the
+                    finish reason, and exit.
+    -f, --file PATH Ask the prompt about a file, the text files of a directory, or stdin for `-`. It can be repeated.
+                    Input that is piped into geminal is read the same way, e.g. cat app.log | geminal why did it fail?
+                    Input larger than the context of the model is answered in parts that are combined afterwards.
+                    A pipe is read until it is closed, use `< /dev/null` when a prompt has no input.
 
 prompt:
     Your prompt can be added after `geminal`. Example: geminal who are you?
@@ -32,6 +32,7 @@ SOFTWARE.
 """
 import os
 import re
+import stat
 import sys
 
 
@@ -71,3 +72,27 @@ def to_separated_text_w_char(s: str, char: str = '_') -> str:
     words: list[str] = re.findall(pattern=r'[a-zA-Z0-9]+', string=s)
     separated_text: str = char.join([word.lower() for word in words])
     return separated_text
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KB', 'MB',):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} GB"
+
+
+def has_piped_input() -> bool:
+    """
+    Check if data is piped or redirected into stdin, e.g. `cat app.log | geminal` or `geminal < app.log`.
+
+    A terminal, /dev/null or a socket is not an input. A pipe is always one, even if the command that writes into it is
+    slow, it is read until it is closed. An empty input is answered like a prompt without input.
+    """
+    try:
+        mode: int = os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError,):
+        return False
+
+    return stat.S_ISREG(mode) or stat.S_ISFIFO(mode)
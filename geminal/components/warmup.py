@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import logging
+import time
+from threading import Event, Lock, Thread
+
+from .config import conf
+from .gemini import get_model
+
+
+class ConnectionWarmer:
+    """
+    Keep the connection to the API warm from `start` to `stop`, i.e. for the whole interactive session or daemon.
+
+    The first ping configures the client and sets up the connection (DNS, TLS, channel), then a cheap token count is
+    sent whenever the connection has been idle for `interval` seconds, so that it is not dropped between turns.
+    """
+
+    def __init__(self, interval: int) -> None:
+        self.interval: int = max(interval, 1)
+        self.last_used_at: float | None = None
+
+        # every keep-alive thread has a stop event of its own, so a stopped thread always ends, even if it is started
+        # again before it noticed.
+        self.__lock: Lock = Lock()
+        self.__stop_event: Event | None = None
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.__stop_event is not None:
+                return
+
+            self.__stop_event = Event()
+            Thread(target=self.__run, args=(self.__stop_event,), name='geminal-keep-alive', daemon=True).start()
+
+    def stop(self) -> None:
+        with self.__lock:
+            if self.__stop_event is None:
+                return
+
+            # a ping in flight is not waited for, the request shares its connection.
+            self.__stop_event.set()
+            self.__stop_event = None
+
+    def is_running(self) -> bool:
+        with self.__lock:
+            return self.__stop_event is not None
+
+    def mark_used(self) -> None:
+        self.last_used_at = time.monotonic()
+
+    def is_warm(self) -> bool:
+        """
+        Whether the connection was used recently enough to still be open, pings keep it used every `interval`.
+        """
+        return self.last_used_at is not None and time.monotonic() - self.last_used_at < 2 * self.interval
+
+    def __run(self, stop_event: Event) -> None:
+        while not stop_event.is_set():
+            idle_time: float | None = None if self.last_used_at is None else time.monotonic() - self.last_used_at
+            if idle_time is None or idle_time >= self.interval:
+                self.__ping()
+                idle_time = 0.0
+
+            stop_event.wait(timeout=self.interval - idle_time)
+
+    def __ping(self) -> None:
+        try:
+            get_model().count_tokens('ping')
+            self.mark_used()
+        except Exception as e:
+            logging.debug(f"Unable to warm up the connection: {repr(e)}")
+
+
+connection_warmer: ConnectionWarmer | None = None
+
+
+def get_connection_warmer() -> ConnectionWarmer:
+    global connection_warmer
+
+    if connection_warmer is None:
+        connection_warmer = ConnectionWarmer(interval=conf['settings']['keep_alive_interval'])
+
+    return connection_warmer
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import json
+import os
+from typing import Dict, List
+
+import pytest
+
+from components import archive
+from components.archive import (
+    ConversationArchive, TRAILER, archive_conversation, export_conversation, find_saved_conversation,
+    is_saved_conversation, read_saved_conversation, unpack_archive
+)
+from components.conversation import read_conversation
+
+METADATA: Dict = {'model_name': 'gemini-pro', 'created_at': 1700000000.0}
+
+
+def make_turns(count: int) -> List[Dict]:
+    return [
+        {'role': 'user' if index % 2 == 0 else 'model', 'parts': [{'text': f'Turn {index}: ' + 'lorem ipsum ' * 40}]}
+        for index in range(count)
+    ]
+
+
+def write_conversation(path: str, turns: List[Dict]) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(''.join(json.dumps(obj=record, ensure_ascii=False) + '\n' for record in [METADATA, *turns]))
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # a few turns per block, so that reading a range crosses block boundaries.
+    monkeypatch.setattr(archive, 'BLOCK_SIZE', 2048)
+
+
+def test_archive_round_trip(tmp_path, small_blocks):
+    path: str = os.path.join(tmp_path, 'chat.archive')
+    turns: List[Dict] = make_turns(count=50)
+    ConversationArchive.pack(path=path, metadata=METADATA, turns=turns)
+
+    with ConversationArchive(path=path) as conversation_archive:
+        assert conversation_archive.metadata == METADATA
+        assert conversation_archive.turn_count == 50
+        assert len(conversation_archive.blocks) > 1
+        assert conversation_archive.read_turns() == turns
+        assert conversation_archive.read_turn(index=0) == turns[0]
+        assert conversation_archive.read_turn(index=49) == turns[49]
+        assert conversation_archive.read_turns(start=3, stop=17) == turns[3:17]
+        assert conversation_archive.tail(count=5) == turns[-5:]
+        assert conversation_archive.tail(count=100) == turns
+
+        with pytest.raises(IndexError):
+            conversation_archive.read_turn(index=50)
+
+
+def test_every_turn_is_in_exactly_one_block(tmp_path, small_blocks):
+    path: str = os.path.join(tmp_path, 'chat.archive')
+    ConversationArchive.pack(path=path, metadata=METADATA, turns=make_turns(count=23))
+
+    with ConversationArchive(path=path) as conversation_archive:
+        first_turn_indexes: List[int] = [block[2] for block in conversation_archive.blocks]
+        turn_counts: List[int] = [block[3] for block in conversation_archive.blocks]
+
+    assert first_turn_indexes[0] == 0
+    assert all(
+        first_turn_indexes[index] + turn_counts[index] == first_turn_indexes[index + 1]
+        for index in range(len(first_turn_indexes) - 1)
+    )
+    assert sum(turn_counts) == 23
+
+
+def test_empty_conversation(tmp_path):
+    path: str = os.path.join(tmp_path, 'empty.archive')
+    ConversationArchive.pack(path=path, metadata=METADATA, turns=[])
+
+    with ConversationArchive(path=path) as conversation_archive:
+        assert conversation_archive.turn_count == 0
+        assert conversation_archive.read_turns() == []
+        assert conversation_archive.tail(count=3) == []
+
+
+def test_truncated_and_foreign_files_are_rejected(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.archive')
+    ConversationArchive.pack(path=path, metadata=METADATA, turns=make_turns(count=5))
+
+    with open(path, 'rb') as file:
+        data: bytes = file.read()
+    with open(path, 'wb') as file:
+        file.write(data[:-TRAILER.size // 2])
+
+    with pytest.raises(ValueError):
+        ConversationArchive(path=path)
+
+    foreign_path: str = os.path.join(tmp_path, 'foreign.archive')
+    with open(foreign_path, 'wb') as file:
+        file.write(b'{"model_name": "gemini-pro"}\n' * 10)
+
+    with pytest.raises(ValueError):
+        ConversationArchive(path=foreign_path)
+
+
+def test_archive_and_unpack_a_conversation(tmp_path, small_blocks):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    turns: List[Dict] = make_turns(count=30)
+    write_conversation(path=path, turns=turns)
+    os.utime(path, (1700000000, 1700000000,))
+
+    archive_path: str = archive_conversation(path=path)
+
+    assert archive_path == os.path.join(tmp_path, 'chat.archive')
+    assert not os.path.exists(path)
+    assert os.path.getmtime(archive_path) == 1700000000
+    assert os.path.getsize(archive_path) < sum(len(json.dumps(turn)) for turn in turns)
+    assert read_saved_conversation(path=archive_path) == (METADATA, turns)
+
+    assert unpack_archive(path=archive_path) == path
+    assert not os.path.exists(archive_path)
+    assert read_conversation(path=path) == (METADATA, turns)
+
+
+def test_export_the_last_turns(tmp_path, small_blocks):
+    path: str = os.path.join(tmp_path, 'chat.archive')
+    turns: List[Dict] = make_turns(count=12)
+    ConversationArchive.pack(path=path, metadata=METADATA, turns=turns)
+
+    exported: Dict = json.loads(export_conversation(path=path, output_format='json', last_turn_count=2))
+    markdown: str = export_conversation(path=path, output_format='markdown', last_turn_count=2)
+
+    assert exported['metadata'] == METADATA
+    assert [turn['text'] for turn in exported['turns']] == [turn['parts'][0]['text'] for turn in turns[10:]]
+    assert markdown.startswith('# chat\n\n## You\n\nTurn 10:')
+    assert '## gemini-pro\n\nTurn 11:' in markdown
+
+
+def test_only_saved_conversations_are_found(tmp_path, monkeypatch, small_blocks):
+    save_dir: str = os.path.join(tmp_path, 'saved')
+    os.makedirs(save_dir)
+    write_conversation(path=os.path.join(save_dir, 'chat.jsonl'), turns=make_turns(count=4))
+    write_conversation(path=os.path.join(save_dir, 'old.jsonl'), turns=make_turns(count=4))
+    archive_path: str = archive_conversation(path=os.path.join(save_dir, 'old.jsonl'))
+
+    # a file of the current directory is not taken for a conversation, nor changed.
+    monkeypatch.chdir(tmp_path)
+    with open('notes.md', 'w', encoding='utf-8') as file:
+        file.write('# Notes\n\nNot a conversation')
+
+    assert find_saved_conversation(save_dir=save_dir, name='notes.md') is None
+    assert find_saved_conversation(save_dir=save_dir, name='./notes.md') is None
+    assert os.path.getsize('notes.md') == len('# Notes\n\nNot a conversation')
+    assert find_saved_conversation(save_dir=save_dir, name='chat') == os.path.join(save_dir, 'chat.jsonl')
+    assert find_saved_conversation(save_dir=save_dir, name='old') == archive_path
+    assert find_saved_conversation(save_dir=save_dir, name=archive_path) == archive_path
+
+    # an explicit path with the suffix is checked before it is read.
+    os.rename('notes.md', 'notes.jsonl')
+    assert find_saved_conversation(save_dir=save_dir, name='./notes.jsonl') == './notes.jsonl'
+    assert not is_saved_conversation(path='./notes.jsonl')
+    assert is_saved_conversation(path=os.path.join(save_dir, 'chat.jsonl'))
+    assert is_saved_conversation(path=archive_path)
+
+    with open(archive_path, 'rb') as file:
+        archive_bytes: bytes = file.read()
+    with open('cut.archive', 'wb') as file:
+        file.write(archive_bytes[:-1])
+    assert not is_saved_conversation(path='cut.archive')
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+from typing import Dict, List
+
+from components.autosave import Autosave, is_locked
+from components.conversation import read_conversation
+from components.turns import TurnHistory
+
+TURNS: List[Dict] = [
+    {'role': 'user', 'parts': [{'text': 'Hello'}]},
+    {'role': 'model', 'parts': [{'text': 'Hi, how can I help?'}]},
+]
+
+
+def autosave_turns(autosave: Autosave, turns: List[Dict]) -> None:
+    history: TurnHistory = TurnHistory(memory_limit=1024)
+    history.extend(contents=turns)
+    autosave.save(history=history)
+    autosave.flush()
+
+
+def test_session_is_offered_to_be_resumed(tmp_path):
+    autosave: Autosave = Autosave(sessions_dir=str(tmp_path), session_count=5)
+    autosave_turns(autosave=autosave, turns=TURNS)
+
+    path: str = autosave.conversation.path
+    assert read_conversation(path=path)[1] == TURNS
+    # the session is locked while this run uses it.
+    assert is_locked(path=path)
+    assert autosave.find_last_session() is None
+
+
+def test_discarded_session_is_not_offered_to_be_resumed(tmp_path):
+    autosave: Autosave = Autosave(sessions_dir=str(tmp_path), session_count=5)
+    autosave_turns(autosave=autosave, turns=TURNS)
+    path: str = autosave.conversation.path
+
+    autosave.discard()
+
+    assert not os.path.exists(path)
+    assert Autosave(sessions_dir=str(tmp_path), session_count=5).find_last_session() is None
+    # the next turns are saved to a new session, without the discarded ones.
+    autosave_turns(autosave=autosave, turns=TURNS[:1])
+    assert read_conversation(path=autosave.conversation.path)[1] == TURNS[:1]
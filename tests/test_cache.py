@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+import time
+from threading import Thread
+from typing import List
+
+from components.cache import ResponseCache
+
+
+def make_cache(tmp_path, ttl: int = 60, max_size: int = 1024 * 1024) -> ResponseCache:
+    return ResponseCache(path=os.path.join(tmp_path, 'cache.sqlite3'), ttl=ttl, max_size=max_size)
+
+
+def test_put_and_get(tmp_path):
+    cache: ResponseCache = make_cache(tmp_path=tmp_path)
+    key: str = ResponseCache.make_key(model_name='gemini-pro', chat_history=[], user_prompt='Hello')
+
+    assert cache.get(key=key) is None
+    cache.put(key=key, model_name='gemini-pro', response='Hi!')
+    assert cache.get(key=key) == 'Hi!'
+
+
+def test_make_key_depends_on_the_chat_history():
+    history: List = [{'role': 'user', 'parts': ['Hello']}]
+
+    assert ResponseCache.make_key(model_name='gemini-pro', chat_history=[], user_prompt='Hello') != \
+        ResponseCache.make_key(model_name='gemini-pro', chat_history=history, user_prompt='Hello')
+
+
+def test_expired_entries_are_not_returned(tmp_path):
+    cache: ResponseCache = make_cache(tmp_path=tmp_path, ttl=0)
+    cache.put(key='key', model_name='gemini-pro', response='Hi!')
+    time.sleep(0.01)
+
+    assert cache.get(key='key') is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache: ResponseCache = make_cache(tmp_path=tmp_path, max_size=20)
+    cache.put(key='first', model_name='gemini-pro', response='a' * 10)
+    cache.put(key='second', model_name='gemini-pro', response='b' * 10)
+    cache.get(key='first')
+    cache.put(key='third', model_name='gemini-pro', response='c' * 10)
+
+    assert cache.get(key='second') is None
+    assert cache.get(key='first') == 'a' * 10
+    assert cache.get(key='third') == 'c' * 10
+
+
+def test_cache_is_shared_between_threads(tmp_path):
+    cache: ResponseCache = make_cache(tmp_path=tmp_path)
+    # the connection is opened by this thread, the prompts are answered by others.
+    cache.put(key='key', model_name='gemini-pro', response='Hi!')
+
+    errors: List[Exception] = []
+    responses: List[str | None] = []
+
+    def answer(index: int) -> None:
+        try:
+            cache.put(key=f'key-{index}', model_name='gemini-pro', response=str(index))
+            responses.append(cache.get(key='key'))
+        except Exception as e:
+            errors.append(e)
+
+    threads: List[Thread] = [Thread(target=answer, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert responses == ['Hi!'] * 8
+    assert cache.get(key='key-7') == '7'
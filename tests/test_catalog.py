@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+from typing import Dict, List
+
+from components.catalog import Catalog, to_match_expression
+from components.conversation import Conversation, read_conversation
+from components.turns import TurnHistory
+
+
+def to_turns(texts: List[str]) -> TurnHistory:
+    history: TurnHistory = TurnHistory(memory_limit=1024)
+    history.extend(contents=[
+        {'role': 'user' if index % 2 == 0 else 'model', 'parts': [text]}
+        for index, text in enumerate(texts)
+    ])
+    return history
+
+
+def make_conversation(save_dir: str, name: str, texts: List[str]) -> Conversation:
+    conversation: Conversation = Conversation.create(
+        path=os.path.join(save_dir, f'{name}.jsonl'),
+        model_name='gemini-pro'
+    )
+    conversation.append(contents=to_turns(texts=texts))
+    return conversation
+
+
+def make_catalog(tmp_path) -> Catalog:
+    save_dir: str = os.path.join(tmp_path, 'conversations')
+    os.makedirs(save_dir)
+    return Catalog(path=os.path.join(tmp_path, 'catalog.sqlite3'), save_dir=save_dir)
+
+
+def file_names(results: List[Dict]) -> List[str]:
+    return sorted(result['file_name'] for result in results)
+
+
+def test_sync_indexes_the_conversations_on_disk(tmp_path):
+    catalog: Catalog = make_catalog(tmp_path=tmp_path)
+    make_conversation(save_dir=catalog.save_dir, name='python_help', texts=['How do I sort a dict?', 'Use sorted().'])
+    make_conversation(save_dir=catalog.save_dir, name='cooking', texts=['A recipe for pho?', 'Simmer the broth.'])
+
+    catalog.sync()
+    results: List[Dict] = catalog.search()
+
+    assert file_names(results=results) == ['cooking.jsonl', 'python_help.jsonl']
+    python_help: Dict = next(result for result in results if result['file_name'] == 'python_help.jsonl')
+    assert python_help['title'] == 'Python Help'
+    assert python_help['turn_count'] == 2
+    assert python_help['preview'] == 'How do I sort a dict?'
+
+
+def test_search_matches_every_word_and_prefixes(tmp_path):
+    catalog: Catalog = make_catalog(tmp_path=tmp_path)
+    make_conversation(save_dir=catalog.save_dir, name='python_help', texts=['How do I sort a dict?', 'Use sorted().'])
+    make_conversation(save_dir=catalog.save_dir, name='cooking', texts=['A recipe for pho?', 'Simmer the broth.'])
+    catalog.sync()
+
+    assert file_names(results=catalog.search(query='broth')) == ['cooking.jsonl']
+    assert file_names(results=catalog.search(query='sort dict')) == ['python_help.jsonl']
+    assert file_names(results=catalog.search(query='simm')) == ['cooking.jsonl']
+    assert file_names(results=catalog.search(query='sort broth')) == []
+    # the title is searched too.
+    assert file_names(results=catalog.search(query='Python Help')) == ['python_help.jsonl']
+
+
+def test_search_treats_operators_as_text(tmp_path):
+    catalog: Catalog = make_catalog(tmp_path=tmp_path)
+    make_conversation(save_dir=catalog.save_dir, name='quotes', texts=['He said "NOT" AND left (quickly)', 'OK.'])
+    catalog.sync()
+
+    assert file_names(results=catalog.search(query='"NOT" AND (quickly')) == ['quotes.jsonl']
+    assert to_match_expression(query='a "b"') == '"a" """b"""*'
+
+
+def test_record_adds_new_turns_incrementally(tmp_path):
+    catalog: Catalog = make_catalog(tmp_path=tmp_path)
+    conversation: Conversation = make_conversation(save_dir=catalog.save_dir, name='chat', texts=['Hello', 'Hi!'])
+    catalog.record(conversation=conversation, turns=read_conversation(path=conversation.path)[1])
+
+    new_turns: List[Dict] = conversation.append(contents=to_turns(texts=['Tell me about zebras']))
+    catalog.record(conversation=conversation, turns=new_turns)
+
+    assert file_names(results=catalog.search(query='zebras')) == ['chat.jsonl']
+    assert catalog.search(query='zebras')[0]['turn_count'] == 3
+    assert catalog.search(query='zebras')[0]['preview'] == 'Hello'
+
+
+def test_removed_and_changed_files_are_synced(tmp_path):
+    catalog: Catalog = make_catalog(tmp_path=tmp_path)
+    first: Conversation = make_conversation(save_dir=catalog.save_dir, name='first', texts=['apples'])
+    make_conversation(save_dir=catalog.save_dir, name='second', texts=['bananas'])
+    catalog.sync()
+
+    os.unlink(first.path)
+    make_conversation(save_dir=catalog.save_dir, name='third', texts=['cherries'])
+    catalog.sync()
+
+    assert file_names(results=catalog.search()) == ['second.jsonl', 'third.jsonl']
+    assert catalog.search(query='apples') == []
+
+
+def test_corrupted_catalog_is_rebuilt(tmp_path):
+    catalog: Catalog = make_catalog(tmp_path=tmp_path)
+    make_conversation(save_dir=catalog.save_dir, name='chat', texts=['durian'])
+    with open(catalog.path, 'wb') as file:
+        file.write(b'this is not a database' * 100)
+
+    catalog.sync()
+
+    assert file_names(results=catalog.search(query='durian')) == ['chat.jsonl']
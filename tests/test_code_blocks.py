@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+from typing import List, Tuple
+
+from components.code_blocks import CodeBlockIndex
+
+TEXT: str = (
+    "Here is some Python:\n"
+    "\n"
+    "```python\n"
+    "def add(a: int, b: int) -> int:\n"
+    "    return a + b\n"
+    "```\n"
+    "\n"
+    "Run it with `python`, or ```inline fences``` in the text, which are not blocks.\n"
+    "\n"
+    "1. Then a shell command:\n"
+    "\n"
+    "   ```bash\n"
+    "   echo 'hello'\n"
+    "   ```\n"
+    "\n"
+    "And a block without a language:\n"
+    "```\n"
+    "plain text\n"
+    "```"
+)
+
+
+def to_tuples(code_block_index: CodeBlockIndex) -> List[Tuple[int, str, str, int]]:
+    return [
+        (code_block.index, code_block.language, code_block.code, code_block.offset)
+        for code_block in code_block_index.blocks
+    ]
+
+
+def test_blocks_are_indexed():
+    code_block_index: CodeBlockIndex = CodeBlockIndex.from_text(text=TEXT)
+
+    assert to_tuples(code_block_index=code_block_index) == [
+        (0, 'python', "def add(a: int, b: int) -> int:\n    return a + b\n", TEXT.index('```python')),
+        (1, 'bash', "   echo 'hello'\n", TEXT.index('```bash')),
+        (2, '', 'plain text\n', TEXT.rindex('```\nplain')),
+    ]
+    assert code_block_index.blocks[0].label == '[1] python (2 lines)'
+    assert code_block_index.text == TEXT
+
+
+def test_chunks_are_indexed_like_the_whole_text():
+    expected: List[Tuple[int, str, str, int]] = to_tuples(code_block_index=CodeBlockIndex.from_text(text=TEXT))
+
+    for chunk_size in range(1, 40):
+        code_block_index: CodeBlockIndex = CodeBlockIndex()
+        for offset in range(0, len(TEXT), chunk_size):
+            code_block_index.feed(chunk=TEXT[offset:offset + chunk_size])
+        code_block_index.finish()
+
+        assert to_tuples(code_block_index=code_block_index) == expected, chunk_size
+
+
+def test_inline_fences_do_not_keep_the_text():
+    code_block_index: CodeBlockIndex = CodeBlockIndex()
+    code_block_index.feed(chunk='Use ```inline``` fences, or a lone ``` in the middle of a line.\n')
+    for _ in range(1000):
+        code_block_index.feed(chunk='More text without any code block. ' * 4 + '\n')
+
+    # only the line that is not complete yet is buffered.
+    assert code_block_index._CodeBlockIndex__buffer == ''
+    assert code_block_index._CodeBlockIndex__code_parts == []
+    code_block_index.finish()
+    assert code_block_index.blocks == []
+
+
+def test_unclosed_block_ends_with_the_response():
+    code_block_index: CodeBlockIndex = CodeBlockIndex.from_text(text='Start:\n```js\nconsole.log(1);\nconsole.log(2);')
+
+    assert to_tuples(code_block_index=code_block_index) == [(0, 'js', 'console.log(1);\nconsole.log(2);', 7)]
+    assert code_block_index._CodeBlockIndex__code_parts == []
+
+
+def test_fence_with_an_info_string_does_not_close_a_block():
+    code_block_index: CodeBlockIndex = CodeBlockIndex.from_text(
+        text='```markdown\nExample:\n```python\nx = 1\n```\n'
+    )
+
+    assert [code_block.code for code_block in code_block_index.blocks] == ['Example:\n```python\nx = 1\n']
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import time
+from threading import Event, Timer
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+
+from components.context import ContextWindow
+from components.scheduler import RequestCancelled
+from components.turns import TurnHistory
+
+TURNS: List[Dict] = [
+    {'role': 'user' if index % 2 == 0 else 'model', 'parts': [{'text': f"Turn {index}: " + 'word ' * 100}]}
+    for index in range(20)
+]
+
+
+class SummaryModel:
+    """
+    Answer the summary requests once `released` is set, like a slow API.
+    """
+
+    def __init__(self) -> None:
+        self.released: Event = Event()
+
+    def generate_content(self, prompt: str) -> SimpleNamespace:
+        self.released.wait(timeout=10)
+        return SimpleNamespace(text='A short summary.')
+
+
+def create_context_window(model: SummaryModel) -> ContextWindow:
+    history: TurnHistory = TurnHistory(memory_limit=64 * 1024)
+    history.extend(contents=TURNS)
+
+    return ContextWindow(
+        chat=SimpleNamespace(model=model, history=[]),
+        budget=1000,
+        policy='summary',
+        pinned_turn_count=0,
+        history=history
+    )
+
+
+def test_summary_request_is_cancelled(monkeypatch):
+    # the scheduler only reads the API key, no request reaches the API.
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    model: SummaryModel = SummaryModel()
+    context_window: ContextWindow = create_context_window(model=model)
+    cancel_event: Event = Event()
+    Timer(interval=0.1, function=cancel_event.set).start()
+
+    start_time: float = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        context_window.select(history=context_window.history, user_prompt='Next?', cancel_event=cancel_event)
+    assert time.monotonic() - start_time < 5
+
+    # the cancelled summary is requested again with the next prompt.
+    model.released.set()
+    window: List = context_window.select(history=context_window.history, user_prompt='Next?')
+    assert window[0]['parts'] == ['Summary of our earlier conversation:\nA short summary.']
+    assert len(window) < len(TURNS)
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import json
+import os
+from typing import Dict, List
+
+from components.conversation import (
+    Conversation, is_conversation, LEGACY_DIR_NAME, migrate_legacy_conversations, read_conversation, turn_to_text
+)
+from components.turns import TurnHistory
+
+TURNS: List[Dict] = [
+    {'role': 'user', 'parts': [{'text': 'What is 1 + 1?'}]},
+    {'role': 'model', 'parts': [{'text': 'It is 2.\n\n```python\nprint(1 + 1)\n```'}]},
+    {'role': 'user', 'parts': [{'text': 'Và tiếng Việt? 日本語?'}]},
+    {'role': 'model', 'parts': [{'text': 'Có. はい。'}]},
+]
+
+
+def save(path: str, turns: List[Dict]) -> Conversation:
+    history: TurnHistory = TurnHistory(memory_limit=1024)
+    history.extend(contents=turns)
+
+    conversation: Conversation = Conversation.create(path=path, model_name='gemini-pro')
+    conversation.sync(history=history)
+    return conversation
+
+
+def test_conversation_round_trip(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    save(path=path, turns=TURNS)
+
+    metadata, turns = read_conversation(path=path)
+
+    assert metadata['model_name'] == 'gemini-pro'
+    assert turns == TURNS
+    assert Conversation.open(path=path)[0].turn_count == len(TURNS)
+
+
+def test_sync_only_appends_the_new_turns(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    history: TurnHistory = TurnHistory(memory_limit=1024)
+    conversation: Conversation = Conversation.create(path=path, model_name='gemini-pro')
+
+    history.extend(contents=TURNS[:2])
+    assert conversation.sync(history=history) == TURNS[:2]
+    history.extend(contents=TURNS[2:])
+    assert conversation.sync(history=history) == TURNS[2:]
+    assert conversation.sync(history=history) == []
+
+    assert read_conversation(path=path)[1] == TURNS
+
+
+def test_partially_written_last_line_is_dropped_on_open(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    save(path=path, turns=TURNS)
+    valid_size: int = os.path.getsize(path)
+
+    # the program crashed while the next turn was written.
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(obj=TURNS[0], ensure_ascii=False)[:10])
+    partial_size: int = os.path.getsize(path)
+
+    # reading does not change the file, another Geminal may still be writing the line.
+    assert read_conversation(path=path)[1] == TURNS
+    assert os.path.getsize(path) == partial_size
+
+    # the file is repaired when it is opened to append to it.
+    opened_conversation, turns = Conversation.open(path=path)
+    assert turns == TURNS
+    assert os.path.getsize(path) == valid_size
+
+    history: TurnHistory = TurnHistory(memory_limit=1024)
+    history.extend(contents=TURNS + TURNS[:1])
+    opened_conversation.sync(history=history)
+    assert read_conversation(path=path)[1] == TURNS + TURNS[:1]
+
+
+def test_damaged_line_keeps_the_next_turns(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    save(path=path, turns=TURNS[:2])
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write('{"role": "user", "par\n')
+    history: TurnHistory = TurnHistory(memory_limit=1024)
+    history.extend(contents=TURNS[2:])
+    Conversation.open(path=path)[0].append(contents=history)
+    size: int = os.path.getsize(path)
+
+    assert read_conversation(path=path)[1] == TURNS
+    assert Conversation.open(path=path)[1] == TURNS
+    assert os.path.getsize(path) == size
+
+
+def test_only_conversations_have_a_header(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    save(path=path, turns=TURNS)
+    notes_path: str = os.path.join(tmp_path, 'notes.md')
+    with open(notes_path, 'w', encoding='utf-8') as file:
+        file.write('# Notes\n\nSome text.\n')
+
+    assert is_conversation(path=path)
+    assert not is_conversation(path=notes_path)
+    assert not is_conversation(path=os.path.join(tmp_path, 'missing.jsonl'))
+
+
+def test_last_line_without_a_newline_is_dropped(tmp_path):
+    path: str = os.path.join(tmp_path, 'chat.jsonl')
+    save(path=path, turns=TURNS)
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(obj=TURNS[0], ensure_ascii=False))
+
+    assert read_conversation(path=path)[1] == TURNS
+
+
+def test_legacy_conversations_are_migrated(tmp_path):
+    save_dir: str = str(tmp_path)
+    legacy_messages: List[Dict[str, str]] = [
+        {'role': 'user', 'text': 'Hello\\nthere'},
+        {'role': 'model', 'text': 'Xin ch\\303\\240o'},
+    ]
+    with open(os.path.join(save_dir, 'old_chat.json'), 'w', encoding='utf-8') as file:
+        json.dump(obj=legacy_messages, fp=file)
+
+    assert migrate_legacy_conversations(save_dir=save_dir) == ['old_chat.json']
+
+    metadata, turns = read_conversation(path=os.path.join(save_dir, 'old_chat.jsonl'))
+    assert metadata['model_name'] is None
+    assert [turn['role'] for turn in turns] == ['user', 'model']
+    assert [turn_to_text(turn=turn) for turn in turns] == ['Hello\nthere', 'Xin chào']
+    assert os.path.exists(os.path.join(save_dir, LEGACY_DIR_NAME, 'old_chat.json'))
+
+    # the migration is only done once.
+    assert migrate_legacy_conversations(save_dir=save_dir) == []
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import io
+import os
+from typing import Any, List
+
+import pytest
+from google.generativeai import GenerativeModel, protos
+from google.generativeai.types import content_types, generation_types
+from rich.console import Console
+
+from components import cache, daemon, gemini
+from components.config import conf
+from components.conversation import read_conversation
+
+
+class FakeModel(GenerativeModel):
+    """
+    Answer every prompt locally with a single streamed chunk, and keep the prompts it was sent.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(model_name='gemini-pro')
+        self.prompts: List[str] = []
+
+    def generate_content(self, contents: Any, *, stream: bool = False, **kwargs) -> Any:
+        self.prompts.append(content_types.to_contents(contents)[-1].parts[0].text)
+        chunk: protos.GenerateContentResponse = protos.GenerateContentResponse(candidates=[protos.Candidate(
+            content=protos.Content(role='model', parts=[protos.Part(text=f'Answer {len(self.prompts)}')]),
+            finish_reason=protos.Candidate.FinishReason.STOP
+        )])
+        return generation_types.GenerateContentResponse.from_iterator(iter([chunk]))
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch) -> FakeModel:
+    fake_model: FakeModel = FakeModel()
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.setattr(gemini, 'model', fake_model)
+    monkeypatch.setattr(cache, 'response_cache', None)
+    monkeypatch.setitem(conf['settings'], 'response_cache', True)
+    monkeypatch.setitem(conf['settings'], 'response_cache_path', os.path.join(tmp_path, 'cache.sqlite3'))
+    monkeypatch.setitem(conf['settings'], 'autosave', True)
+    monkeypatch.setitem(conf['settings'], 'sessions_dir', os.path.join(tmp_path, 'sessions'))
+    monkeypatch.setitem(conf['settings'], 'repo_index_dir', os.path.join(tmp_path, 'indexes'))
+
+    return fake_model
+
+
+def ask(session: daemon.Session, user_prompt: str, **kwargs) -> str:
+    output: io.StringIO = io.StringIO()
+    daemon.answer(session=session, user_prompt=user_prompt, console=Console(file=output, width=100), **kwargs)
+    return output.getvalue()
+
+
+def test_answer_is_cached_and_autosaved(model):
+    session: daemon.Session = daemon.Session(name='test')
+
+    assert 'Answer 1' in ask(session=session, user_prompt='What is 1 + 1?')
+    assert model.prompts == ['What is 1 + 1?']
+    assert session.prompt_count == 1
+
+    session.autosave.flush()
+    assert [turn['role'] for turn in read_conversation(path=session.autosave.conversation.path)[1]] == ['user', 'model']
+
+    # the same prompt in the same context is answered from the cache.
+    other_session: daemon.Session = daemon.Session(name='other')
+    output: str = ask(session=other_session, user_prompt='What is 1 + 1?')
+    assert 'Answer 1' in output and 'Cache: HIT' in output
+    assert len(model.prompts) == 1
+    assert [turn.text for turn in other_session.context_window.history] == ['What is 1 + 1?', 'Answer 1']
+
+    # --no-cache of the client skips the cache.
+    assert 'Answer 2' in ask(session=daemon.Session(name='no-cache'), user_prompt='What is 1 + 1?', use_cache=False)
+    assert len(model.prompts) == 2
+
+
+def test_repo_marker_is_expanded_in_the_client_directory(model, tmp_path):
+    repo_dir: str = os.path.join(tmp_path, 'repo')
+    os.makedirs(repo_dir)
+    with open(os.path.join(repo_dir, 'checksum.py'), 'w', encoding='utf-8') as file:
+        file.write('def compute_checksum(data):\n    return sum(data) % 256\n')
+
+    output: str = ask(
+        session=daemon.Session(name='repo'),
+        user_prompt='@repo where is the checksum computed?',
+        cwd=repo_dir,
+        use_cache=False
+    )
+
+    assert 'checksum.py:1-2' in output
+    assert '@repo' not in model.prompts[0]
+    assert 'def compute_checksum(data):' in model.prompts[0]
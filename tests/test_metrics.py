@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+from typing import Any, Dict, List
+
+import pytest
+
+from components.config import conf
+from components.metrics import RequestMetrics, get_stats, read_metrics, record_metrics
+
+
+def make_metrics(total: float, cache: str | None = None) -> RequestMetrics:
+    request_metrics: RequestMetrics = RequestMetrics(model_name='gemini-pro', stream=True)
+    request_metrics.cache = cache
+    request_metrics.total = total
+    if cache != 'hit':
+        request_metrics.network = request_metrics.first_byte = total
+    return request_metrics
+
+
+@pytest.fixture
+def metrics_path(tmp_path, monkeypatch) -> str:
+    path: str = os.path.join(tmp_path, 'metrics.jsonl')
+    monkeypatch.setitem(conf['settings'], 'metrics', True)
+    monkeypatch.setitem(conf['settings'], 'metrics_path', path)
+    monkeypatch.setitem(conf['settings'], 'metrics_textfile', None)
+    return path
+
+
+def test_log_is_rotated_once_it_is_too_large(metrics_path, monkeypatch):
+    monkeypatch.setitem(conf['settings'], 'metrics_max_size', 4096)
+
+    for index in range(200):
+        record_metrics(request_metrics=make_metrics(total=index))
+
+    assert os.path.getsize(metrics_path) <= 4096
+    assert os.path.getsize(f'{metrics_path}.1') <= 4096 + 1024
+    assert not os.path.exists(f'{metrics_path}.2')
+
+    # the stats read the rotated log too, and the last request is always kept.
+    totals: List[float] = [record['total'] for record in read_metrics(path=metrics_path)]
+    assert totals == sorted(totals) and totals[-1] == 199
+    assert len(totals) > 4096 // 300
+
+
+def test_cache_hits_are_left_out_of_the_latencies(metrics_path):
+    for total in (1.0, 2.0, 3.0, 4.0):
+        record_metrics(request_metrics=make_metrics(total=total, cache='miss'))
+    for _ in range(20):
+        record_metrics(request_metrics=make_metrics(total=0.001, cache='hit'))
+
+    stats: Dict[str, Any] = get_stats(records=read_metrics(path=metrics_path))['gemini-pro']
+
+    assert stats['requests'] == 24 and stats['cache_hits'] == 20
+    assert stats['phases']['total'] == {'p50': 2.0, 'p95': 4.0, 'p99': 4.0}
+    assert stats['phases']['first_byte']['p50'] == 2.0
+    assert stats['phases']['total (cache hit)']['p50'] == 0.001
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+import subprocess
+from typing import Iterator, List, Tuple
+
+import pytest
+
+from components import repo_index
+from components.config import conf
+
+
+def git(root: str, *arguments: str) -> None:
+    subprocess.run(['git', '-C', root, *arguments], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def write(path: str, text: str) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch) -> str:
+    monkeypatch.setitem(conf['settings'], 'repo_index_dir', os.path.join(tmp_path, 'indexes'))
+    monkeypatch.setitem(conf['settings'], 'repo_index_refresh_interval', 3600)
+    monkeypatch.setattr(repo_index, 'repo_indexes', {})
+
+    root: str = os.path.join(tmp_path, 'repo')
+    os.makedirs(root)
+    git(root, 'init', '-q')
+    write(path=os.path.join(root, 'cache.py'), text='def expire_entries(cache):\n    cache.clear()\n')
+    git(root, 'add', '.')
+
+    return root
+
+
+def count_listings(monkeypatch) -> List[str]:
+    listings: List[str] = []
+    list_files = repo_index.list_files
+
+    def counted_list_files(root: str) -> Iterator[Tuple[str, int, int]]:
+        listings.append(root)
+        return list_files(root=root)
+
+    monkeypatch.setattr(repo_index, 'list_files', counted_list_files)
+    return listings
+
+
+def test_files_are_only_listed_when_git_changed(repo, monkeypatch):
+    listings: List[str] = count_listings(monkeypatch=monkeypatch)
+
+    index, indexed_file_count = repo_index.get_repo_index(path=repo)
+    assert indexed_file_count == 1 and len(listings) == 1
+
+    # nothing changed, the files are not listed again.
+    assert repo_index.get_repo_index(path=repo) == (index, 0)
+    assert len(listings) == 1
+
+    # a new run loads the index and its state, and does not list the files either.
+    monkeypatch.setattr(repo_index, 'repo_indexes', {})
+    assert repo_index.get_repo_index(path=repo)[1] == 0
+    assert len(listings) == 1
+
+    # `git add` rewrites the index, only the new file is tokenized.
+    write(path=os.path.join(repo, 'retry.py'), text='def retry_request(request):\n    return request()\n')
+    git(repo, 'add', 'retry.py')
+    index, indexed_file_count = repo_index.get_repo_index(path=repo)
+    assert indexed_file_count == 1 and len(listings) == 2
+    assert index.search(query='retry request', count=1)[0][0] == 'retry.py'
+
+
+def test_files_are_listed_again_after_the_interval(repo, monkeypatch):
+    listings: List[str] = count_listings(monkeypatch=monkeypatch)
+    repo_index.get_repo_index(path=repo)
+
+    # an edit that git has not seen is only picked up after the interval.
+    write(path=os.path.join(repo, 'cache.py'), text='def evict_entries(cache):\n    cache.pop()\n')
+    os.utime(os.path.join(repo, 'cache.py'), ns=(1, 1))
+    assert repo_index.get_repo_index(path=repo)[1] == 0
+
+    monkeypatch.setitem(conf['settings'], 'repo_index_refresh_interval', 0)
+    index, indexed_file_count = repo_index.get_repo_index(path=repo)
+    assert indexed_file_count == 1 and len(listings) == 2
+    assert index.search(query='evict entries', count=1)[0][0] == 'cache.py'
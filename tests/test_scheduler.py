@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import time
+from threading import Event, Timer
+from typing import List
+
+import pytest
+
+from components.scheduler import RequestCancelled, RequestScheduler, TokenBucket
+
+
+def test_token_bucket_wait_is_cancelled():
+    # the next token is only available after 100s.
+    token_bucket: TokenBucket = TokenBucket(rate=0.01, capacity=1)
+    token_bucket.acquire()
+    cancel_event: Event = Event()
+    Timer(interval=0.1, function=cancel_event.set).start()
+
+    start_time: float = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        token_bucket.acquire(cancel_event=cancel_event)
+
+    assert time.monotonic() - start_time < 2
+
+
+def test_rate_limited_request_is_cancelled():
+    token_bucket: TokenBucket = TokenBucket(rate=0.01, capacity=1)
+    scheduler: RequestScheduler = RequestScheduler(
+        max_retries=0, base_delay=1, max_delay=1, token_bucket=token_bucket, hedge=False
+    )
+    assert scheduler.send(request=lambda: 'first') == 'first'
+
+    cancel_event: Event = Event()
+    Timer(interval=0.1, function=cancel_event.set).start()
+    requests: List[str] = []
+
+    start_time: float = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        scheduler.send(request=lambda: requests.append('second'), cancel_event=cancel_event)
+
+    assert time.monotonic() - start_time < 2
+    assert requests == []
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import io
+import math
+import re
+from typing import Any, List
+
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+
+from components import stream as stream_module
+from components.stream import MarkdownStream
+
+TEXT: str = (
+    "## Title\n\n"
+    "Some **bold** text and `inline code`, long enough to be wrapped by the panel at this width.\n\n"
+    "```python\n"
+    "def add(a: int, b: int) -> int:\n"
+    "\n"
+    "    return a + b\n"
+    "```\n\n"
+    "- one\n"
+    "- two\n"
+)
+
+
+def make_console() -> Console:
+    return Console(file=io.StringIO(), force_terminal=True, width=60, color_system='truecolor')
+
+
+def stream(text: str, chunk_size: int, refresh_interval: float, live: bool = True) -> str:
+    console: Console = make_console()
+    markdown_stream: MarkdownStream = MarkdownStream(
+        title='Gemini Pro',
+        console=console,
+        live=live,
+        refresh_interval=refresh_interval
+    )
+    markdown_stream.start()
+    for offset in range(0, len(text), chunk_size):
+        markdown_stream.update(chunk=text[offset:offset + chunk_size], subtitle='Time Elapsed: 0.1s')
+    markdown_stream.stop(subtitle='Time Elapsed: 0.2s')
+
+    return console.file.getvalue()
+
+
+def to_plain_text(output: str) -> str:
+    return re.sub(pattern=r'\x1b\[[0-9;?]*[A-Za-z]|\x1b\][^\x1b]*\x1b\\', repl='', string=output)
+
+
+def test_stream_ends_with_the_whole_answer():
+    console: Console = make_console()
+    console.print(Markdown(markup=TEXT))
+    expected_words: set = set(to_plain_text(output=console.file.getvalue()).split()) | {'Time', 'Elapsed:', '0.2s'}
+
+    for chunk_size in (1, 7, len(TEXT),):
+        words: set = set(to_plain_text(output=stream(text=TEXT, chunk_size=chunk_size, refresh_interval=0)).split())
+        assert expected_words <= words
+
+
+class Clock:
+    """
+    A clock for `time.perf_counter` that moves forward by `step` seconds on every reading.
+    """
+
+    def __init__(self, step: float) -> None:
+        self.step: float = step
+        self.now: float = 100.0
+
+    def perf_counter(self) -> float:
+        self.now += self.step
+        return self.now
+
+
+def count_redraws(monkeypatch, step: float) -> List[Any]:
+    redraws: List[Any] = []
+
+    class CountedLive(Live):
+        def update(self, renderable: Any, *, refresh: bool = False) -> None:
+            redraws.append(renderable)
+            super().update(renderable, refresh=refresh)
+
+    monkeypatch.setattr(stream_module, 'Live', CountedLive)
+    monkeypatch.setattr(stream_module, 'time', Clock(step=step))
+    return redraws
+
+
+def test_redraws_are_throttled(monkeypatch):
+    # 4 chunks arrive per refresh interval, the steps are exact in binary so no redraw is lost to rounding.
+    redraws: List[Any] = count_redraws(monkeypatch=monkeypatch, step=1 / 16)
+    chunk_count: int = math.ceil(len(TEXT) / 3)
+
+    output: str = stream(text=TEXT, chunk_size=3, refresh_interval=1 / 4)
+
+    assert len(redraws) == math.ceil(chunk_count / 4)
+    assert 'return a + b' in to_plain_text(output=output)
+
+    redraws.clear()
+    stream(text=TEXT, chunk_size=3, refresh_interval=0)
+    assert len(redraws) == chunk_count
+
+
+def test_final_flush_prints_every_block_once(monkeypatch):
+    # only the first chunk is drawn in the live area, the rest is printed when the blocks are completed or at the end.
+    redraws: List[Any] = count_redraws(monkeypatch=monkeypatch, step=0)
+
+    plain_text: str = to_plain_text(output=stream(text=TEXT, chunk_size=3, refresh_interval=60))
+
+    assert len(redraws) == 1
+    for line in ('Title', 'inline code', 'def add(a: int, b: int) -> int:', 'return a + b', 'one', 'two', '0.2s'):
+        assert plain_text.count(line) == 1, line
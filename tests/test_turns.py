@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import gc
+import tracemalloc
+from typing import Dict, List
+
+from components.turns import Turn, TurnHistory
+
+MEMORY_LIMIT: int = 64 * 1024
+TEXT_SIZE: int = 4 * 1024
+# a turn whose text is spilled keeps a small record in memory, far less than its text.
+TURN_RECORD_SIZE: int = 256
+
+
+def make_content(index: int) -> Dict:
+    return {'role': 'user' if index % 2 == 0 else 'model', 'parts': [f'{index} ü ' + 'x' * TEXT_SIZE]}
+
+
+def test_texts_are_read_back_after_they_are_spilled():
+    history: TurnHistory = TurnHistory(memory_limit=MEMORY_LIMIT)
+    history.extend(contents=[make_content(index=index) for index in range(100)])
+
+    assert history[0].is_spilled
+    assert not history[-1].is_spilled
+    assert [turn.text for turn in history] == [make_content(index=index)['parts'][0] for index in range(100)]
+    assert [turn.role for turn in history] == [make_content(index=index)['role'] for index in range(100)]
+    assert history[0].to_dict() == {'role': 'user', 'parts': [{'text': make_content(index=0)['parts'][0]}]}
+
+
+def test_memory_size_stays_within_the_limit():
+    history: TurnHistory = TurnHistory(memory_limit=MEMORY_LIMIT)
+    for index in range(200):
+        history.append(content=make_content(index=index))
+        assert history.memory_size <= MEMORY_LIMIT
+
+    assert history.memory_size == sum(turn.size for turn in history if not turn.is_spilled)
+
+
+def test_replace_starts_a_new_history():
+    history: TurnHistory = TurnHistory(memory_limit=MEMORY_LIMIT)
+    history.extend(contents=[make_content(index=index) for index in range(100)])
+    old_turn: Turn = history[0]
+
+    history.replace(contents=[{'role': 'user', 'parts': ['Hello']}])
+
+    assert len(history) == 1
+    assert history[0].text == 'Hello'
+    # a snapshot of the old history can still be read.
+    assert old_turn.text == make_content(index=0)['parts'][0]
+
+
+def test_memory_stays_flat_in_a_long_session():
+    history: TurnHistory = TurnHistory(memory_limit=MEMORY_LIMIT)
+    contents: List[Dict] = [make_content(index=index) for index in range(2000)]
+
+    tracemalloc.start()
+    try:
+        history.extend(contents=contents[:500])
+        gc.collect()
+        memory_before: int = tracemalloc.get_traced_memory()[0]
+
+        for content in contents[500:]:
+            history.append(content=content)
+        gc.collect()
+        memory_after: int = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    # 1500 more turns of 4 KB each, only their records are kept.
+    assert memory_after - memory_before < 1500 * TURN_RECORD_SIZE
+    assert memory_after < MEMORY_LIMIT + 2000 * TURN_RECORD_SIZE + 64 * 1024
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import os
+import subprocess
+import sys
+
+GEMINAL_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geminal')
+CHECK_INPUT: str = 'from components.utils import has_piped_input; print(has_piped_input())'
+
+
+def check_input(stdin) -> str:
+    return subprocess.run(
+        [sys.executable, '-c', CHECK_INPUT], stdin=stdin, stdout=subprocess.PIPE, cwd=GEMINAL_DIR, check=True, text=True
+    ).stdout.strip()
+
+
+def test_slow_pipe_is_an_input():
+    # the producer writes nothing for a while, like a slow command.
+    producer: subprocess.Popen = subprocess.Popen(
+        [sys.executable, '-c', 'import time; time.sleep(1); print("late")'], stdout=subprocess.PIPE
+    )
+    try:
+        assert check_input(stdin=producer.stdout) == 'True'
+    finally:
+        producer.stdout.close()
+        producer.wait()
+
+
+def test_redirected_file_is_an_input(tmp_path):
+    path: str = os.path.join(tmp_path, 'input.txt')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('some input\n')
+
+    with open(path, 'rb') as file:
+        assert check_input(stdin=file) == 'True'
+
+
+def test_dev_null_is_not_an_input():
+    assert check_input(stdin=subprocess.DEVNULL) == 'False'
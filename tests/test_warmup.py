@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Author  : nhattdm
+GitHub  : https://github.com/nhattdm/
+
+
+MIT License
+
+Copyright (c) 2024 Tran Doan Minh Nhat (nhattdm)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import threading
+import time
+from threading import Thread
+from typing import List
+
+import pytest
+
+from components import warmup
+from components.warmup import ConnectionWarmer
+
+
+class FakeModel:
+    def __init__(self) -> None:
+        self.ping_count: int = 0
+
+    def count_tokens(self, contents: str) -> int:
+        self.ping_count += 1
+        return 1
+
+
+@pytest.fixture
+def model(monkeypatch) -> FakeModel:
+    fake_model: FakeModel = FakeModel()
+    monkeypatch.setattr(warmup, 'get_model', lambda: fake_model)
+    return fake_model
+
+
+def keep_alive_threads() -> List[Thread]:
+    return [thread for thread in threading.enumerate() if thread.name == 'geminal-keep-alive']
+
+
+def wait_for_no_keep_alive_thread() -> None:
+    deadline: float = time.monotonic() + 5
+    while len(keep_alive_threads()) != 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_start_pings_once_and_stop_ends_the_thread(model):
+    warmer: ConnectionWarmer = ConnectionWarmer(interval=60)
+    warmer.start()
+    warmer.start()
+    deadline: float = time.monotonic() + 5
+    while model.ping_count == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(keep_alive_threads()) == 1
+    assert model.ping_count == 1 and warmer.is_warm()
+
+    warmer.stop()
+    wait_for_no_keep_alive_thread()
+    assert keep_alive_threads() == [] and not warmer.is_running()
+
+
+def test_concurrent_starts_and_stops_leave_no_thread_behind(model):
+    warmer: ConnectionWarmer = ConnectionWarmer(interval=60)
+
+    def toggle() -> None:
+        for _ in range(200):
+            warmer.start()
+            warmer.stop()
+
+    threads: List[Thread] = [Thread(target=toggle) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not warmer.is_running()
+    wait_for_no_keep_alive_thread()
+    assert keep_alive_threads() == []